@@ -0,0 +1,13 @@
+"""
+Общие настройки модульных тестов: каталог backend в пути импорта, хранилище в памяти
+и отдельный каталог общего кеша, чтобы тесты не обращались к сети и не трогали рабочий кеш
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("SHARED_CACHE_DIR", tempfile.mkdtemp(prefix="pricemanager-test-cache-"))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Модульные тесты нормализации артикулов и индекса артикулов (app.services.article_index).
+Запуск: python -m pytest api/test_article_index.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Добавляем каталог backend в путь для импорта приложения
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.models.file import ArticleNormalization
+from app.services.article_index import ArticleIndex, normalize_articles
+
+def keys(articles, rules=None):
+    return normalize_articles(pd.Series(articles, dtype=object), rules).tolist()
+
+def test_normalize_default_rules():
+    """По умолчанию: без регистра, разделителей, ведущих нулей и дробной части pandas"""
+    assert keys(["ab-12", "AB 12", "Ab/12", "ab_12"]) == ["AB12"] * 4
+    assert keys(["00123", "123", "123.0", 123.0]) == ["123"] * 4
+    assert keys(["0", "000", "0.0"]) == ["0"] * 3
+    # Убирается только нулевая дробная часть
+    assert keys(["12.50", "12.0"]) == ["12.50", "12"]
+
+def test_normalize_empty_articles():
+    """Пустые артикулы ключа не получают"""
+    assert all(pd.isna(key) for key in keys([None, float("nan"), "", "  ", " - "]))
+
+def test_normalize_custom_rules():
+    """Отключенные правила оставляют артикул как есть (кроме обрезки пробелов по краям)"""
+    rules = ArticleNormalization(ignore_case=False, separators="", strip_leading_zeros=False, strip_float_suffix=False)
+    assert keys([" ab-12 ", "007", "1.0"], rules) == ["ab-12", "007", "1.0"]
+
+def test_index_lookup_articles():
+    """Поиск по исходным артикулам другого файла нормализует их правилами индекса"""
+    index = ArticleIndex(pd.Series(["AB-12", "00123", None]))
+    assert len(index) == 2
+    assert index.empty_count == 1
+    assert index.lookup_articles(pd.Series(["ab12", "123", "X", None], dtype=object)).tolist() == [0, 1, -1, -1]
+
+# Артикул A повторяется в строках 0, 2 и 4; у C цена не указана
+STORE_ARTICLES = ["A", "B", "a", "C", "A"]
+STORE_PRICES = np.array([10.0, 5.0, 30.0, np.nan, 20.0])
+PROBE_KEYS = pd.Series(["A", "C", "X", "B"], dtype=object)
+
+def join(policy, prices=STORE_PRICES):
+    index = ArticleIndex(pd.Series(STORE_ARTICLES), prices=prices, policy=policy)
+    probe_rows, build_rows, group_prices = index.join(PROBE_KEYS)
+    return probe_rows.tolist(), build_rows.tolist(), group_prices
+
+@pytest.mark.parametrize("policy, expected_rows", [
+    ("last", [4, 3, 1]),
+    ("first", [0, 3, 1]),
+    ("min", [0, 3, 1]),
+    ("max", [2, 3, 1]),
+])
+def test_join_single_row_policies(policy, expected_rows):
+    """Повторяющийся артикул представлен одной строкой, выбранной по политике"""
+    probe_rows, build_rows, group_prices = join(policy)
+    assert probe_rows == [0, 1, 3]
+    assert build_rows == expected_rows
+    assert group_prices is None
+
+def test_join_mean_policy():
+    """Политика mean: первая строка группы и средняя по известным ценам группы"""
+    probe_rows, build_rows, group_prices = join("mean")
+    assert probe_rows == [0, 1, 3]
+    assert build_rows == [0, 3, 1]
+    assert group_prices[0] == pytest.approx(20.0)
+    assert np.isnan(group_prices[1])
+    assert group_prices[2] == pytest.approx(5.0)
+
+def test_join_all_policy():
+    """Политика all: ключ повторяется для каждой строки группы в порядке файла"""
+    probe_rows, build_rows, group_prices = join("all")
+    assert probe_rows == [0, 0, 0, 1, 3]
+    assert build_rows == [0, 2, 4, 3, 1]
+    assert group_prices is None
+
+def test_min_policy_skips_missing_prices():
+    """Строки без цены выбираются последними"""
+    index = ArticleIndex(pd.Series(["A", "A", "A"]), prices=np.array([np.nan, 7.0, 9.0]), policy="min")
+    assert index.positions.tolist() == [1]
+
+def test_duplicate_statistics():
+    """Счетчики повторов: лишние строки и артикулы с повторами"""
+    index = ArticleIndex(pd.Series(STORE_ARTICLES))
+    assert len(index) == 3
+    assert index.duplicate_count == 2
+    assert index.duplicate_keys == 1
+
+def test_invalid_policy():
+    """Неизвестная политика и политика по цене без цен — ошибка"""
+    with pytest.raises(ValueError):
+        ArticleIndex(pd.Series(STORE_ARTICLES), policy="median")
+    with pytest.raises(ValueError):
+        ArticleIndex(pd.Series(STORE_ARTICLES), policy="min")
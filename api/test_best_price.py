@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Тесты сравнения лучших цен нескольких поставщиков с магазином (/api/v1/comparison/best-price):
+агрегация min и median, выбор поставщика при равных предложениях.
+Запуск: python -m pytest api/test_best_price.py
+"""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+client = TestClient(app)
+
+MAPPING = {"article_column": "Артикул", "price_column": "Цена", "name_column": "Наименование"}
+
+def upload(rows, file_type, filename):
+    content = "Артикул;Наименование;Цена\n" + "".join(f"{article};Товар {article};{price}\n" for article, price in rows)
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": (filename, content.encode("utf-8"), "text/csv")},
+        data={"file_type": file_type}
+    )
+    assert response.status_code == 200, response.text
+    return {**response.json(), "column_mapping": MAPPING}
+
+def best_prices(suppliers, store, **options):
+    response = client.post(
+        "/api/v1/comparison/best-price",
+        json={"supplier_files": suppliers, "store_file": store, "best_price_options": options}
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    return result, {row["article"]: row for row in result["best_prices"]}
+
+def test_min_price_and_attribution():
+    """Лучшая цена — минимальная, с поставщиком и статистикой предложений"""
+    first = upload([("A1", 100), ("A2", 200)], "supplier", "first.csv")
+    second = upload([("A1", 90), ("A3", 300)], "supplier", "second.csv")
+    store = upload([("A1", 120), ("A2", 200)], "store", "store.csv")
+
+    result, rows = best_prices([first, second], store)
+
+    assert rows["A1"]["price"] == 90
+    assert rows["A1"]["supplier"] == "second.csv"
+    assert (rows["A1"]["offers"], rows["A1"]["min_price"], rows["A1"]["max_price"]) == (2, 90, 100)
+    assert rows["A2"]["supplier"] == "first.csv"
+    assert rows["A3"]["offers"] == 1
+
+    matches = {row["article"]: row for row in result["comparison"]["matches"]}
+    assert matches["A1"]["supplier_price"] == 90
+    assert matches["A1"]["best_supplier"] == "second.csv"
+    assert [row["article"] for row in result["comparison"]["missing_in_store"]] == ["A3"]
+
+def test_equal_prices_use_tie_breaker():
+    """Равные цены: поставщик выбирается по порядку файлов в запросе"""
+    first = upload([("T1", 150)], "supplier", "tie_first.csv")
+    second = upload([("T1", 150)], "supplier", "tie_second.csv")
+    store = upload([("T1", 160)], "store", "tie_store.csv")
+
+    _, rows = best_prices([first, second], store)
+    assert rows["T1"]["supplier"] == "tie_first.csv"
+
+    _, rows = best_prices([first, second], store, tie_breaker="last")
+    assert rows["T1"]["supplier"] == "tie_second.csv"
+    assert rows["T1"]["price"] == 150
+
+def test_median_picks_closest_offer():
+    """Медиана: цена артикула — медиана, поставщик — с ближайшим к ней предложением"""
+    suppliers = [
+        upload([("M1", 100), ("M2", 100)], "supplier", "median_a.csv"),
+        upload([("M1", 210), ("M2", 200)], "supplier", "median_b.csv"),
+        upload([("M1", 400)], "supplier", "median_c.csv"),
+    ]
+    store = upload([("M1", 200), ("M2", 150)], "store", "median_store.csv")
+
+    _, rows = best_prices(suppliers, store, aggregate="median")
+    assert rows["M1"]["price"] == 210
+    assert rows["M1"]["supplier"] == "median_b.csv"
+
+    # Два предложения на равном расстоянии от медианы 150
+    assert rows["M2"]["price"] == 150
+    assert rows["M2"]["supplier"] == "median_a.csv"
+    _, rows = best_prices(suppliers, store, aggregate="median", tie_breaker="last")
+    assert rows["M2"]["supplier"] == "median_b.csv"
+
+def test_non_numeric_offer_ignored():
+    """Предложение с нечисловой ценой не участвует в выборе"""
+    first = upload([("N1", "нет")], "supplier", "text_price.csv")
+    second = upload([("N1", 500)], "supplier", "number_price.csv")
+    store = upload([("N1", 400)], "store", "number_store.csv")
+
+    _, rows = best_prices([first, second], store)
+    assert rows["N1"]["supplier"] == "number_price.csv"
+    assert rows["N1"]["offers"] == 1
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Модульные тесты классификации изменений цен (app.services.change_rules).
+Запуск: python -m pytest api/test_change_rules.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Добавляем каталог backend в путь для импорта приложения
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.models.file import ChangeRule
+from app.services.change_rules import (
+    UNCHANGED_LABEL, build_change_rules, classify_changes, count_changes
+)
+
+def make_changes(n=5000, seed=0):
+    """Цены двух версий: пропуски, нули, равные и случайные цены"""
+    rng = np.random.default_rng(seed)
+    choices = np.array([np.nan, 0.0, 100.0, 105.0, 150.0, 50.0])
+    original = np.where(rng.random(n) < 0.5, rng.choice(choices, n), rng.uniform(0, 200, n).round(2))
+    new = np.where(rng.random(n) < 0.5, rng.choice(choices, n), rng.uniform(0, 200, n).round(2))
+    df = pd.DataFrame({"price_original": original, "price_new": new})
+    df["price_diff"] = df["price_new"] - df["price_original"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["price_diff_percent"] = df["price_diff"] / df["price_original"] * 100
+    return df
+
+def classify_with_masks(df, threshold):
+    """Прежняя цепочка масок из compare_files (эталон для стандартных правил)"""
+    change_type = pd.Series(UNCHANGED_LABEL, index=df.index)
+    significant = abs(df["price_diff_percent"]) >= threshold
+    mask_new = df["price_original"].isna() | ((df["price_original"] == 0) & (df["price_new"] > 0))
+    change_type[mask_new] = "новый"
+    mask_deleted = df["price_new"].isna() | ((df["price_new"] == 0) & (df["price_original"] > 0))
+    change_type[mask_deleted] = "удален"
+    change_type[(df["price_diff"] > 0) & significant & ~mask_new & ~mask_deleted] = "повышение"
+    change_type[(df["price_diff"] < 0) & significant & ~mask_new & ~mask_deleted] = "понижение"
+    return change_type
+
+def classify(df, threshold, rules=None):
+    return classify_changes(
+        df["price_original"], df["price_new"], df["price_diff"], df["price_diff_percent"], threshold, rules
+    )
+
+@pytest.mark.parametrize("threshold", [0.0, 10.0, 50.0])
+def test_default_rules_match_mask_chain(threshold):
+    """Стандартная таблица правил дает те же метки, что и прежняя цепочка масок"""
+    df = make_changes()
+    expected = classify_with_masks(df, threshold)
+    result = classify(df, threshold)
+    assert list(result.astype(str)) == list(expected)
+    counts = count_changes(result)
+    assert {label: count for label, count in counts.items() if count} == expected.value_counts().to_dict()
+
+def test_custom_rules_checked_first():
+    """Пользовательские правила проверяются раньше стандартных, метки правил — категории"""
+    df = pd.DataFrame({
+        "price_original": [100.0, 100.0, 1000.0, np.nan, 100.0],
+        "price_new": [200.0, 103.0, 1200.0, 50.0, 100.0],
+    })
+    df["price_diff"] = df["price_new"] - df["price_original"]
+    df["price_diff_percent"] = df["price_diff"] / df["price_original"] * 100
+
+    rules = build_change_rules([
+        ChangeRule(label="дорогой товар", status="existing", min_price=1000),
+        ChangeRule(label="небольшое повышение", direction="increase", max_percent=5),
+    ])
+    result = classify(df, 10.0, rules)
+    assert list(result.astype(str)) == ["повышение", "небольшое повышение", "дорогой товар", "новый", UNCHANGED_LABEL]
+    assert list(result.categories) == [
+        "дорогой товар", "небольшое повышение", "удален", "новый", "повышение", "понижение", UNCHANGED_LABEL
+    ]
+
+def test_shared_label_is_one_category():
+    """Одинаковые метки разных правил объединяются в одну категорию"""
+    df = make_changes(n=200, seed=1)
+    rules = [
+        ChangeRule(label="изменение", direction="increase"),
+        ChangeRule(label="изменение", direction="decrease"),
+    ]
+    result = classify(df, 10.0, rules)
+    assert list(result.categories) == ["изменение", UNCHANGED_LABEL]
+    changed = (df["price_diff"] > 0) | (df["price_diff"] < 0)
+    assert (np.asarray(result == "изменение") == changed.to_numpy()).all()
+
+def test_empty_rules():
+    """Без правил все строки — без изменений"""
+    df = make_changes(n=10)
+    result = classify(df, 10.0, [])
+    assert list(result.astype(str)) == [UNCHANGED_LABEL] * 10
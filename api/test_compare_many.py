@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Тесты сравнения одного файла поставщика с несколькими файлами магазинов (/api/v1/comparison/compare-many).
+Запуск: python -m pytest api/test_compare_many.py
+"""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import comparison_service
+
+client = TestClient(app)
+
+MAPPING = {"article_column": "Артикул", "price_column": "Цена", "name_column": "Наименование"}
+
+def upload(rows, file_type, filename):
+    content = "Артикул;Наименование;Цена\n" + "".join(f"{article};Товар {article};{price}\n" for article, price in rows)
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": (filename, content.encode("utf-8"), "text/csv")},
+        data={"file_type": file_type}
+    )
+    assert response.status_code == 200, response.text
+    return {**response.json(), "column_mapping": MAPPING}
+
+def compare_many(supplier, stores):
+    response = client.post("/api/v1/comparison/compare-many", json={"supplier_file": supplier, "store_files": stores})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_results_per_store_and_summary():
+    """Результат по каждому магазину и общая сводка"""
+    supplier = upload([("A1", 100), ("A2", 200), ("A3", 300)], "supplier", "supplier.csv")
+    first = upload([("A1", 110), ("A2", 200)], "store", "store1.csv")
+    second = upload([("A3", 250), ("B9", 10)], "store", "store2.csv")
+
+    result = compare_many(supplier, [first, second])
+
+    assert [store["original_filename"] for store in result["stores"]] == ["store1.csv", "store2.csv"]
+    assert all(store["status"] == "success" for store in result["stores"])
+    first_result, second_result = (store["result"] for store in result["stores"])
+    assert sorted(row["article"] for row in first_result["matches"]) == ["A1", "A2"]
+    assert [row["article"] for row in first_result["missing_in_store"]] == ["A3"]
+    assert [row["article"] for row in second_result["matches"]] == ["A3"]
+    assert [row["article"] for row in second_result["missing_in_supplier"]] == ["B9"]
+
+    summary = result["summary"]
+    assert summary["stores_total"] == 2
+    assert summary["stores_succeeded"] == 2
+    assert summary["matches"] == 3
+    assert summary["supplier_articles_matched"] == 3
+    assert summary["supplier_articles_missing_everywhere"] == 0
+
+def test_supplier_file_read_once(monkeypatch):
+    """Файл поставщика читается один раз на все магазины"""
+    supplier = upload([("A1", 501), ("A2", 502)], "supplier", "supplier.csv")
+    stores = [upload([("A1", 501 + i)], "store", f"store{i}.csv") for i in range(3)]
+    read = []
+    original_read_file = comparison_service.read_file
+
+    def counting_read_file(content, *args, **kwargs):
+        read.append(len(content))
+        return original_read_file(content, *args, **kwargs)
+
+    monkeypatch.setattr(comparison_service, "read_file", counting_read_file)
+    result = compare_many(supplier, stores)
+
+    assert result["summary"]["stores_succeeded"] == 3
+    assert len(read) == 4
+
+def test_failed_store_does_not_break_others():
+    """Ошибка одного магазина попадает в его результат, остальные сравниваются"""
+    supplier = upload([("A1", 100)], "supplier", "supplier.csv")
+    good = upload([("A1", 90)], "store", "good.csv")
+    missing = {**good, "stored_filename": "file_0_missing.csv", "original_filename": "missing.csv"}
+
+    result = compare_many(supplier, [good, missing])
+
+    assert [store["status"] for store in result["stores"]] == ["success", "error"]
+    assert result["stores"][1]["error"]
+    assert result["summary"]["stores_failed"] == 1
+    assert result["summary"]["matches"] == 1
+
+def test_empty_store_list():
+    """Пустой список магазинов — 400"""
+    supplier = upload([("A1", 100)], "supplier", "supplier.csv")
+    response = client.post("/api/v1/comparison/compare-many", json={"supplier_file": supplier, "store_files": []})
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Тесты отдачи файлов через /api/v1/files/download (кеши, Range, ETag и Last-Modified).
+Запуск: python -m pytest api/test_download.py
+"""
+
+import os
+import uuid
+from email.utils import formatdate
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.endpoints import files
+from app.services.file_service import get_file_buffer
+from app.services.shared_cache import get_shared_entry
+from app.services.storage import get_storage
+
+client = TestClient(app)
+
+CONTENT = "Артикул;Наименование;Цена\nA1;Товар 1;100\nA2;Товар 2;200\n".encode("utf-8")
+# Время изменения объекта в хранилище заметно раньше записи в кеш
+STORED_AT = 1_700_000_000.0
+
+@pytest.fixture
+def stored_file():
+    filename = f"download_{uuid.uuid4().hex}.csv"
+    storage = get_storage()
+    storage.put(filename, CONTENT)
+    storage._objects[filename]["last_modified"] = STORED_AT
+    return filename
+
+def test_shared_cache_uses_object_validators(stored_file):
+    """Из общего кеша файл отдается с ETag и Last-Modified объекта в хранилище"""
+    get_file_buffer(stored_file)
+    assert get_shared_entry(stored_file)
+
+    response = client.get(f"/api/v1/files/download/{stored_file}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == get_storage().head(stored_file)["etag"]
+    assert response.headers["last-modified"] == formatdate(STORED_AT, usegmt=True)
+
+def test_range_from_shared_cache(stored_file):
+    """Диапазон байтов из общего кеша"""
+    get_file_buffer(stored_file)
+    response = client.get(f"/api/v1/files/download/{stored_file}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+    assert response.headers["content-range"] == f"bytes 0-9/{len(CONTENT)}"
+
+def test_evicted_data_file(stored_file):
+    """Файл данных общего кеша вытеснен — файл отдается из хранилища, а не ошибкой"""
+    get_file_buffer(stored_file)
+    os.remove(get_shared_entry(stored_file)["data_path"])
+
+    response = client.get(f"/api/v1/files/download/{stored_file}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+def test_local_file_removed_before_open(stored_file, monkeypatch, caplog):
+    """Локальный файл пропал между поиском и открытием — повторный поиск без диска"""
+    monkeypatch.setattr(files.LocalStorage, "local_path", lambda self, key: f"/nonexistent/{key}")
+
+    response = client.get(f"/api/v1/files/download/{stored_file}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert "пропал с диска" in caplog.text
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Модульные тесты разбора заголовка Range (app.utils.http_range).
+Запуск: python -m pytest api/test_http_range.py
+"""
+
+import os
+import sys
+
+import pytest
+
+# Добавляем каталог backend в путь для импорта приложения
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.utils.http_range import RangeNotSatisfiable, parse_range_header
+
+SIZE = 1000
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, SIZE - 1)),
+    ("bytes=-100", (SIZE - 100, SIZE - 1)),
+    ("bytes=-5000", (0, SIZE - 1)),
+    ("bytes=900-5000", (900, SIZE - 1)),
+    (" bytes=10-10 ", (10, 10)),
+    ("BYTES=0-0", (0, 0)),
+])
+def test_single_range(header, expected):
+    """Одиночный диапазон: обычный, открытый, суффиксный и выходящий за конец файла"""
+    assert parse_range_header(header, SIZE) == expected
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "items=0-10",
+    "bytes=0-10,20-30",
+    "bytes=abc-10",
+    "bytes=10-xyz",
+])
+def test_range_ignored(header):
+    """Без диапазона, с другими единицами, несколькими диапазонами или мусором отдается весь файл"""
+    assert parse_range_header(header, SIZE) is None
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=5000-6000",
+    "bytes=50-10",
+    "bytes=-0",
+])
+def test_range_not_satisfiable(header):
+    """Диапазон, не пересекающийся с файлом, — ошибка 416"""
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, SIZE)
+
+def test_empty_file():
+    """У пустого файла нет ни одного допустимого диапазона"""
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header("bytes=0-", 0)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Тесты фоновых задач сравнения (app.services.job_service): запись состояния в хранилище
+и его срок хранения.
+Запуск: python -m pytest api/test_jobs.py
+"""
+
+import asyncio
+import json
+import time
+
+from app.services import job_service
+from app.services.file_service import cleanup_old_files
+from app.services.job_service import get_job_status, publish_job, submit_job
+from app.services.storage import StorageNotFoundError, get_storage
+
+class Result:
+    result_id = "result-1"
+    rows = list(range(1000))
+
+def wait_for_record(job_id, status="done", timeout=5.0):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            record = json.loads(get_storage().get(job_service._job_key(job_id)))
+            if record["status"] == status:
+                return record
+        except StorageNotFoundError:
+            pass
+        time.sleep(0.01)
+    raise AssertionError(f"Задача {job_id} не записана со статусом {status}")
+
+def run_job():
+    job_id = submit_job(
+        "compare",
+        lambda deadline: Result(),
+        encode=lambda result: {"rows": len(result.rows)},
+        reference=lambda result: {"result_id": result.result_id}
+    )
+    publish_job(job_id)
+    return job_id
+
+def test_record_keeps_reference_not_result():
+    """В хранилище — состояние задачи и result_id, но не сам результат"""
+    job_id = run_job()
+    record = wait_for_record(job_id)
+    assert record["result_id"] == "result-1"
+    assert "result" not in record
+
+def test_status_from_other_instance():
+    """Экземпляр без задачи в памяти отдает состояние и ссылку на результат из хранилища"""
+    job_id = run_job()
+    wait_for_record(job_id)
+
+    local = get_job_status(job_id, include_result=True)
+    assert local["result"] == {"rows": 1000}
+    assert local["result_id"] == "result-1"
+
+    with job_service._jobs_lock:
+        job_service.jobs.pop(job_id)
+    remote = get_job_status(job_id, include_result=True)
+    assert remote["status"] == "done"
+    assert remote["result_id"] == "result-1"
+    assert "result" not in remote
+
+def test_cleanup_expires_job_records():
+    """Записи задач удаляются через JOB_TTL, файлы пользователей того же возраста остаются"""
+    storage = get_storage()
+    job_id = run_job()
+    wait_for_record(job_id)
+    job_key = job_service._job_key(job_id)
+    user_key = "cleanup_user_file.csv"
+    storage.put(user_key, b"a;b\n")
+    expired = time.time() - job_service.JOB_TTL - 60
+    storage._objects[job_key]["last_modified"] = expired
+    storage._objects[user_key]["last_modified"] = expired
+
+    asyncio.run(cleanup_old_files())
+
+    assert storage.head(job_key) is None
+    assert storage.head(user_key) is not None
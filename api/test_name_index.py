@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Модульные тесты поиска кандидатов по наименованию (app.services.name_index).
+Запуск: python -m pytest api/test_name_index.py
+"""
+
+import os
+import sys
+
+import pytest
+
+# Добавляем каталог backend в путь для импорта приложения
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.services.name_index import attach_name_candidates
+
+OTHERS = [
+    {"article": "S1", "store_name": "Молоко пастеризованное 3.2% 1 л", "store_price": 90.0},
+    {"article": "S2", "store_name": "Хлеб бородинский нарезка", "store_price": 55.0},
+]
+
+def make_items(count):
+    return [{"article": f"A{i}", "supplier_name": "Молоко пастеризованное 3,2% 1л"} for i in range(count)]
+
+def attach(items, deadline=None):
+    return attach_name_candidates(
+        items, OTHERS, name_field="supplier_name", other_name_field="store_name",
+        other_price_field="store_price", limit=3, min_similarity=0.5, deadline=deadline
+    )
+
+def test_candidates_attached():
+    """Похожее наименование находится, непохожее — нет"""
+    items = make_items(1)
+    assert attach(items) == 1
+    assert [candidate["article"] for candidate in items[0]["candidates"]] == ["S1"]
+    assert items[0]["candidates"][0]["price"] == 90.0
+
+def test_exhausted_deadline_raises():
+    """При исчерпанном бюджете поиск не возвращает неполный результат"""
+    items = make_items(2500)
+    with pytest.raises(DeadlineExceeded) as error:
+        attach(items, Deadline(0))
+    assert error.value.stage == "fuzzy"
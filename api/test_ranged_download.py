@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Модульные тесты загрузки объекта из Supabase Storage блоками с докачкой (SupabaseStorage._download_ranged).
+HTTP-ответы хранилища подменяются через httpx.MockTransport.
+Запуск: python -m pytest api/test_ranged_download.py
+"""
+
+import time
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import storage as storage_module
+from app.services.storage import SupabaseStorage
+
+CONTENT = bytes(range(256)) * 4
+CHUNK_SIZE = 100
+URL = "http://storage.test/object/bucket/file.csv"
+
+class Writer:
+    """Приемник блоков с интерфейсом SharedCacheWriter"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.resets = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def write(self, chunk: bytes) -> None:
+        self.data += chunk
+
+    def reset(self) -> None:
+        self.data = bytearray()
+        self.resets += 1
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_CHUNK_SIZE", CHUNK_SIZE)
+    # Паузы между повторами не нужны: бюджет повторов проверяется по времени до паузы
+    monkeypatch.setattr(storage_module.time, "sleep", lambda seconds: None)
+
+def ranged_reply(request, content=CONTENT, etag='"v1"'):
+    """Ответ сервера, который поддерживает Range"""
+    start, _, end = request.headers["Range"][6:].partition("-")
+    start, end = int(start), min(int(end), len(content) - 1)
+    if start >= len(content):
+        return httpx.Response(416, headers={"Content-Range": f"bytes */{len(content)}"})
+    return httpx.Response(
+        206,
+        content=content[start:end + 1],
+        headers={"Content-Range": f"bytes {start}-{end}/{len(content)}", "ETag": etag}
+    )
+
+def download(handler, budget=5.0):
+    storage = SupabaseStorage(url="http://storage.test", bucket="bucket", folder="")
+    storage._http_client = httpx.Client(transport=httpx.MockTransport(handler))
+    writer, state = Writer(), {}
+    completed = storage._download_ranged("file.csv", URL, {}, writer, state, time.monotonic() + budget)
+    return completed, writer, state
+
+def test_download_in_chunks():
+    """Объект собирается из блоков, каждый следующий блок — с конца записанных данных"""
+    ranges = []
+
+    def handler(request):
+        ranges.append((request.headers["Range"], request.headers.get("If-Range")))
+        return ranged_reply(request)
+
+    completed, writer, state = download(handler)
+    assert completed
+    assert bytes(writer.data) == CONTENT
+    assert state["total"] == len(CONTENT)
+    assert ranges[0] == ("bytes=0-99", None)
+    assert ranges[1] == ("bytes=100-199", '"v1"')
+    assert len(ranges) == -(-len(CONTENT) // CHUNK_SIZE)
+
+def test_resume_after_connection_error():
+    """После обрыва соединения загрузка продолжается с того же места"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["Range"])
+        if len(calls) == 3:
+            raise httpx.ReadError("обрыв соединения")
+        return ranged_reply(request)
+
+    completed, writer, _ = download(handler)
+    assert completed
+    assert bytes(writer.data) == CONTENT
+    assert calls[2] == calls[3] == "bytes=200-299"
+    assert writer.resets == 0
+
+def test_206_without_content_range_falls_back_to_full_get():
+    """206 без Content-Range (срезан прокси) — объект запрашивается обычным GET целиком"""
+    requests = []
+
+    def handler(request):
+        requests.append(request.headers.get("Range"))
+        if "Range" in request.headers:
+            return httpx.Response(206, content=CONTENT[:CHUNK_SIZE])
+        return httpx.Response(200, content=CONTENT, headers={"ETag": '"v1"'})
+
+    completed, writer, state = download(handler)
+    assert completed
+    assert bytes(writer.data) == CONTENT
+    assert requests == ["bytes=0-99", None]
+    assert state["etag"] == '"v1"'
+
+def test_changed_object_restarts_download():
+    """Блок другой версии объекта (ETag изменился) — загрузка начинается заново"""
+    new_content = CONTENT[::-1]
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["Range"])
+        if len(calls) == 1:
+            return ranged_reply(request)
+        return ranged_reply(request, content=new_content, etag='"v2"')
+
+    completed, writer, state = download(handler)
+    assert completed
+    assert bytes(writer.data) == new_content
+    assert writer.resets == 1
+    assert state["etag"] == '"v2"'
+
+def test_416_at_end_completes():
+    """416 ровно на конце объекта означает, что все уже получено"""
+    content = CONTENT[:2 * CHUNK_SIZE]
+
+    def handler(request):
+        start = int(request.headers["Range"][6:].partition("-")[0])
+        if start >= len(content):
+            return httpx.Response(416, headers={"Content-Range": f"bytes */{len(content)}"})
+        # Размер объекта не сообщается: конец определяется только по 416
+        end = min(start + CHUNK_SIZE, len(content)) - 1
+        return httpx.Response(206, content=content[start:end + 1], headers={"Content-Range": f"bytes {start}-{end}/*"})
+
+    completed, writer, state = download(handler)
+    assert completed
+    assert bytes(writer.data) == content
+    assert state["total"] == len(content)
+
+def test_416_inside_object_gives_up_within_budget():
+    """Повторяющийся 416 не на конце объекта: запись сбрасывается, повторы ограничены бюджетом"""
+    def handler(request):
+        return httpx.Response(416, headers={"Content-Range": "bytes */5000"})
+
+    started = time.monotonic()
+    completed, writer, _ = download(handler, budget=0.5)
+    assert not completed
+    assert writer.size == 0
+    assert time.monotonic() - started < 2
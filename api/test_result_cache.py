@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Модульные тесты кеша результатов сравнения (app.services.result_cache).
+Запуск: python -m pytest api/test_result_cache.py
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+# Добавляем каталог backend в путь для импорта приложения
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services import result_cache
+from app.services.result_cache import clear_result_cache, get_or_compute_result, make_result_key
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_result_cache()
+    yield
+    clear_result_cache()
+
+def test_key_depends_on_all_parts():
+    """Ключ зависит от хешей файлов и параметров, но не от порядка ключей словарей"""
+    assert make_result_key("a", {"x": 1, "y": 2}) == make_result_key("a", {"y": 2, "x": 1})
+    assert make_result_key("a", {"x": 1}) != make_result_key("b", {"x": 1})
+    assert make_result_key("a", {"x": 1}) != make_result_key("a", {"x": 2})
+
+def test_hit_and_miss():
+    """Первый вызов вычисляет результат, повторный берет его из кеша"""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"rows": [1, 2, 3]}
+
+    first = get_or_compute_result("key", compute)
+    second = get_or_compute_result("key", compute)
+    assert second is first
+    assert len(calls) == 1
+    assert result_cache.result_cache["key"]["hits"] == 1
+
+    # Другой ключ — промах
+    get_or_compute_result("other", compute)
+    assert len(calls) == 2
+
+def test_concurrent_requests_share_one_computation():
+    """Одинаковые запросы во время вычисления ждут его, а не считают заново"""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(get_or_compute_result("key", compute)))
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(get_or_compute_result("key", compute)))
+    waiter.start()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert results == ["result", "result"]
+    assert len(calls) == 1
+    assert not result_cache._inflight
+
+def test_failure_releases_inflight():
+    """Ошибка вычисления не кешируется, ключ снимается с ожидания, следующий запрос считает заново"""
+    def fail():
+        raise ValueError("ошибка")
+
+    with pytest.raises(ValueError):
+        get_or_compute_result("key", fail)
+    assert not result_cache._inflight
+    assert "key" not in result_cache.result_cache
+
+    assert get_or_compute_result("key", lambda: "ok") == "ok"
+
+def test_size_failure_releases_inflight():
+    """Ошибка при оценке размера тоже снимает ключ с ожидания"""
+    def broken_size(result):
+        raise RuntimeError("размер")
+
+    with pytest.raises(RuntimeError):
+        get_or_compute_result("key", lambda: "result", size_of=broken_size)
+    assert not result_cache._inflight
+    assert "key" not in result_cache.result_cache
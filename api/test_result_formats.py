@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Тесты выбора формата результата сравнения по заголовку Accept (JSON, NDJSON, Arrow IPC, MessagePack).
+Запуск: python -m pytest api/test_result_formats.py
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import result_formats
+from app.services.result_formats import negotiate_result_format
+
+client = TestClient(app)
+
+MAPPING = {"article_column": "Артикул", "price_column": "Цена", "name_column": "Наименование"}
+
+def upload(content, file_type):
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": ("prices.csv", content.encode("utf-8"), "text/csv")},
+        data={"file_type": file_type}
+    )
+    assert response.status_code == 200, response.text
+    return {**response.json(), "column_mapping": MAPPING}
+
+@pytest.fixture(scope="module")
+def files():
+    supplier = upload("Артикул;Наименование;Цена\nF1;Товар 1;100\nF2;Товар 2;200\n", "supplier")
+    store = upload("Артикул;Наименование;Цена\nF1;Товар 1;90\nF3;Товар 3;50\n", "store")
+    return supplier, store
+
+def compare(files, accept):
+    supplier, store = files
+    return client.post(
+        "/api/v1/comparison/compare",
+        json={"supplier_file": supplier, "store_file": store},
+        headers={"Accept": accept}
+    )
+
+@pytest.fixture
+def missing_packages(monkeypatch):
+    """Пакеты бинарных форматов не установлены"""
+    monkeypatch.setattr(result_formats, "FORMAT_PACKAGES", {"arrow": "missing_pyarrow", "msgpack": "missing_msgpack"})
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "json"),
+    ("*/*", "json"),
+    ("application/json", "json"),
+    ("application/x-ndjson", "ndjson"),
+    ("application/msgpack;q=0.5, application/vnd.apache.arrow.stream", "arrow"),
+    ("application/vnd.apache.arrow.stream;q=0.2, application/x-msgpack;q=0.8", "msgpack"),
+    ("application/msgpack;q=0, application/json", "json"),
+    ("application/x-ndjson, application/msgpack", "ndjson"),
+])
+def test_negotiation(accept, expected):
+    """Формат — с наибольшим q, при равных — первый в заголовке; q=0 исключает тип"""
+    assert negotiate_result_format(accept) == expected
+
+def test_json_by_default(files):
+    """Без Accept — прежний ответ JSON"""
+    response = compare(files, "application/json")
+    assert response.status_code == 200
+    assert response.json()["matches_data"][0]["article"] == "F1"
+
+def test_ndjson_compare(files):
+    """/compare с Accept NDJSON отдает результат потоком"""
+    response = compare(files, "application/x-ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert '"F1"' in response.text
+
+@pytest.mark.parametrize("accept", ["application/vnd.apache.arrow.stream", "application/msgpack"])
+def test_unavailable_format_406(files, missing_packages, accept):
+    """Бинарный формат без установленного пакета — 406 с понятной причиной"""
+    response = compare(files, accept)
+    assert response.status_code == 406
+    assert "missing_" in response.json()["detail"]
+
+def test_unavailable_format_406_for_stored_result(files, missing_packages):
+    """406 и для сохраненного результата"""
+    result_id = compare(files, "application/json").json()["result_id"]
+    response = client.get(f"/api/v1/comparison/results/{result_id}/matches", headers={"Accept": "application/msgpack"})
+    assert response.status_code == 406
+
+def test_msgpack_result(files):
+    """MessagePack: разделы колонками"""
+    msgpack = pytest.importorskip("msgpack")
+    response = compare(files, "application/msgpack")
+    assert response.status_code == 200
+    payload = msgpack.unpackb(response.content)
+    assert payload["sections"]["matches"]["article"] == ["F1"]
+
+def test_arrow_result(files):
+    """Arrow IPC: одна таблица с колонкой section"""
+    pa = pytest.importorskip("pyarrow")
+    response = compare(files, "application/vnd.apache.arrow.stream")
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert "F1" in table.column("article").to_pylist()
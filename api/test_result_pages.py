@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Тесты постраничного просмотра и потоковой отдачи результата сравнения
+(/api/v1/comparison/results/..., NDJSON).
+Запуск: python -m pytest api/test_result_pages.py
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+client = TestClient(app)
+
+MAPPING = {"article_column": "Артикул", "price_column": "Цена", "name_column": "Наименование"}
+ROWS = 25
+
+def upload(rows, file_type):
+    content = "Артикул;Наименование;Цена\n" + "".join(f"{article};Товар {article};{price}\n" for article, price in rows)
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": ("prices.csv", content.encode("utf-8"), "text/csv")},
+        data={"file_type": file_type}
+    )
+    assert response.status_code == 200, response.text
+    return {**response.json(), "column_mapping": MAPPING}
+
+@pytest.fixture(scope="module")
+def compared():
+    """Сравнение: ROWS совпадений (цена магазина выше на i), 2 товара без пары с каждой стороны"""
+    supplier = upload([(f"P{i:03d}", 100) for i in range(ROWS)] + [("S1", 10), ("S2", 20)], "supplier")
+    store = upload([(f"P{i:03d}", 100 + i) for i in range(ROWS)] + [("X1", 30), ("X2", 40)], "store")
+    response = client.post(
+        "/api/v1/comparison/compare",
+        json={"supplier_file": supplier, "store_file": store, "page_size": 5}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+def test_compare_page_size(compared):
+    """С page_size в ответе /compare только первые строки разделов"""
+    assert len(compared["matches_data"]) == 5
+    assert compared["result_id"]
+
+def test_pages_cover_section(compared):
+    """Страницы по offset/limit без пропусков и повторов"""
+    url = f"/api/v1/comparison/results/{compared['result_id']}/matches"
+    articles = []
+    for offset in range(0, ROWS, 10):
+        page = client.get(url, params={"offset": offset, "limit": 10}).json()
+        assert page["total"] == ROWS
+        articles += [row["article"] for row in page["items"]]
+    assert sorted(articles) == [f"P{i:03d}" for i in range(ROWS)]
+    assert len(set(articles)) == ROWS
+
+def test_sort_and_filters(compared):
+    """Сортировка по колонке и фильтры по изменению цены и тексту"""
+    url = f"/api/v1/comparison/results/{compared['result_id']}/matches"
+    page = client.get(url, params={"sort_by": "store_price", "order": "desc", "limit": 3}).json()
+    assert [row["article"] for row in page["items"]] == ["P024", "P023", "P022"]
+
+    page = client.get(url, params={"change_type": "unchanged"}).json()
+    assert [row["article"] for row in page["items"]] == ["P000"]
+
+    page = client.get(url, params={"search": "p01"}).json()
+    assert page["total"] == 10
+
+def test_invalid_queries(compared):
+    """Неизвестный раздел — 404, неизвестная колонка сортировки — 400"""
+    base = f"/api/v1/comparison/results/{compared['result_id']}"
+    assert client.get(f"{base}/unknown").status_code == 404
+    assert client.get(f"{base}/matches", params={"sort_by": "nope"}).status_code == 400
+
+def test_result_stream(compared):
+    """Весь результат NDJSON: сводка, затем заголовок и строки каждого раздела"""
+    response = client.get(f"/api/v1/comparison/results/{compared['result_id']}/stream")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = read_ndjson(response)
+    assert lines[0]["sections"] == {"matches": ROWS, "missing_in_store": 2, "missing_in_supplier": 2}
+    headers = [line for line in lines if set(line) == {"section", "total"}]
+    assert [header["section"] for header in headers] == ["matches", "missing_in_store", "missing_in_supplier"]
+    assert len(lines) == 1 + len(headers) + ROWS + 4
+
+def test_section_stream_with_filters(compared):
+    """Раздел потоком NDJSON с теми же фильтрами, что и у страниц"""
+    response = client.get(
+        f"/api/v1/comparison/results/{compared['result_id']}/matches/stream",
+        params={"change_type": "decrease", "sort_by": "price_diff", "order": "desc"}
+    )
+    assert response.status_code == 200
+    assert response.headers["x-total-count"] == str(ROWS - 1)
+    rows = read_ndjson(response)
+    assert len(rows) == ROWS - 1
+    assert rows[0]["article"] == "P001"
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Тесты хранилища результатов сравнения (app.services.result_store): срок хранения
+и время результата при восстановлении по источнику.
+Запуск: python -m pytest api/test_result_store.py
+"""
+
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core.config import settings
+from app.models.file import ComparisonResult
+from app.services import result_store
+from app.services.result_cache import clear_result_cache
+from app.services.result_store import get_comparison_table, save_comparison_result
+from app.services.storage import get_storage
+
+client = TestClient(app)
+
+MAPPING = {"article_column": "Артикул", "price_column": "Цена", "name_column": "Наименование"}
+
+def make_result():
+    return ComparisonResult(
+        matches=[{"article": "A1", "supplier_price": 100.0, "store_price": 110.0}],
+        missing_in_store=[],
+        missing_in_supplier=[]
+    )
+
+def upload(content, file_type):
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": ("prices.csv", content.encode("utf-8"), "text/csv")},
+        data={"file_type": file_type}
+    )
+    assert response.status_code == 200, response.text
+    return {**response.json(), "column_mapping": MAPPING}
+
+def forget_in_process(result_id):
+    """Результата нет в памяти процесса, как в другом экземпляре приложения"""
+    with result_store._lock:
+        result_store.current_store_size -= result_store.comparison_tables.pop(result_id).size
+        del result_store.last_access[result_id]
+        result_store._saved_sources.discard(result_id)
+
+def test_memoized_result_not_expired():
+    """Результат, вычисленный давно (из кеша результатов), при сохранении не удаляется сразу"""
+    result = make_result()
+    save_comparison_result("old-result", result)
+    result._columnar.created_at = time.time() - settings.RESULT_STORE_TTL_SECONDS - 60
+    forget_in_process("old-result")
+
+    save_comparison_result("old-result", result)
+    assert get_comparison_table("old-result") is result._columnar
+
+def test_ttl_slides_on_access():
+    """Срок хранения отсчитывается от последнего обращения"""
+    result = make_result()
+    save_comparison_result("idle-result", result)
+    stale = time.time() - settings.RESULT_STORE_TTL_SECONDS + 30
+    result_store.last_access["idle-result"] = stale
+
+    assert get_comparison_table("idle-result") is not None
+    assert result_store.last_access["idle-result"] > stale
+
+    result_store.last_access["idle-result"] = time.time() - settings.RESULT_STORE_TTL_SECONDS - 1
+    assert get_comparison_table("idle-result") is None
+    assert "idle-result" not in result_store.last_access
+
+def test_restored_result_keeps_created_at():
+    """Восстановленный по источнику результат сохраняет время исходного сравнения"""
+    supplier = upload("Артикул;Наименование;Цена\nR1;Товар;100\nR2;Товар;200\n", "supplier")
+    store = upload("Артикул;Наименование;Цена\nR1;Товар;120\n", "store")
+    response = client.post("/api/v1/comparison/compare", json={"supplier_file": supplier, "store_file": store})
+    assert response.status_code == 200, response.text
+    result_id = response.json()["result_id"]
+
+    source_key = f"result_{result_id}.json"
+    created_at = json.loads(get_storage().get(source_key))["created_at"]
+    assert created_at == get_comparison_table(result_id).created_at
+
+    # Кеш результатов тоже пуст: результат вычисляется заново
+    forget_in_process(result_id)
+    clear_result_cache()
+
+    info = client.get(f"/api/v1/comparison/results/{result_id}")
+    assert info.status_code == 200, info.text
+    assert info.json()["created_at"] == created_at
+    assert json.loads(get_storage().get(source_key))["created_at"] == created_at
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Модульные тесты отпечатков строк для сравнения версий прайс-листа (app.services.row_fingerprints).
+Запуск: python -m pytest api/test_row_fingerprints.py
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+# Добавляем каталог backend в путь для импорта приложения
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services.row_fingerprints import RowFingerprints, diff_row_fingerprints
+
+def fingerprints(ids, prices):
+    df = pd.DataFrame({"id": pd.Series(ids, dtype=object), "price": prices})
+    return RowFingerprints(df["id"], df[["price"]])
+
+def test_diff_versions():
+    """Изменившиеся, новые и удаленные строки попадают в разницу, совпадающие — нет"""
+    # Товар 4 повторяется, у последней строки нет идентификатора — такие строки всегда в разнице
+    original = fingerprints(["1", "2", "3", "4", "4", None], [10.0, 20.0, 30.0, 40.0, 41.0, 50.0])
+    new = fingerprints(["2", "1", "3", "5", "4", "4"], [20.0, 11.0, 30.0, 60.0, 40.0, 41.0])
+
+    assert original.unstable_rows.tolist() == [3, 4, 5]
+    diff = diff_row_fingerprints(original, new)
+    assert diff["unchanged"] == 2
+    assert diff["original_rows"].tolist() == [0, 3, 4, 5]
+    assert diff["new_rows"].tolist() == [1, 3, 4, 5]
+
+def test_diff_removed_rows():
+    """Строки, которых нет в новой версии, остаются в разнице исходной"""
+    original = fingerprints(["1", "2"], [10.0, 20.0])
+    new = fingerprints(["2"], [20.0])
+
+    diff = diff_row_fingerprints(original, new)
+    assert diff["unchanged"] == 1
+    assert diff["original_rows"].tolist() == [0]
+    assert diff["new_rows"].tolist() == []
+
+def test_diff_with_empty_original():
+    """Пустая исходная версия: все строки новой версии — новые"""
+    original = fingerprints([], [])
+    new = fingerprints(["1", "2"], [10.0, 20.0])
+
+    diff = diff_row_fingerprints(original, new)
+    assert diff["unchanged"] == 0
+    assert diff["original_rows"].tolist() == []
+    assert diff["new_rows"].tolist() == [0, 1]
+
+def test_compare_files_includes_unchanged_by_default():
+    """По умолчанию товары без изменений остаются в файле результатов; статистика одинакова в обоих режимах"""
+    import uuid
+
+    from app.services.comparison import compare_files
+    from app.services.storage import get_storage
+
+    storage = get_storage()
+    original_name, new_name = f"v1_{uuid.uuid4().hex}.csv", f"v2_{uuid.uuid4().hex}.csv"
+    storage.put(original_name, "id;price\n1;10\n2;20\n3;30\n".encode("utf-8"))
+    storage.put(new_name, "id;price\n1;10\n2;25\n4;40\n".encode("utf-8"))
+
+    full = compare_files(original_name, new_name, "id", "price")
+    # Имя файла результатов зависит от секунды сравнения: читаем его до второго сравнения
+    rows = storage.get(full["result_file"]["filename"]).decode("utf-8").strip().splitlines()
+    assert len(rows) == 1 + 4
+    diff_only = compare_files(original_name, new_name, "id", "price", include_unchanged=False)
+
+    assert full["status"] == diff_only["status"] == "success"
+    assert full["statistics"]["unchanged_skipped"] == 0
+    assert diff_only["statistics"]["unchanged_skipped"] == 1
+    for key in ("total_products", "unchanged_count", "new_count", "removed_count", "increased_count"):
+        assert full["statistics"][key] == diff_only["statistics"][key]
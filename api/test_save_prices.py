@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Тесты сохранения обновленного прайс-листа магазина (/api/v1/prices/save).
+Запуск: python -m pytest api/test_save_prices.py
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.storage import get_storage
+
+client = TestClient(app)
+
+MAPPING = {"article_column": "Артикул", "price_column": "Цена", "name_column": "Наименование"}
+STORE = "Артикул;Наименование;Цена\nAB-12;Товар 1;100\n0034;Товар 2;200\nab12;Товар 1 (дубль);100\nC5;Товар 3;300\n"
+
+@pytest.fixture
+def store_file():
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": ("store.csv", STORE.encode("utf-8"), "text/csv")},
+        data={"file_type": "store"}
+    )
+    assert response.status_code == 200, response.text
+    return {**response.json(), "column_mapping": MAPPING}
+
+def update(article, new_price, **fields):
+    return {"article": article, "old_price": 0, "new_price": new_price, **fields}
+
+def save(store_file, updates):
+    return client.post("/api/v1/prices/save", json={"store_file": store_file, "updates": updates})
+
+def saved_rows(result):
+    lines = get_storage().get(result["filename"]).decode("utf-8").strip().splitlines()
+    return [line.split(";") for line in lines[1:]]
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_full_copy_with_unmatched(store_file):
+    """Копия всего файла с новыми ценами; обновления без строки в файле возвращаются в unmatched"""
+    response = save(store_file, [
+        update("AB12", 110.5),
+        update("SUP-34", 250, store_article="34"),
+        update("NOPE", 1),
+        update("Z-9", 2, store_article="Z9"),
+    ])
+    assert response.status_code == 200, response.text
+    result = response.json()
+
+    assert result["count"] == 4
+    assert result["updated_rows"] == 3
+    assert [item["article"] for item in result["unmatched"]] == ["NOPE", "Z-9"]
+    assert result["download_url"].endswith(result["filename"])
+
+    rows = saved_rows(result)
+    assert [row[0] for row in rows] == ["AB-12", "0034", "ab12", "C5"]
+    assert [float(row[2]) for row in rows] == [110.5, 250, 110.5, 300]
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_integer_prices(store_file):
+    """Целые новые цены в целочисленной колонке"""
+    response = save(store_file, [update("C5", 350)])
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["updated_rows"] == 1
+    assert [float(row[2]) for row in saved_rows(result)] == [100, 200, 100, 350]
+
+def test_all_unmatched(store_file):
+    """Ни одно обновление не найдено — файл сохраняется без изменений цен"""
+    response = save(store_file, [update("NOPE", 1)])
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["updated_rows"] == 0
+    assert len(result["unmatched"]) == 1
+    assert [float(row[2]) for row in saved_rows(result)] == [100, 200, 100, 300]
+
+def test_mapping_required(store_file):
+    """Без сопоставления колонок — 400"""
+    response = save({**store_file, "column_mapping": None}, [update("AB12", 1)])
+    assert response.status_code == 400
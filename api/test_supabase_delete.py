@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Модульные тесты удаления объектов из Supabase Storage (SupabaseStorage.delete).
+Клиент Supabase подменяется бакетом-заглушкой.
+Запуск: python -m pytest api/test_supabase_delete.py
+"""
+
+from app.services.storage import SupabaseStorage
+
+class Bucket:
+    """Бакет-заглушка: remove возвращает заранее заданный ответ"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.removed = []
+
+    def remove(self, paths):
+        self.removed.extend(paths)
+        return self.reply
+
+def delete(keys, reply):
+    storage = SupabaseStorage(url="http://storage.test", bucket="bucket", folder="uploads")
+    bucket = Bucket(reply)
+    storage._bucket = lambda: bucket
+    return storage.delete(keys), bucket
+
+def test_only_confirmed_keys_returned(caplog):
+    """Удаленными считаются только файлы, подтвержденные ответом Supabase"""
+    deleted, bucket = delete(["a.csv", "b.csv"], [{"name": "uploads/a.csv"}])
+    assert bucket.removed == ["uploads/a.csv", "uploads/b.csv"]
+    assert deleted == ["a.csv"]
+    assert "b.csv" in caplog.text
+
+def test_empty_reply_confirms_nothing(caplog):
+    """Пустой ответ — ни один файл не считается удаленным"""
+    deleted, _ = delete(["a.csv"], [])
+    assert deleted == []
+    assert "не подтвердил" in caplog.text
+
+def test_unexpected_reply_confirms_nothing(caplog):
+    """Ответ неизвестного формата — ни один файл не считается удаленным"""
+    deleted, _ = delete(["a.csv"], {"error": "timeout"})
+    assert deleted == []
+    assert "неожиданный ответ" in caplog.text
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Тесты применения новых цен из результата сравнения версий (app.services.comparison.update_prices).
+Запуск: python -m pytest api/test_update_prices.py
+"""
+
+import uuid
+
+import pytest
+
+from app.services.comparison import update_prices
+from app.services.storage import get_storage
+
+ORIGINAL = "id;price\nA1;10\nA2;20\nA3;30\nA4;40\n"
+# A3 повторяется (берется последняя строка), A9 нет в исходном файле
+COMPARISON = "id;price_new;change_type\nA1;12;повышение\nA2;20;без изменений\nA3;31;повышение\nA3;33;повышение\nA9;99;новый\n"
+
+@pytest.fixture
+def files():
+    storage = get_storage()
+    original_name, comparison_name = f"original_{uuid.uuid4().hex[:8]}.csv", f"comparison_{uuid.uuid4().hex[:8]}.csv"
+    storage.put(original_name, ORIGINAL.encode("utf-8"))
+    storage.put(comparison_name, COMPARISON.encode("utf-8"))
+    return original_name, comparison_name
+
+def updated_prices(result):
+    assert result.get("status") == "success", result
+    lines = get_storage().get(result["result_file"]["filename"]).decode("utf-8").strip().splitlines()[1:]
+    return {article: float(price) for article, price in (line.split(";") for line in lines)}
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_update_all(files):
+    """Все цены из результата сравнения: повторы — последняя строка, лишние идентификаторы игнорируются"""
+    result = update_prices(*files, "price", "id", [], update_all=True)
+
+    assert updated_prices(result) == {"A1": 12, "A2": 20, "A3": 33, "A4": 40}
+    assert result["statistics"]["total_products"] == 4
+    assert result["statistics"]["updated_count"] == 3
+    assert result["statistics"]["changed_count"] == 2
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_update_selected(files):
+    """Обновляются только выбранные товары"""
+    result = update_prices(*files, "price", "id", ["A1", "A9"])
+
+    assert updated_prices(result) == {"A1": 12, "A2": 20, "A3": 30, "A4": 40}
+    assert result["statistics"]["updated_count"] == 1
+    assert result["statistics"]["changed_count"] == 1
+
+def test_missing_columns(files):
+    """Без колонки цены в исходном файле — ошибка в результате"""
+    result = update_prices(*files, "cost", "id", [], update_all=True)
+    assert "cost" in result["error"]
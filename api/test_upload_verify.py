@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Тесты проверки сохраненного файла при загрузке (verify_saved_file и /api/v1/files/upload).
+Запуск: python -m pytest api/test_upload_verify.py
+"""
+
+import hashlib
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.endpoints import files
+from app.services.file_service import verify_saved_file
+from app.services.storage import get_storage
+
+client = TestClient(app)
+
+CONTENT = "Артикул;Наименование;Цена\nA1;Товар 1;100\n".encode("utf-8")
+MD5 = hashlib.md5(CONTENT).hexdigest()
+
+def upload():
+    return client.post(
+        "/api/v1/files/upload",
+        files={"file": ("prices.csv", CONTENT, "text/csv")},
+        data={"file_type": "supplier"}
+    )
+
+def test_verify_by_md5():
+    """Совпадение и несовпадение контрольной суммы из ETag"""
+    filename = f"verify_{uuid.uuid4().hex}.csv"
+    get_storage().put(filename, CONTENT)
+    assert verify_saved_file(filename, len(CONTENT), MD5)
+    assert not verify_saved_file(filename, len(CONTENT), hashlib.md5(b"other").hexdigest())
+
+def test_verify_by_size_without_md5_etag(monkeypatch):
+    """ETag не md5 (локальное хранилище) — сверяется размер"""
+    filename = f"verify_{uuid.uuid4().hex}.csv"
+    storage = get_storage()
+    storage.put(filename, CONTENT)
+    meta = {**storage.head(filename), "etag": '"1f-5e"'}
+    monkeypatch.setattr(type(storage), "head", lambda self, key: meta)
+    assert verify_saved_file(filename, len(CONTENT), MD5)
+    assert not verify_saved_file(filename, len(CONTENT) + 1, MD5)
+
+def test_checksum_mismatch_rejects_upload(monkeypatch):
+    """В хранилище записано не то, что отправлено, — загрузка завершается ошибкой"""
+    monkeypatch.setattr(files, "save_file", lambda filename, content: get_storage().put(filename, content + b"\n"))
+    response = upload()
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Не удалось сохранить файл"
+
+def test_verify_retried_once(monkeypatch):
+    """Сбой проверки повторяется один раз"""
+    calls = []
+
+    def flaky(filename, size, md5=None):
+        calls.append(filename)
+        if len(calls) == 1:
+            raise ConnectionError("хранилище не отвечает")
+        return verify_saved_file(filename, size, md5)
+
+    monkeypatch.setattr(files, "verify_saved_file", flaky)
+    response = upload()
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+def test_unverified_upload_returns_503(monkeypatch):
+    """Проверка не удалась дважды — 503, файл не считается сохраненным"""
+    def broken(filename, size, md5=None):
+        raise ConnectionError("хранилище не отвечает")
+
+    monkeypatch.setattr(files, "verify_saved_file", broken)
+    response = upload()
+    assert response.status_code == 503
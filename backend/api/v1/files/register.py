@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import time
 import uuid
@@ -6,6 +7,14 @@ import logging
 import traceback
 from http.server import BaseHTTPRequestHandler
 
+# Каталог backend, чтобы использовать общее хранилище приложения
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+from app.services.storage import create_storage
+
+# Обработчики Vercel исторически хранят файлы в папке "uploads" бакета,
+# а не в settings.SUPABASE_FOLDER приложения
+storage = create_storage(folder=os.environ.get("SUPABASE_FOLDER", "uploads"))
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -13,28 +22,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger("register_file")
 
-def get_supabase_client():
-    """
-    Инициализация клиента Supabase
-    """
-    from supabase import create_client
-    
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_KEY")
-    
-    logger.info(f"Инициализация Supabase клиента: URL={supabase_url[:20] if supabase_url else None}...")
-    
-    if not supabase_url or not supabase_key:
-        logger.error(f"Отсутствуют переменные окружения SUPABASE_URL или SUPABASE_KEY")
-        return None
-    try:
-        client = create_client(supabase_url, supabase_key)
-        logger.info(f"Supabase клиент успешно инициализирован")
-        return client
-    except Exception as e:
-        logger.error(f"Не удалось инициализировать Supabase клиент: {str(e)}")
-        return None
-
 def detect_encoding(content):
     """
     Определение кодировки файла
@@ -83,32 +70,16 @@ def detect_separator(content, encoding):
 
 def get_file_content(stored_filename):
     """
-    Получение содержимого файла из Supabase Storage
+    Получение содержимого файла из хранилища
     """
     try:
         logger.info(f"Запрос файла: {stored_filename}")
         
-        supabase = get_supabase_client()
-        if not supabase:
-            logger.error(f"Не удалось инициализировать Supabase клиент для файла {stored_filename}")
-            return None
-        
-        bucket_name = os.environ.get("SUPABASE_BUCKET", "price-manager")
-        folder = os.environ.get("SUPABASE_FOLDER", "uploads")
-        
-        # Получаем файл из Supabase Storage
-        file_path = f"{folder}/{stored_filename}" if folder else stored_filename
-        
-        try:
-            response = supabase.storage.from_(bucket_name).download(file_path)
-            logger.info(f"Файл получен из Supabase, размер: {len(response)} байт")
-            return response
-        except Exception as e:
-            logger.error(f"Ошибка при получении файла из Supabase: {str(e)}")
-            return None
-            
+        response = storage.get(stored_filename)
+        logger.info(f"Файл получен из хранилища {storage.name}, размер: {len(response)} байт")
+        return response
     except Exception as e:
-        logger.error(f"Критическая ошибка при получении файла: {str(e)}")
+        logger.error(f"Ошибка при получении файла {stored_filename} из хранилища: {str(e)}")
         logger.error(f"Полная трассировка:\n{traceback.format_exc()}")
         return None
 
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import time
 import uuid
@@ -6,6 +7,14 @@ import logging
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs
 
+# Каталог backend, чтобы использовать общее хранилище приложения
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+from app.services.storage import create_storage
+
+# Обработчики Vercel исторически хранят файлы в папке "uploads" бакета,
+# а не в settings.SUPABASE_FOLDER приложения
+storage = create_storage(folder=os.environ.get("SUPABASE_FOLDER", "uploads"))
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -13,28 +22,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger("supabase_upload_url")
 
-def get_supabase_client():
-    """
-    Инициализация клиента Supabase
-    """
-    from supabase import create_client
-    
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_KEY")
-    
-    logger.info(f"Инициализация Supabase клиента: URL={supabase_url[:20] if supabase_url else None}...")
-    
-    if not supabase_url or not supabase_key:
-        logger.error(f"Отсутствуют переменные окружения SUPABASE_URL или SUPABASE_KEY")
-        return None
-    try:
-        client = create_client(supabase_url, supabase_key)
-        logger.info(f"Supabase клиент успешно инициализирован")
-        return client
-    except Exception as e:
-        logger.error(f"Не удалось инициализировать Supabase клиент: {str(e)}")
-        return None
-
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         """Обработка CORS preflight запросов"""
@@ -63,31 +50,22 @@ class handler(BaseHTTPRequestHandler):
             file_extension = os.path.splitext(file_name)[1].lower()
             stored_filename = f"file_{timestamp}_{uuid.uuid4().hex[:8]}{file_extension}"
             
-            # Инициализируем Supabase клиент
-            client = get_supabase_client()
-            if not client:
-                raise ValueError("Не удалось инициализировать Supabase клиент")
-            
-            # Получаем настройки хранилища
-            bucket_name = os.environ.get("SUPABASE_BUCKET", "price-manager")
-            folder = os.environ.get("SUPABASE_FOLDER", "uploads")
-            
-            # Формируем путь к файлу в Supabase
-            file_path = f"{folder}/{stored_filename}" if folder else stored_filename
+            # Путь к файлу в хранилище
+            file_path = storage.path(stored_filename)
             
             # Генерируем URL для загрузки с клиента напрямую
             logger.info(f"Генерация URL для загрузки файла: {file_path}")
-            signed_url = client.storage.from_(bucket_name).create_signed_upload_url(file_path)
+            signed_url = storage.signed_upload_url(stored_filename)
             
             # Формируем ответ
             response_data = {
-                "uploadUrl": signed_url["signed_url"],
+                "uploadUrl": signed_url,
                 "fileInfo": {
                     "stored_filename": stored_filename,
                     "original_filename": file_name,
                     "file_type": file_type,
                     "path": file_path,
-                    "bucket": bucket_name
+                    "bucket": getattr(storage, "bucket", None)
                 }
             }
             
@@ -1,18 +1,33 @@
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Body, Request
-from app.models.file import FileInfo, ComparisonResult
-from app.services.comparison_service import compare_files
+from fastapi import APIRouter, HTTPException, Body, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from app.models.file import (
+    FileInfo, FileType, ComparisonResult, ComparisonOptions, MultiComparisonResult, BestPriceOptions, BestPriceResult,
+    ComparisonPage
+)
 import os
+import asyncio
 from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.services.job_service import submit_job, publish_job, get_job_future, get_job_status, get_job_result
 import logging
 import json
 import traceback
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.services.file_service import get_file_content
 from app.services.file_cache import get_cached_content
+from app.services.result_formats import (
+    NDJSON_MEDIA_TYPE, ARROW_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, FormatUnavailableError,
+    negotiate_result_format, ensure_format_available, combine_sections, arrow_stream, frame_columns, msgpack_payload
+)
 
 logger = logging.getLogger("app.comparison")
 
+# Сервисы сравнения и хранилище результатов (pandas, numpy) импортируются в обработчиках:
+# импорт app.main их не загружает (см. scripts/startup_benchmark.py)
+
 router = APIRouter()
 
 # Определяем модель для запроса сравнения на основе формата, отправляемого с фронтенда
@@ -25,19 +40,48 @@ class ComparisonRequest(BaseModel):
     identifierColumn: Optional[str] = None
     valueColumn: Optional[str] = None
     matchType: Optional[str] = None
+    # Дополнительные этапы сравнения (например, подбор кандидатов по наименованию)
+    options: Optional[ComparisonOptions] = None
+    # Если указан, в ответе только первые page_size строк каждого раздела,
+    # остальные страницы доступны по /results/{result_id}
+    page_size: Optional[int] = Field(None, ge=1, le=settings.RESULT_PAGE_MAX_SIZE)
+
+# Запрос сравнения одного файла поставщика с несколькими файлами магазинов
+class MultiComparisonRequest(BaseModel):
+    supplier_file: FileInfo
+    store_files: List[FileInfo]
+    options: Optional[ComparisonOptions] = None
+
+# Запрос сравнения лучших цен нескольких поставщиков с файлом магазина
+class BestPriceRequest(BaseModel):
+    supplier_files: List[FileInfo]
+    store_file: FileInfo
+    best_price_options: Optional[BestPriceOptions] = None
+    options: Optional[ComparisonOptions] = None
 
 # Глобальный кэш файлов для сохранения зарегистрированных файлов
 # Будем хранить их по ID, чтобы потом находить
 file_registry = {}
 
-@router.post("/compare", response_model=ComparisonResult)
+@router.post("/compare", response_model=ComparisonResult, response_model_exclude={"matches"})
 async def compare_price_lists(
     request: Request,
     compare_request: ComparisonRequest = Body(...)
 ):
     """
     Сравнение прайс-листов поставщика и магазина
+
+    Если сравнение не укладывается в бюджет времени запроса, возвращается ответ 202
+    с идентификатором фоновой задачи и промежуточной статистикой; результат затем
+    можно получить по адресу /jobs/{job_id}. В Vercel фоновых задач нет: вместо 202
+    возвращается 504 с этапом и промежуточной статистикой
+
+    По заголовку Accept результат отдается из сохраненных колонок потоком NDJSON
+    (application/x-ndjson), в Arrow IPC (application/vnd.apache.arrow.stream)
+    или MessagePack (application/msgpack); по умолчанию — JSON
     """
+    deadline = Deadline()
+    result_format = _negotiate(request)
     try:
         logger.info(f"Получен запрос на сравнение файлов: {compare_request}")
         
@@ -121,11 +165,26 @@ async def compare_price_lists(
                 detail="Необходимо настроить сопоставление колонок для обоих файлов перед сравнением."
             )
             
-        # Выполняем сравнение
-        result = compare_files(supplier_file, store_file)
-        
-        logger.info(f"Сравнение успешно выполнено")
-        return result
+        from app.services.comparison_service import compare_files
+
+        # Сравнение выполняется фоновой задачей (в Vercel — в самом запросе), а запрос ждет ее
+        # в пределах своего бюджета времени: одинаковые параллельные запросы разделяют одно вычисление
+        response = await _run_comparison(
+            request,
+            "compare",
+            lambda job_deadline: compare_files(supplier_file, store_file, job_deadline, compare_request.options),
+            deadline,
+            "/compare",
+            encode=lambda result: jsonable_encoder(_comparison_response(result, compare_request.page_size), exclude={"matches"}),
+            reference=lambda result: {"result_id": result.result_id}
+        )
+        if isinstance(response, JSONResponse):
+            return response
+        if result_format != "json":
+            return await run_in_threadpool(_result_table_response, result_format, response)
+        return await run_in_threadpool(_comparison_response, response, compare_request.page_size)
+    except HTTPException:
+        raise
     except ValueError as ve:
         logger.error(f"Ошибка валидации при сравнении файлов: {str(ve)}")
         raise HTTPException(status_code=400, detail=str(ve))
@@ -134,6 +193,438 @@ async def compare_price_lists(
         logger.error(f"Полная ошибка: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Ошибка при сравнении файлов: {str(e)}")
 
+@router.post("/compare-many", response_model=MultiComparisonResult)
+async def compare_supplier_with_stores(
+    request: Request,
+    compare_request: MultiComparisonRequest = Body(...)
+):
+    """
+    Сравнение одного прайс-листа поставщика с несколькими прайс-листами магазинов
+
+    Файл поставщика загружается и индексируется один раз; результаты возвращаются
+    по каждому магазину вместе со сводкой. Как и /compare, при нехватке бюджета времени
+    возвращает 202 с идентификатором фоновой задачи
+    """
+    deadline = Deadline()
+    try:
+        supplier_file = compare_request.supplier_file
+        store_files = compare_request.store_files
+        logger.info(f"Получен запрос на сравнение файла поставщика {supplier_file.stored_filename} с {len(store_files)} файлами магазинов")
+
+        if not store_files:
+            raise HTTPException(status_code=400, detail="Необходимо указать хотя бы один файл магазина")
+        if len(store_files) > settings.COMPARE_MANY_MAX_STORES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Слишком много файлов магазинов: {len(store_files)} (не более {settings.COMPARE_MANY_MAX_STORES})"
+            )
+
+        if supplier_file.file_type != "supplier" or any(store_file.file_type != "store" for store_file in store_files):
+            logger.error("Неверные типы файлов для сравнения с несколькими магазинами")
+            raise HTTPException(
+                status_code=400,
+                detail="Неверные типы файлов: supplier_file должен иметь тип 'supplier', все store_files — тип 'store'."
+            )
+
+        if not supplier_file.column_mapping or any(not store_file.column_mapping for store_file in store_files):
+            logger.error("Отсутствует маппинг колонок для одного из файлов")
+            raise HTTPException(
+                status_code=400,
+                detail="Необходимо настроить сопоставление колонок для всех файлов перед сравнением."
+            )
+
+        from app.services.comparison_service import compare_many
+
+        response = await _run_comparison(
+            request,
+            "compare_many",
+            lambda job_deadline: compare_many(supplier_file, store_files, job_deadline, compare_request.options),
+            deadline,
+            "/compare-many",
+            encode=lambda result: jsonable_encoder(_multi_comparison_response(result)),
+            reference=lambda result: {"result_ids": {
+                store.store_file: store.result.result_id for store in result.stores if store.result
+            }}
+        )
+        if isinstance(response, JSONResponse):
+            return response
+        return await run_in_threadpool(_multi_comparison_response, response)
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации при сравнении с несколькими магазинами: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка при сравнении с несколькими магазинами: {str(e)}")
+        logger.error(f"Полная ошибка: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при сравнении файлов: {str(e)}")
+
+@router.post("/best-price", response_model=BestPriceResult)
+async def compare_best_supplier_prices(
+    request: Request,
+    compare_request: BestPriceRequest = Body(...)
+):
+    """
+    Сравнение лучших цен нескольких поставщиков с прайс-листом магазина
+
+    По каждому артикулу выбирается лучшая цена среди поставщиков (минимум или медиана)
+    вместе с поставщиком, затем полученная таблица сравнивается с магазином. Как и /compare,
+    при нехватке бюджета времени возвращает 202 с идентификатором фоновой задачи
+    """
+    deadline = Deadline()
+    try:
+        supplier_files = compare_request.supplier_files
+        store_file = compare_request.store_file
+        logger.info(f"Получен запрос на сравнение лучших цен {len(supplier_files)} поставщиков с файлом магазина {store_file.stored_filename}")
+
+        if not supplier_files:
+            raise HTTPException(status_code=400, detail="Необходимо указать хотя бы один файл поставщика")
+        if len(supplier_files) > settings.COMPARE_MANY_MAX_STORES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Слишком много файлов поставщиков: {len(supplier_files)} (не более {settings.COMPARE_MANY_MAX_STORES})"
+            )
+
+        if store_file.file_type != "store" or any(supplier_file.file_type != "supplier" for supplier_file in supplier_files):
+            logger.error("Неверные типы файлов для сравнения лучших цен")
+            raise HTTPException(
+                status_code=400,
+                detail="Неверные типы файлов: все supplier_files должны иметь тип 'supplier', store_file — тип 'store'."
+            )
+
+        if not store_file.column_mapping or any(not supplier_file.column_mapping for supplier_file in supplier_files):
+            logger.error("Отсутствует маппинг колонок для одного из файлов")
+            raise HTTPException(
+                status_code=400,
+                detail="Необходимо настроить сопоставление колонок для всех файлов перед сравнением."
+            )
+
+        from app.services.comparison_service import compare_best_prices
+
+        response = await _run_comparison(
+            request,
+            "best_price",
+            lambda job_deadline: compare_best_prices(
+                supplier_files, store_file, job_deadline, compare_request.options, compare_request.best_price_options
+            ),
+            deadline,
+            "/best-price",
+            encode=lambda result: jsonable_encoder(_best_price_response(result)),
+            reference=lambda result: {"result_id": result.comparison.result_id}
+        )
+        if isinstance(response, JSONResponse):
+            return response
+        return await run_in_threadpool(_best_price_response, response)
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        logger.error(f"Ошибка валидации при сравнении лучших цен: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Ошибка при сравнении лучших цен: {str(e)}")
+        logger.error(f"Полная ошибка: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при сравнении файлов: {str(e)}")
+
+async def _run_comparison(
+    request: Request,
+    kind: str,
+    func,
+    deadline: Deadline,
+    route: str,
+    encode=jsonable_encoder,
+    reference=None
+):
+    """
+    Выполняет сравнение в пределах бюджета запроса
+
+    В бессерверной среде (Vercel) сравнение выполняется прямо в запросе: фоновый поток
+    замораживается после ответа, а следующий запрос обычно попадает в другой экземпляр,
+    поэтому при нехватке времени возвращается 504 с этапом и промежуточной статистикой.
+    Иначе сравнение выполняется фоновой задачей (см. _wait_for_job); encode задает вид
+    результата в ответе /jobs/{job_id}, reference — ссылки на сохраненный результат,
+    которые отдают другие экземпляры приложения
+    """
+    if settings.IS_VERCEL == "1":
+        try:
+            return await run_in_threadpool(func, deadline)
+        except DeadlineExceeded as e:
+            logger.warning(f"Сравнение не уложилось в бюджет запроса ({deadline.timeout} сек): {str(e)}")
+            return JSONResponse(status_code=504, content={"status": "partial", "error": str(e), **deadline.snapshot()})
+
+    job_id = submit_job(kind, func, encode=encode, reference=reference)
+    return await _wait_for_job(request, job_id, deadline, route)
+
+async def _wait_for_job(request: Request, job_id: str, deadline: Deadline, route: str):
+    """
+    Ждет фоновую задачу в пределах бюджета запроса; если бюджет почти исчерпан,
+    возвращает 202 с состоянием задачи и адресом для получения результата
+    """
+    wait_timeout = max(0.0, deadline.remaining() - settings.DEADLINE_RESERVE_SECONDS)
+    done, _ = await asyncio.wait([asyncio.wrap_future(get_job_future(job_id))], timeout=wait_timeout)
+
+    if not done:
+        # Бюджет почти исчерпан: отдаем идентификатор задачи вместо таймаута;
+        # состояние задачи сохраняется в хранилище, чтобы его мог отдать любой экземпляр
+        await run_in_threadpool(publish_job, job_id)
+        job_status = get_job_status(job_id)
+        logger.warning(f"Сравнение не уложилось в бюджет запроса ({deadline.timeout} сек), задача {job_id}, этап: {job_status['stage']}")
+        return JSONResponse(status_code=202, content={
+            **job_status,
+            "status_url": f"{str(request.url.path).rsplit(route, 1)[0]}/jobs/{job_id}"
+        })
+
+    result = get_job_result(job_id)
+    logger.info(f"Сравнение успешно выполнено")
+    return result
+
+@router.get("/jobs/{job_id}")
+async def get_comparison_job(job_id: str):
+    """
+    Состояние фоновой задачи сравнения; для завершенной задачи возвращается и ссылка на
+    сохраненный результат (result_id или result_ids для нескольких магазинов)
+
+    Экземпляр, выполнивший задачу, добавляет сам результат (в том же виде, что и у запроса,
+    который ее запустил); другие экземпляры отдают только ссылку — страницы результата
+    доступны по /results/{result_id}
+    """
+    job_status = await run_in_threadpool(get_job_status, job_id, True)
+    if not job_status:
+        raise HTTPException(status_code=404, detail=f"Задача {job_id} не найдена")
+    return JSONResponse(content=jsonable_encoder(job_status))
+
+@router.get("/results/{result_id}")
+async def get_comparison_result_info(result_id: str):
+    """
+    Сведения о сохраненном результате сравнения: число строк и колонки каждого раздела
+    """
+    table = await _get_table(result_id)
+    return {
+        "result_id": result_id,
+        "sections": {
+            section: {"total": len(df), "columns": df.columns.tolist()}
+            for section, df in table.sections.items()
+        },
+        "created_at": table.created_at
+    }
+
+@router.get("/results/{result_id}/stream")
+async def stream_comparison_result(request: Request, result_id: str):
+    """
+    Весь сохраненный результат сравнения. По умолчанию — поток NDJSON: строка сводки,
+    затем для каждого раздела строка {"section", "total"} и его строки; по заголовку Accept
+    также Arrow IPC (одна таблица с колонкой section) или MessagePack (разделы колонками)
+    """
+    result_format = _negotiate(request, default="ndjson")
+    table = await _get_table(result_id)
+    return await run_in_threadpool(_table_response, result_format, table, {"result_id": result_id})
+
+@router.get("/results/{result_id}/{section}", response_model=ComparisonPage)
+async def get_comparison_result_page(
+    request: Request,
+    result_id: str,
+    section: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=settings.RESULT_PAGE_MAX_SIZE),
+    sort_by: Optional[str] = Query(None, description="Колонка сортировки, например price_diff_percent"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    change_type: Optional[str] = Query(None, description="increase, decrease или unchanged"),
+    min_diff_percent: Optional[float] = Query(None, ge=0),
+    max_diff_percent: Optional[float] = Query(None, ge=0),
+    search: Optional[str] = Query(None, description="Подстрока артикула или наименования")
+):
+    """
+    Страница сохраненного результата сравнения с сортировкой и фильтрами
+
+    Страница строится из колоночного результата, сохраненного при сравнении,
+    без повторного сравнения и без построения моделей для всех строк.
+    По заголовку Accept страница отдается также в Arrow IPC или MessagePack
+    """
+    result_format = _negotiate(request)
+    table = await _get_section_table(result_id, section)
+    filters = {
+        "sort_by": sort_by,
+        "descending": order == "desc",
+        "change_type": change_type,
+        "min_diff_percent": min_diff_percent,
+        "max_diff_percent": max_diff_percent,
+        "search": search,
+    }
+
+    try:
+        if result_format == "json":
+            page = await run_in_threadpool(table.query, section, offset=offset, limit=limit, **filters)
+            return JSONResponse(content=jsonable_encoder({"result_id": result_id, "section": section, **page}))
+
+        rows = await run_in_threadpool(table.select, section, **filters)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    header = {"result_id": result_id, "section": section, "total": len(rows), "offset": offset, "limit": limit}
+    page_df = table.sections[section].iloc[rows[offset:offset + limit]]
+    return await run_in_threadpool(_frame_response, result_format, page_df, header)
+
+@router.get("/results/{result_id}/{section}/stream")
+async def stream_comparison_result_section(
+    request: Request,
+    result_id: str,
+    section: str,
+    sort_by: Optional[str] = Query(None, description="Колонка сортировки, например price_diff_percent"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    change_type: Optional[str] = Query(None, description="increase, decrease или unchanged"),
+    min_diff_percent: Optional[float] = Query(None, ge=0),
+    max_diff_percent: Optional[float] = Query(None, ge=0),
+    search: Optional[str] = Query(None, description="Подстрока артикула или наименования")
+):
+    """
+    Все строки раздела сохраненного результата с теми же фильтрами и сортировкой,
+    что и у постраничного просмотра: потоком NDJSON или, по заголовку Accept,
+    в Arrow IPC или MessagePack
+    """
+    result_format = _negotiate(request, default="ndjson")
+    table = await _get_section_table(result_id, section)
+
+    try:
+        rows = await run_in_threadpool(
+            table.select,
+            section,
+            sort_by=sort_by,
+            descending=order == "desc",
+            change_type=change_type,
+            min_diff_percent=min_diff_percent,
+            max_diff_percent=max_diff_percent,
+            search=search
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    if result_format in ("arrow", "msgpack"):
+        header = {"result_id": result_id, "section": section, "total": len(rows)}
+        return await run_in_threadpool(_frame_response, result_format, table.sections[section].iloc[rows], header)
+
+    return StreamingResponse(
+        table.iter_ndjson(section, rows),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Total-Count": str(len(rows))}
+    )
+
+def _negotiate(request: Request, default: str = "json") -> str:
+    """
+    Формат ответа по заголовку Accept; для бинарных форматов сразу проверяется,
+    что нужный пакет установлен (иначе 406)
+    """
+    result_format = negotiate_result_format(request.headers.get("accept"))
+    if result_format == "json":
+        result_format = default
+    try:
+        ensure_format_available(result_format)
+    except FormatUnavailableError as fe:
+        raise HTTPException(status_code=406, detail=str(fe))
+    return result_format
+
+def _frame_response(result_format: str, df, header: Dict[str, Any]) -> Response:
+    """
+    Строки одного раздела в бинарном формате: Arrow IPC потоком или MessagePack колонками
+    """
+    if result_format == "arrow":
+        return StreamingResponse(arrow_stream(df, header), media_type=ARROW_MEDIA_TYPE)
+    return Response(content=msgpack_payload({**header, "columns": frame_columns(df)}), media_type=MSGPACK_MEDIA_TYPE)
+
+def _table_response(result_format: str, table, header: Dict[str, Any]) -> Response:
+    """
+    Весь результат в выбранном формате: NDJSON, Arrow IPC или MessagePack
+    """
+    from app.services.result_store import iter_result_ndjson
+
+    if result_format == "arrow":
+        return _frame_response("arrow", combine_sections(table.sections), {**header, "sections": table.counts()})
+    if result_format == "msgpack":
+        return Response(
+            content=msgpack_payload({
+                **header,
+                "sections": {section: frame_columns(df) for section, df in table.sections.items()}
+            }),
+            media_type=MSGPACK_MEDIA_TYPE
+        )
+    return StreamingResponse(iter_result_ndjson(table, header), media_type=NDJSON_MEDIA_TYPE)
+
+def _result_table_response(result_format: str, result: ComparisonResult) -> Response:
+    """
+    Результат сравнения из его колонок в формате NDJSON, Arrow IPC или MessagePack,
+    без построения строк-словарей
+    """
+    from app.services.comparison_service import result_table
+
+    table = result_table(result)
+    header = result.model_dump(exclude={"matches", "matches_data", "missing_in_store", "missing_in_supplier", "preview_data"})
+    return _table_response(result_format, table, header)
+
+async def _get_section_table(result_id: str, section: str):
+    from app.services.result_store import SECTIONS
+
+    if section not in SECTIONS:
+        raise HTTPException(status_code=404, detail=f"Неизвестный раздел результата: {section}")
+    return await _get_table(result_id)
+
+async def _get_table(result_id: str):
+    """
+    Сохраненный результат: из памяти процесса или, если его там нет (другой экземпляр
+    приложения, вытеснение), повторным сравнением по источнику из хранилища
+    """
+    from app.services.comparison_service import restore_comparison_table
+    from app.services.result_store import get_comparison_table
+
+    table = get_comparison_table(result_id)
+    if table is None:
+        deadline = Deadline()
+        try:
+            table = await run_in_threadpool(restore_comparison_table, result_id, deadline)
+        except DeadlineExceeded as e:
+            logger.warning(f"Восстановление результата {result_id[:12]} не уложилось в бюджет запроса: {str(e)}")
+            raise HTTPException(status_code=504, detail={"status": "partial", "error": str(e), **deadline.snapshot()})
+        except ValueError as ve:
+            raise HTTPException(status_code=409, detail=f"Не удалось восстановить результат {result_id}: {str(ve)}")
+    if table is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Результат {result_id} не найден или файлы сравнения изменились, выполните сравнение повторно"
+        )
+    return table
+
+def _comparison_response(result: ComparisonResult, page_size: Optional[int] = None) -> ComparisonResult:
+    """
+    Результат в формате ответа /compare: строки совпадений передаются один раз,
+    в поле matches_data, которое читает фронтенд (matches из ответа исключается).
+    Строки-словари строятся из колонок результата только здесь, при page_size —
+    только первые строки каждого раздела
+    """
+    from app.services.comparison_service import result_table
+
+    rows = slice(None, page_size)
+    return result.model_copy(update={
+        "matches_data": result_table(result).records("matches", limit=page_size),
+        "missing_in_store": result.missing_in_store[rows],
+        "missing_in_supplier": result.missing_in_supplier[rows]
+    })
+
+def _multi_comparison_response(result: MultiComparisonResult) -> MultiComparisonResult:
+    """
+    Ответ /compare-many: строки совпадений каждого магазина строятся из колонок
+    """
+    from app.services.comparison_service import with_match_rows
+
+    return result.model_copy(update={"stores": [
+        store.model_copy(update={"result": with_match_rows(store.result)}) if store.result is not None else store
+        for store in result.stores
+    ]})
+
+def _best_price_response(result: BestPriceResult) -> BestPriceResult:
+    """
+    Ответ /best-price: строки совпадений с магазином строятся из колонок
+    """
+    from app.services.comparison_service import with_match_rows
+
+    return result.model_copy(update={"comparison": with_match_rows(result.comparison)})
+
 # Добавляем метод для регистрации файла в реестре после загрузки
 def register_file(file_info: FileInfo):
     """
@@ -1,25 +1,29 @@
 import os
 import uuid
 import logging
-import pandas as pd
-import chardet
-import httpx
 import traceback
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks, Request, Response
 from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from app.models.file import FileInfo, FileType, ColumnMapping
 from app.services.file_service import (
     detect_encoding, 
     detect_separator, 
     get_columns, 
     get_file_content,
+    get_file_buffer,
     read_file,
     save_file,
+    verify_saved_file,
     init_supabase_client,
 )
-from app.services.file_cache import cache_file_content
+from app.services.storage import get_storage, LocalStorage, parse_timestamp
+from app.services.file_cache import cache_file_content, get_cache_validators, compute_content_hashes
+from app.services.shared_cache import get_shared_entry, get_shared_content
+from app.utils.http_range import ranged_response, STREAM_CHUNK_SIZE
 from app.core.config import settings
 from pydantic import BaseModel
 from datetime import datetime
@@ -28,6 +32,10 @@ from datetime import datetime
 # Импортируем здесь для предотвращения циклических импортов
 from app.api.endpoints.comparison import register_file, file_registry
 
+# httpx загружается при первом проксировании файла
+if TYPE_CHECKING:
+    import httpx
+
 router = APIRouter()
 logger = logging.getLogger("app.api.files")
 
@@ -36,71 +44,37 @@ class UploadUrlRequest(BaseModel):
     fileName: str
     fileType: FileType
 
-def get_supabase_client():
-    """
-    Возвращает инициализированный клиент Supabase или None
-    """
-    return init_supabase_client()
-
 @router.post("/upload_url")
 async def get_upload_url(request: UploadUrlRequest):
     """
-    Получение URL для прямой загрузки в Supabase
+    Получение URL для прямой загрузки в хранилище
     """
     try:
         file_extension = os.path.splitext(request.fileName)[1].lower()
         timestamp = int(time.time())
         stored_filename = f"file_{timestamp}_{uuid.uuid4().hex[:8]}{file_extension}"
         
-        # Получаем клиент Supabase
-        client = get_supabase_client()
+        storage = get_storage()
+        file_info = {
+            "original_filename": request.fileName,
+            "stored_filename": stored_filename,
+            "file_type": request.fileType,
+            "upload_path": storage.path(stored_filename)
+        }
         
-        if client:
-            # Получаем URL для загрузки напрямую в Supabase
-            upload_path = f"uploads/{stored_filename}"
-            upload_url = client.storage.from_(settings.SUPABASE_BUCKET).create_signed_upload_url(upload_path)
-            
-            # Выводим структуру объекта в логи для диагностики
-            logger.info(f"Получен ответ от Supabase: {upload_url}")
-            
-            # Создаем объект с информацией о файле 
-            file_info = {
-                "original_filename": request.fileName,
-                "stored_filename": stored_filename,
-                "file_type": request.fileType,
-                "upload_path": upload_path
-            }
-            
-            # Проверяем наличие ключа signedURL
-            if 'signedURL' in upload_url:
-                signed_url = upload_url['signedURL']
-            elif 'signed_url' in upload_url:
-                signed_url = upload_url['signed_url']
-            elif 'url' in upload_url:
-                signed_url = upload_url['url']
-            else:
-                # Если не находим ожидаемых ключей, создаем заглушку
-                logger.warning(f"Не удалось найти URL в ответе Supabase, используя прямой доступ через API")
-                bucket_url = client.storage.from_(settings.SUPABASE_BUCKET)._get_url()
-                object_url = f"{bucket_url}/object/{settings.SUPABASE_BUCKET}/{upload_path}"
-                signed_url = f"{object_url}?token={uuid.uuid4()}"
-            
-            return {
-                "uploadUrl": signed_url,
-                "fileInfo": file_info
-            }
-        else:
-            # Если Supabase недоступен, возвращаем заглушку
-            logger.warning("Supabase недоступен, используем заглушку для upload_url")
-            return {
-                "uploadUrl": f"/api/v1/files/mock-upload/{stored_filename}",
-                "fileInfo": {
-                    "original_filename": request.fileName,
-                    "stored_filename": stored_filename,
-                    "file_type": request.fileType,
-                    "upload_path": f"uploads/{stored_filename}"
-                }
-            }
+        try:
+            # Получаем URL для загрузки напрямую в хранилище
+            signed_url = storage.signed_upload_url(stored_filename)
+            logger.info(f"Получен URL для загрузки в хранилище {storage.name}: {stored_filename}")
+        except Exception as storage_error:
+            # Если хранилище недоступно, возвращаем заглушку
+            logger.warning(f"Хранилище {storage.name} недоступно ({str(storage_error)}), используем заглушку для upload_url")
+            signed_url = f"/api/v1/files/mock-upload/{stored_filename}"
+        
+        return {
+            "uploadUrl": signed_url,
+            "fileInfo": file_info
+        }
     except Exception as e:
         logger.error(f"Ошибка при создании URL для загрузки: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Не удалось создать URL для загрузки: {str(e)}")
@@ -111,46 +85,24 @@ class RegisterFileRequest(BaseModel):
 @router.post("/register", response_model=FileInfo)
 async def register_uploaded_file(request: RegisterFileRequest):
     """
-    Регистрация файла после прямой загрузки в Supabase
+    Регистрация файла после прямой загрузки в хранилище
     """
     try:
         file_info = request.fileInfo
         
-        # Получаем содержимое файла
-        client = get_supabase_client()
-        file_path = file_info.get("upload_path")
+        storage = get_storage()
         stored_filename = file_info.get("stored_filename")
         
-        if not client:
-            logger.warning("Supabase недоступен, используем заглушечные данные")
-            # Если Supabase недоступен, создаем объект FileInfo с заглушечными данными
-            registered_file = FileInfo(
-                id=str(uuid.uuid4()),
-                original_filename=file_info.get("original_filename", "sample.csv"),
-                stored_filename=stored_filename,
-                file_url=f"/api/v1/files/download/{stored_filename}",
-                file_type=file_info.get("file_type", FileType.SUPPLIER),
-                file_size=1000,
-                encoding="utf-8",
-                separator=","
-            )
-            
-            # Регистрируем файл в реестре для сравнения
-            register_file(registered_file)
-            
-            return registered_file
-        
-        # Получаем файл из Supabase
+        # Получаем файл из хранилища
         try:
-            # Попытка получить файл из Supabase
-            file_content = client.storage.from_(settings.SUPABASE_BUCKET).download(file_path)
+            file_content = await run_in_threadpool(storage.get, stored_filename)
             
             # Определяем кодировку и разделитель
             encoding = detect_encoding(file_content)
             separator = detect_separator(file_content, encoding)
             
-            # Создаем публичную ссылку для доступа к файлу
-            file_url = client.storage.from_(settings.SUPABASE_BUCKET).get_public_url(file_path)
+            # Создаем ссылку для доступа к файлу
+            file_url = storage.public_url(stored_filename)
             
             # Создаем объект FileInfo
             registered_file = FileInfo(
@@ -169,7 +121,7 @@ async def register_uploaded_file(request: RegisterFileRequest):
             
             return registered_file
         except Exception as e:
-            logger.error(f"Ошибка при получении файла из Supabase: {str(e)}", exc_info=True)
+            logger.error(f"Ошибка при получении файла из хранилища {storage.name}: {str(e)}", exc_info=True)
             # В случае ошибки возвращаем объект с базовой информацией
             return FileInfo(
                 id=str(uuid.uuid4()),
@@ -252,20 +204,29 @@ async def upload_file(
                 detail="Не удалось сохранить файл в облачном хранилище. Проверьте настройки Supabase и права доступа."
             )
         
-        # Проверяем, что файл успешно сохранен
-        try:
-            check_content = get_file_content(stored_filename)
-            if not check_content:
-                logger.error(f"КРИТИЧЕСКАЯ ОШИБКА: Файл был сохранен, но не может быть прочитан: {stored_filename}")
-                raise HTTPException(status_code=500, detail="Не удалось сохранить файл")
-            
-            logger.info(f"Файл успешно сохранен и доступен для чтения")
-        except Exception as read_error:
-            logger.error(f"Ошибка при проверке доступности файла: {str(read_error)}")
-            logger.error(traceback.format_exc())
-            
-            # Используем кешированное содержимое
-            logger.info(f"Используем файл из кеша: {stored_filename}")
+        # Проверяем, что файл успешно сохранен: по контрольной сумме из метаданных хранилища,
+        # без повторной загрузки содержимого (md5 уже посчитан при кешировании).
+        # Если хранилище не ответило на проверку, она повторяется один раз, затем — ошибка:
+        # непроверенный файл не считается сохраненным
+        validators = get_cache_validators(stored_filename) or {}
+        for attempt in range(2):
+            try:
+                verified = await run_in_threadpool(verify_saved_file, stored_filename, len(contents), validators.get("md5"))
+                break
+            except Exception as verify_error:
+                logger.error(f"Ошибка при проверке сохраненного файла (попытка {attempt + 1}): {str(verify_error)}")
+                logger.error(traceback.format_exc())
+        else:
+            raise HTTPException(
+                status_code=503,
+                detail="Не удалось проверить сохранение файла: хранилище не отвечает. Повторите загрузку."
+            )
+        
+        if not verified:
+            logger.error(f"КРИТИЧЕСКАЯ ОШИБКА: Файл был сохранен, но не прошел проверку: {stored_filename}")
+            raise HTTPException(status_code=500, detail="Не удалось сохранить файл")
+        
+        logger.info(f"Файл успешно сохранен, контрольная сумма совпадает")
         
         # Определение кодировки и разделителя
         encoding = detect_encoding(contents)
@@ -391,13 +352,60 @@ async def save_column_mapping(file_info: FileInfo):
     
     return file_info
 
-@router.get("/download/{filename}")
-async def download_file(filename: str):
+def _resolve_download_source(filename: str, use_local_path: bool = True) -> Dict[str, Any]:
+    """
+    Находит источник для отдачи файла без загрузки его целиком в память на каждый запрос:
+    локальное хранилище, общий кеш хоста (mmap файла данных) или кеш процесса
+
+    ETag и Last-Modified берутся из метаданных объекта в хранилище, а не из времени записи в кеш.
+    Отображение общего кеша остается читаемым, даже если файл данных вытеснят во время отдачи
+
+    Args:
+        filename: Имя файла
+        use_local_path: Отдавать файл локального хранилища с диска (False — файл пропал
+            между поиском и открытием, ищем в кешах и хранилище)
+
+    Returns:
+        Dict[str, Any]: path/buffer, etag и last_modified для ranged_response (пустой словарь, если файла нет)
+    """
+    # Файл на локальном диске: в локальном хранилище или сохраненный туда при недоступности основного
+    if use_local_path:
+        local_path = get_storage().local_path(filename) or LocalStorage().local_path(filename)
+        if local_path:
+            logger.info(f"Файл {filename} отдается из локального хранилища")
+            return {"path": local_path}
+
+    shared_entry = get_shared_entry(filename)
+    mapping = get_shared_content(filename) if shared_entry else None
+    if mapping is not None:
+        logger.info(f"Файл {filename} отдается из общего кеша")
+        return {
+            "buffer": mapping,
+            "etag": shared_entry.get("etag") or f'"{shared_entry["md5"]}"',
+            "last_modified": parse_timestamp(shared_entry.get("last_modified"))
+        }
+
+    # Файл в кеше процесса или в облачном хранилище (после загрузки он попадет в кеши)
+    content = get_file_buffer(filename)
+    if content:
+        validators = get_cache_validators(filename) or get_shared_entry(filename) or {}
+        md5 = validators.get("md5") or compute_content_hashes(content)["md5"]
+        return {
+            "buffer": content,
+            "etag": validators.get("etag") or f'"{md5}"',
+            "last_modified": parse_timestamp(validators.get("last_modified"))
+        }
+
+    return {}
+
+@router.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request):
     """
     Скачивание файла по имени.
     
-    В режиме Vercel (продакшн) - проксирует из Supabase
-    В режиме локальной разработки - из локального хранилища или Supabase
+    Файл отдается потоково из локального хранилища, общего кеша или кеша процесса
+    с поддержкой Range (докачка), ETag и условных запросов.
+    Если файла нет ни в одном из них, он загружается из Supabase, а при неудаче проксируется.
     
     Args:
         filename: Имя файла для скачивания
@@ -405,16 +413,16 @@ async def download_file(filename: str):
     Returns:
         Файл для скачивания
     """
-    logger.info(f"Запрос на скачивание файла: {filename}")
+    logger.info(f"Запрос на скачивание файла: {filename}, Range: {request.headers.get('range')}")
     
     # Проверка на специальное имя для сэмпла
     if filename == "sample":
         return await download_sample_file()
     
-    # Получаем содержимое файла с универсальной функцией
-    content = get_file_content(filename)
+    # Ищем источник содержимого (загрузка блокирующая, выполняем в пуле потоков)
+    source = await run_in_threadpool(_resolve_download_source, filename)
     
-    if content:
+    if source:
         # Определяем content-type на основе расширения файла
         extension = os.path.splitext(filename)[1].lower()
         content_type = "application/octet-stream"
@@ -429,31 +437,27 @@ async def download_file(filename: str):
         if filename.startswith("updated_"):
             display_name = filename.replace("updated_", "")
         
-        # Возвращаем файл для скачивания
-        return Response(
-            content=content,
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{display_name}"',
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
-        )
+        # Возвращаем файл для скачивания (целиком или запрошенный диапазон)
+        headers = {"Content-Disposition": f'attachment; filename="{display_name}"'}
+        try:
+            return ranged_response(request, media_type=content_type, headers=headers, **source)
+        except FileNotFoundError:
+            # Файл удалили между поиском и открытием: отдаем его из кешей или хранилища
+            logger.warning(f"Файл {filename} пропал с диска перед отдачей, ищем его в кешах и хранилище")
+            source = await run_in_threadpool(_resolve_download_source, filename, False)
+            if source:
+                return ranged_response(request, media_type=content_type, headers=headers, **source)
     
-    # Если файл не найден ни локально, ни в Supabase, предлагаем скачать прокси или сэмпл
-    if settings.USE_CLOUD_STORAGE:
-        # Пробуем через прокси
-        client = get_supabase_client()
-        if client:
-            try:
-                # Формируем URL для Supabase Storage
-                file_path = f"{settings.SUPABASE_FOLDER}/{filename}"
-                url = client.storage.from_(settings.SUPABASE_BUCKET).get_public_url(file_path)
-                logger.info(f"Пытаемся проксировать файл через URL: {url}")
-                return await proxy_download(url=url)
-            except Exception as e:
-                logger.error(f"Ошибка при проксировании файла из Supabase: {str(e)}")
-                # Возвращаем сэмпл, если не удалось
-                return await download_sample_file()
+    # Если файл не найден ни локально, ни в хранилище, пробуем проксировать его по ссылке хранилища
+    try:
+        url = get_storage().public_url(filename)
+        if url.startswith(("http://", "https://")):
+            logger.info(f"Пытаемся проксировать файл через URL: {url}")
+            return await proxy_download(request=request, url=url)
+    except Exception as e:
+        logger.error(f"Ошибка при проксировании файла из хранилища: {str(e)}")
+        # Возвращаем сэмпл, если не удалось
+        return await download_sample_file()
     
     # Если файл не найден и не удалось проксировать, возвращаем сэмпл
     logger.warning(f"Файл {filename} не найден, возвращаем сэмпл")
@@ -488,12 +492,46 @@ A005,Товар 5,500.00
         }
     )
 
+# Общий пул соединений для проксирования файлов из хранилища
+_proxy_client: Optional["httpx.AsyncClient"] = None
+
+# Заголовки запроса клиента, которые передаются в хранилище (докачка и условные запросы)
+PROXY_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+# Заголовки ответа хранилища, которые передаются клиенту
+PROXY_RESPONSE_HEADERS = (
+    "content-length", "content-range", "content-encoding", "accept-ranges", "etag", "last-modified"
+)
+
+def _get_proxy_client() -> "httpx.AsyncClient":
+    global _proxy_client
+    if _proxy_client is None:
+        import httpx
+
+        _proxy_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            follow_redirects=True
+        )
+    return _proxy_client
+
+async def close_proxy_client() -> None:
+    """
+    Закрывает пул соединений прокси (при остановке приложения)
+    """
+    global _proxy_client
+    if _proxy_client is not None:
+        await _proxy_client.aclose()
+        _proxy_client = None
+
 @router.get("/proxy-download")
-async def proxy_download(url: str):
+async def proxy_download(request: Request, url: str):
     """
     Проксирует скачивание файла по URL.
     
-    Используется для скачивания файлов из Supabase Storage.
+    Используется для скачивания файлов из Supabase Storage. Тело ответа передается клиенту
+    потоково по мере получения из хранилища, без буферизации всего файла в памяти;
+    Range и условные заголовки передаются в хранилище, а Content-Length, Content-Range
+    и ETag — обратно клиенту. При отключении клиента запрос к хранилищу прерывается.
     
     Args:
         url: URL файла для скачивания
@@ -501,7 +539,7 @@ async def proxy_download(url: str):
     Returns:
         Проксированный файл
     """
-    logger.info(f"Запрос на проксирование файла: {url}")
+    logger.info(f"Запрос на проксирование файла: {url}, Range: {request.headers.get('range')}")
     
     try:
         # Проверяем, является ли URL Supabase URL
@@ -511,34 +549,55 @@ async def proxy_download(url: str):
             logger.warning(f"Недопустимый URL для проксирования: {url}")
             raise HTTPException(status_code=400, detail="Недопустимый URL для проксирования")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, follow_redirects=True)
-            
-            if response.status_code != 200:
-                logger.error(f"Ошибка при проксировании файла, статус: {response.status_code}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Ошибка при проксировании файла: {response.text}"
-                )
-            
-            # Получаем имя файла из URL или заголовка Content-Disposition
-            filename = url.split("/")[-1]
-            content_disposition = response.headers.get("Content-Disposition", "")
-            
-            if 'filename=' in content_disposition:
-                filename = content_disposition.split('filename=')[1].strip('"\'')
-            
-            # Определяем content-type из ответа или по расширению
-            content_type = response.headers.get("Content-Type", "application/octet-stream")
-            
-            return Response(
-                content=response.content,
-                media_type=content_type,
-                headers={
-                    "Content-Disposition": f'attachment; filename="{filename}"',
-                    "Access-Control-Expose-Headers": "Content-Disposition"
-                }
+        client = _get_proxy_client()
+        upstream_headers = {
+            name: request.headers[name] for name in PROXY_REQUEST_HEADERS if name in request.headers
+        }
+        upstream = await client.send(client.build_request("GET", url, headers=upstream_headers), stream=True)
+        
+        if upstream.status_code not in (200, 206, 304):
+            await upstream.aread()
+            await upstream.aclose()
+            logger.error(f"Ошибка при проксировании файла, статус: {upstream.status_code}")
+            raise HTTPException(
+                status_code=upstream.status_code,
+                detail=f"Ошибка при проксировании файла: {upstream.text}"
             )
+        
+        # Получаем имя файла из URL или заголовка Content-Disposition
+        filename = url.split("?")[0].split("/")[-1]
+        content_disposition = upstream.headers.get("Content-Disposition", "")
+        
+        if 'filename=' in content_disposition:
+            filename = content_disposition.split('filename=')[1].strip('"\'')
+        
+        headers = {
+            name: upstream.headers[name] for name in PROXY_RESPONSE_HEADERS if name in upstream.headers
+        }
+        headers.update({
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Access-Control-Expose-Headers": "Content-Disposition, Content-Range, Accept-Ranges, ETag"
+        })
+        
+        async def relay():
+            # Передаем байты как есть (без распаковки), чтобы они соответствовали Content-Length.
+            # При отключении клиента Starlette отменяет генератор, и соединение с хранилищем закрывается
+            try:
+                async for chunk in upstream.aiter_raw(STREAM_CHUNK_SIZE):
+                    yield chunk
+            finally:
+                await upstream.aclose()
+        
+        # Определяем content-type из ответа или по расширению
+        content_type = upstream.headers.get("Content-Type", "application/octet-stream")
+        
+        return StreamingResponse(
+            relay(),
+            status_code=upstream.status_code,
+            media_type=content_type,
+            headers=headers,
+            background=BackgroundTask(upstream.aclose)
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -1,12 +1,8 @@
 from typing import List, Dict, Any
 from fastapi import APIRouter, HTTPException, Body, Request
+from fastapi.concurrency import run_in_threadpool
 from app.models.file import FileInfo, PriceUpdate
-from app.services import file_service
-from app.core.config import settings
 import logging
-import os
-import uuid
-import pandas as pd
 
 router = APIRouter()
 logger = logging.getLogger("app.api.prices")
@@ -81,51 +77,38 @@ async def save_updated_file(
 ):
     """
     Сохранение обновленного файла с новыми ценами
+
+    Новые цены записываются в полную копию прайс-листа магазина (раньше в файл попадали
+    только строки обновлений). Без сопоставления колонок (column_mapping) — ответ 400.
+    Ответ: filename, download_url, count (обновлений в запросе), updated_rows (обновленных
+    строк файла) и unmatched (обновления, артикулов которых в файле нет)
     """
-    try:
-        # Определяем, находимся ли мы в облачной среде (Vercel)
-        is_vercel = settings.IS_VERCEL
-        
-        # Генерируем имя файла
-        real_filename = f"updated_{uuid.uuid4()}.csv"
-        logger.info(f"Генерируем файл: {real_filename}")
-        
-        # Создаем DataFrame с обновленными данными
-        df = pd.DataFrame({
-            "Артикул": [update.article for update in updates],
-            "Наименование товара": [update.store_name for update in updates],
-            "Цена магазина": [update.new_price for update in updates]
-        })
-        
-        # Получаем байты для сохранения
-        file_bytes = file_service.dataframe_to_bytes(
-            df, 
-            '.csv', 
-            'UTF-8-SIG', 
-            ','
+    request_id = getattr(request.state, "request_id", "unknown")
+    
+    if not store_file.column_mapping:
+        logger.error(f"[{request_id}] Не указано сопоставление колонок для файла {store_file.stored_filename}")
+        raise HTTPException(
+            status_code=400,
+            detail="Не указано сопоставление колонок для файла"
         )
-        
-        # Сохраняем файл с помощью универсальной функции
-        save_path = file_service.save_file(real_filename, file_bytes)
-        logger.info(f"Файл успешно сохранен: {save_path}")
-        
-        # В зависимости от типа пути возвращаем результат
-        # Для Supabase будет полный URL, для локального хранилища - путь
-        if save_path.startswith('http'):
-            # Supabase URL
-            download_url = save_path
-        else:
-            # Локальный путь
-            download_url = f"/api/v1/files/download/{real_filename}"
-            
-        return {
-            "filename": real_filename,
-            "download_url": download_url,
-            "count": len(updates)
-        }
+    
+    # Сервис цен (pandas) импортируется при первом сохранении: импорт app.main его не загружает
+    from app.services import price_service
+
+    try:
+        result = await run_in_threadpool(price_service.save_updated_file, store_file, updates)
+    except ValueError as e:
+        logger.error(f"[{request_id}] Не удалось сохранить обновленный файл: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Ошибка при сохранении обновленного файла: {str(e)}")
+        logger.error(f"[{request_id}] Ошибка при сохранении обновленного файла: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при сохранении обновленного файла: {str(e)}")
+    
+    logger.info(
+        f"[{request_id}] Файл успешно сохранен: {result['filename']}, обновлено строк: {result['updated_rows']}, "
+        f"без совпадения: {len(result['unmatched'])}"
+    )
+    return result
 
 def update_prices(updates: List[PriceUpdate], store_file: FileInfo) -> List[PriceUpdate]:
     """
@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from pydantic_settings import BaseSettings
@@ -34,8 +35,54 @@ class Settings(BaseSettings):
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     LOG_DIR: str = "logs"
     
+    # Общий кеш файлов для всех воркеров хоста (файлы данных + индекс, чтение через mmap)
+    SHARED_CACHE_ENABLED: bool = True
+    SHARED_CACHE_DIR: str = os.getenv("SHARED_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pricemanager-cache"))
+    # В Vercel /tmp ограничен 512 МБ, поэтому там лимит меньше; кроме того, лимит не превышает
+    # половины раздела, на котором лежит каталог кеша (см. shared_cache._max_cache_size)
+    SHARED_CACHE_MAX_SIZE_MB: int = int(os.getenv(
+        "SHARED_CACHE_MAX_SIZE_MB",
+        "256" if os.getenv("VERCEL") == "1" else "1024"
+    ))
+
+    # Бюджет времени на обработку одного запроса (в Vercel весь запрос ограничен 10 секундами)
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv(
+        "REQUEST_DEADLINE_SECONDS",
+        "9.0" if os.getenv("VERCEL") == "1" else "120.0"
+    ))
+    # Сколько времени оставляем на формирование ответа: если бюджет почти исчерпан,
+    # запрос возвращает идентификатор фоновой задачи и промежуточную статистику
+    DEADLINE_RESERVE_SECONDS: float = 1.0
+    # Бюджет фоновой задачи, которая продолжает обработку после ответа клиенту
+    JOB_DEADLINE_SECONDS: float = float(os.getenv("JOB_DEADLINE_SECONDS", "300.0"))
+
+    # Загрузка файлов из хранилища блоками (Range) с докачкой после обрыва
+    DOWNLOAD_CHUNK_SIZE: int = 4 * 1024 * 1024  # 4 MB
+    # Сколько секунд можно тратить на повторные попытки загрузки одного файла
+    DOWNLOAD_RETRY_BUDGET_SECONDS: float = float(os.getenv(
+        "DOWNLOAD_RETRY_BUDGET_SECONDS",
+        "6.0" if os.getenv("VERCEL") == "1" else "30.0"
+    ))
+    DOWNLOAD_MAX_BACKOFF: float = 2.0  # Максимальная пауза между попытками в секундах
+
+    # Нечеткое сопоставление наименований: триграммы, встречающиеся в большем числе строк,
+    # не используются для отбора кандидатов
+    FUZZY_MAX_POSTING_SIZE: int = 2000
+    # Максимальное число файлов магазинов в одном запросе сравнения с поставщиком
+    COMPARE_MANY_MAX_STORES: int = 50
+    # Хранилище результатов сравнения для постраничного просмотра (в памяти процесса)
+    RESULT_STORE_MAX_SIZE_MB: int = 512
+    RESULT_STORE_TTL_SECONDS: int = 3600
+    # Максимальный размер страницы результата
+    RESULT_PAGE_MAX_SIZE: int = 1000
+    # Сколько строк сериализуется за один шаг при потоковой отдаче результата (NDJSON)
+    RESULT_STREAM_BATCH_SIZE: int = 5000
+
     # Настройки планировщика
     CLEANUP_INTERVAL: int = 86400  # Интервал очистки кеша в секундах (по умолчанию 1 день)
+    CLEANUP_PAGE_SIZE: int = 1000  # Размер страницы списка файлов при очистке хранилища
+    CLEANUP_BATCH_SIZE: int = 100  # Сколько файлов удалять одним запросом
+    CLEANUP_CONCURRENCY: int = 4  # Сколько пакетов удалять одновременно
     
     # Дополнительные настройки
     TIMEZONE: str = "Europe/Moscow"
@@ -54,6 +101,7 @@ class Settings(BaseSettings):
     
     # Настройки файлов
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10 MB
+    UPLOADS_DIR: str = os.getenv("UPLOADS_DIR", os.path.join(BASE_DIR, "uploads"))
     
     # Настройки базы данных
     DATABASE_URL: str = f"sqlite:///./app.db"
@@ -63,6 +111,8 @@ class Settings(BaseSettings):
     IS_VERCEL: str = os.getenv("VERCEL", "0")
     # Всегда используем Supabase Storage
     USE_CLOUD_STORAGE: bool = True
+    # Реализация хранилища: supabase, local (каталог UPLOADS_DIR) или memory (для тестов и бенчмарков)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "supabase")
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,139 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.core.deadline")
+
+# Общий пул потоков для параллельной загрузки и разбора входных файлов запроса
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени запроса исчерпан"""
+
+    def __init__(self, stage: str, elapsed: float):
+        self.stage = stage
+        self.elapsed = elapsed
+        super().__init__(f"Превышено время выполнения запроса на этапе '{stage}' ({elapsed:.2f} сек)")
+
+class Deadline:
+    """
+    Бюджет времени одного запроса.
+    Создается при получении запроса и передается во все этапы обработки
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout if timeout is not None else settings.REQUEST_DEADLINE_SECONDS
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.timeout
+        # Текущий этап и промежуточная статистика — для частичного ответа, если бюджет исчерпан
+        self.stage: Optional[str] = None
+        self.progress: Dict[str, Any] = {}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        """
+        Проверяет, что бюджет не исчерпан, иначе выбрасывает DeadlineExceeded
+        """
+        if self.expired():
+            raise DeadlineExceeded(stage, self.elapsed())
+
+    def nearly_expired(self, reserve: Optional[float] = None) -> bool:
+        """
+        Проверяет, что до истечения бюджета осталось меньше резерва на формирование ответа
+        """
+        reserve = settings.DEADLINE_RESERVE_SECONDS if reserve is None else reserve
+        return self.remaining() <= reserve
+
+    def enter(self, stage: str, **progress: Any) -> None:
+        """
+        Отмечает начало этапа обработки (fetch, parse, match, serialize) и проверяет бюджет
+        """
+        self.stage = stage
+        self.progress.update(progress)
+        self.check(stage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Состояние обработки: этап, прошедшее время и промежуточная статистика
+        """
+        return {
+            "stage": self.stage,
+            "elapsed": round(self.elapsed(), 3),
+            "remaining": round(self.remaining(), 3),
+            "progress": dict(self.progress)
+        }
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="request-io")
+    return _executor
+
+def run_parallel(
+    tasks: Dict[str, Callable[[], Any]],
+    deadline: Optional[Deadline] = None,
+    stage: str = "parallel"
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Выполняет задачи параллельно в пуле потоков в пределах общего бюджета времени
+
+    Args:
+        tasks: Имя задачи -> функция без аргументов
+        deadline: Бюджет времени запроса (общий для всех задач)
+        stage: Название этапа для логов и ошибки DeadlineExceeded
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, float]]: результаты и время выполнения каждой задачи в секундах
+
+    Raises:
+        DeadlineExceeded: если задачи не успели завершиться до истечения бюджета.
+            Незавершенные задачи продолжают работу в фоне (их результаты попадут в кеши)
+    """
+    if deadline is not None:
+        deadline.enter(stage)
+
+    timings: Dict[str, float] = {}
+
+    def timed(name: str, func: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        try:
+            return func()
+        finally:
+            timings[name] = time.monotonic() - started
+
+    executor = _get_executor()
+    futures = {name: executor.submit(timed, name, func) for name, func in tasks.items()}
+
+    timeout = deadline.remaining() if deadline else None
+    done, not_done = wait(futures.values(), timeout=timeout, return_when=FIRST_EXCEPTION)
+
+    # Ошибку любой задачи пробрасываем сразу
+    for future in done:
+        if future.exception() is not None:
+            raise future.exception()
+
+    if not_done:
+        pending = [name for name, future in futures.items() if future in not_done]
+        logger.warning(f"Этап '{stage}' не уложился в бюджет времени, не завершены: {', '.join(pending)}")
+        raise DeadlineExceeded(stage, deadline.elapsed() if deadline else 0.0)
+
+    results = {name: future.result() for name, future in futures.items()}
+    logger.info(
+        f"Этап '{stage}' выполнен параллельно: " +
+        ", ".join(f"{name}={timings.get(name, 0):.3f}с" for name in tasks)
+    )
+    return results, timings
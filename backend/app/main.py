@@ -6,11 +6,10 @@ import time
 import logging
 import logging.config
 import sys
-from typing import Callable
+from typing import Callable, Optional, TYPE_CHECKING
 import uuid
 from starlette.middleware.base import BaseHTTPMiddleware
 from contextlib import asynccontextmanager
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi.responses import JSONResponse
 import traceback
 
@@ -18,7 +17,9 @@ from app.api.api import api_router
 from app.core.config import settings
 from app.core.middleware import TraceMiddleware
 from app.services.file_service import cleanup_old_files
-from app.services.file_cache import clear_old_cache, get_cache_stats
+from app.services.storage import start_readiness_check, get_storage_readiness
+from app.api.endpoints.files import close_proxy_client
+from app.services.file_cache import clear_old_cache, get_cache_stats, MAX_STALE_AGE
 from app.services.log_rotation import rotate_logs
 from app.core.logger import get_logger
 
@@ -28,8 +29,12 @@ settings.setup_logs_directory()
 # Инициализируем логгер
 logger = get_logger("app.main")
 
-# Инициализация планировщика
-scheduler = AsyncIOScheduler()
+# apscheduler загружается при запуске планировщика, а не при импорте приложения
+if TYPE_CHECKING:
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+# Планировщик создается в lifespan
+scheduler: Optional["AsyncIOScheduler"] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -44,13 +49,18 @@ async def lifespan(app: FastAPI):
     
     # Настройка и запуск планировщика
     logger.info("Инициализация планировщика задач")
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    global scheduler
+    scheduler = AsyncIOScheduler()
     
-    # Планировщик очистки кеша каждый час
+    # Планировщик очистки кеша каждый час.
+    # Записи старше TTL не удаляем: они отдаются как устаревшие и ревалидируются в фоне
     scheduler.add_job(
         clear_old_cache,
         'interval',
         hours=1,
-        kwargs={"max_age": 3600}  # 1 час
+        kwargs={"max_age": MAX_STALE_AGE}
     )
     
     # Планировщик очистки старых файлов в Supabase каждый день
@@ -74,6 +84,9 @@ async def lifespan(app: FastAPI):
     scheduler.start()
     logger.info("Планировщик задач запущен")
     
+    # Проверка бакета Supabase выполняется в фоне и не задерживает запуск
+    start_readiness_check()
+    
     # Логируем информацию о запуске
     logger.info(f"Приложение запущено за {time.time() - start_time:.2f} секунд")
     
@@ -83,6 +96,7 @@ async def lifespan(app: FastAPI):
         # Остановка приложения
         logger.info("Остановка планировщика задач")
         scheduler.shutdown()
+        await close_proxy_client()
         logger.info("Приложение остановлено")
 
 app = FastAPI(
@@ -148,9 +162,24 @@ async def health_check():
     return {
         "status": "ok",
         "version": settings.VERSION,
-        "environment": "production"
+        "environment": "production",
+        "storage": get_storage_readiness()
     }
 
+@app.get("/api/v1/health/ready")
+async def readiness_check():
+    """
+    Готовность к работе с хранилищем: 503, пока фоновая проверка бакета не завершилась успешно
+    """
+    # В бессерверном окружении lifespan может не выполняться — запускаем проверку при первом запросе
+    start_readiness_check()
+    readiness = get_storage_readiness()
+    ready = readiness["status"] in ("ready", "skipped")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "storage": readiness}
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """
@@ -1,16 +1,78 @@
 from enum import Enum
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Dict, Any, Optional, Literal
 
 class FileType(str, Enum):
     SUPPLIER = "supplier"
     STORE = "store"
 
+class ArticleNormalization(BaseModel):
+    """
+    Правила приведения артикулов к ключу сопоставления
+    """
+    # Не различать регистр: "ab12" и "AB12"
+    ignore_case: bool = True
+    # Символы-разделители, которые удаляются из артикула: "AB-12" и "AB 12" -> "AB12"
+    separators: str = " -_/"
+    # Удалять ведущие нули: "00123" и "123"
+    strip_leading_zeros: bool = True
+    # Удалять дробную часть, которую pandas добавляет числовым артикулам: "123.0" -> "123"
+    strip_float_suffix: bool = True
+
 class ColumnMapping(BaseModel):
     article_column: str
     price_column: str
     name_column: Optional[str] = None
     additional_columns: Optional[Dict[str, str]] = None
+    article_normalization: ArticleNormalization = Field(default_factory=ArticleNormalization)
+
+class ComparisonOptions(BaseModel):
+    """
+    Дополнительные этапы сравнения прайс-листов
+    """
+    # Второй этап: для товаров без пары по артикулу подобрать похожие по наименованию
+    fuzzy_names: bool = False
+    # Минимальное сходство наименований (коэффициент Дайса по триграммам, от 0 до 1)
+    fuzzy_min_similarity: float = Field(0.5, ge=0.0, le=1.0)
+    # Сколько кандидатов возвращать для одного товара
+    fuzzy_max_candidates: int = Field(3, ge=1, le=20)
+    # Какая строка магазина сопоставляется, если артикул в файле магазина повторяется:
+    # last — последняя (прежнее поведение), first — первая, min / max — с минимальной / максимальной ценой,
+    # mean — первая строка со средней ценой повторов, all — все строки (по совпадению на каждую)
+    duplicate_policy: Literal["last", "first", "min", "max", "mean", "all"] = "last"
+
+class BestPriceOptions(BaseModel):
+    """
+    Правила выбора лучшего предложения по артикулу среди нескольких поставщиков
+    """
+    # Цена артикула: минимальная среди поставщиков или медиана предложений
+    aggregate: Literal["min", "median"] = "min"
+    # Какой поставщик указывается при равных ценах (для median — при равном отклонении от медианы):
+    # first — раньше в списке файлов, last — позже
+    tie_breaker: Literal["first", "last"] = "first"
+
+class ChangeRule(BaseModel):
+    """
+    Правило классификации изменения цены при сравнении версий прайс-листа.
+
+    Все заданные условия должны выполняться одновременно; из нескольких подходящих
+    правил применяется первое в таблице правил
+    """
+    label: str
+    # Статус товара: new — появился в новой версии, removed — исчез, existing — есть в обеих
+    status: Optional[Literal["new", "removed", "existing"]] = None
+    # Направление изменения цены
+    direction: Optional[Literal["increase", "decrease", "same"]] = None
+    # Изменение не меньше порога значимости (threshold) сравнения
+    significant: Optional[bool] = None
+    # Границы модуля изменения цены: в валюте и в процентах
+    min_abs_diff: Optional[float] = None
+    max_abs_diff: Optional[float] = None
+    min_percent: Optional[float] = None
+    max_percent: Optional[float] = None
+    # Границы новой цены (например, правило только для товаров дороже min_price)
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
 
 class FileInfo(BaseModel):
     id: Optional[str] = None
@@ -28,6 +90,7 @@ class PriceUpdate(BaseModel):
     new_price: float
     supplier_name: Optional[str] = None
     store_name: Optional[str] = None
+    store_article: Optional[str] = None  # Артикул в файле магазина (если отличается от артикула поставщика)
     
 class MatchedItem(BaseModel):
     article: str
@@ -37,6 +100,7 @@ class MatchedItem(BaseModel):
     price_diff_percent: float
     supplier_name: Optional[str] = None
     store_name: Optional[str] = None
+    store_article: Optional[str] = None
 
 class MissingInStoreItem(BaseModel):
     article: str
@@ -49,14 +113,68 @@ class MissingInSupplierItem(BaseModel):
     store_name: Optional[str] = None
 
 class ComparisonResult(BaseModel):
+    # Строки совпадений хранятся колонками (_columnar) и заполняются только для ответа JSON
     matches: List[Dict[str, Any]]
     missing_in_store: List[Dict[str, Any]]
     missing_in_supplier: List[Dict[str, Any]]
-    # Добавляем дополнительные поля для совместимости с фронтендом
-    matches_data: Optional[List[MatchedItem]] = None
+    # Совпадения в формате фронтенда: заполняется только в ответе /compare вместо matches
+    matches_data: Optional[List[Dict[str, Any]]] = None
+    # Идентификатор сохраненного результата для постраничного просмотра (/results/{result_id})
+    result_id: Optional[str] = None
+    matches_count: Optional[int] = None
+    # Статистика сравнения: повторяющиеся артикулы в файлах и примененная политика
+    statistics: Optional[Dict[str, Any]] = None
     total_items: Optional[int] = None
     items_only_in_file1: Optional[int] = None
     items_only_in_file2: Optional[int] = None
     mismatches: Optional[int] = None
     preview_data: Optional[List[Dict[str, Any]]] = None
-    column_mapping: Optional[Dict[str, str]] = None 
\ No newline at end of file
+    column_mapping: Optional[Dict[str, str]] = None
+    # Время этапов обработки запроса в секундах (загрузка и разбор каждого файла)
+    timings: Optional[Dict[str, float]] = None
+    # Колоночное представление результата (ComparisonTable), общее для кеша и хранилища результатов
+    _columnar: Any = PrivateAttr(default=None)
+
+class ComparisonPage(BaseModel):
+    """
+    Страница сохраненного результата сравнения
+    """
+    result_id: str
+    section: str
+    # Строк в разделе после фильтров
+    total: int
+    offset: int
+    limit: int
+    items: List[Dict[str, Any]]
+
+class StoreComparison(BaseModel):
+    """
+    Результат сравнения файла поставщика с одним файлом магазина
+    """
+    store_file: str
+    original_filename: str
+    status: str  # success или error
+    error: Optional[str] = None
+    result: Optional[ComparisonResult] = None
+
+class BestPriceResult(BaseModel):
+    """
+    Сравнение таблицы лучших цен нескольких поставщиков с прайс-листом магазина
+    """
+    suppliers: List[str]
+    # Лучшая цена по каждому артикулу: article, price, supplier, supplier_file, offers, min_price, max_price
+    best_prices: List[Dict[str, Any]]
+    # Сравнение лучших цен с магазином: supplier_price — лучшая цена, best_supplier — чье это предложение
+    comparison: ComparisonResult
+    summary: Dict[str, Any]
+    timings: Optional[Dict[str, float]] = None
+
+class MultiComparisonResult(BaseModel):
+    """
+    Результат сравнения одного файла поставщика с несколькими файлами магазинов
+    """
+    supplier_file: str
+    stores: List[StoreComparison]
+    # Сводка по всем магазинам: количество совпадений, расхождений и товаров без пары
+    summary: Dict[str, Any]
+    timings: Optional[Dict[str, float]] = None 
\ No newline at end of file
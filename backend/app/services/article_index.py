@@ -0,0 +1,188 @@
+import re
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.models.file import ArticleNormalization
+
+logger = logging.getLogger("app.services.article_index")
+
+# Целое число, записанное pandas как float: "123.0", "-5.00"
+FLOAT_SUFFIX_RE = r"^([+-]?\d+)\.0+$"
+
+def normalize_articles(articles: pd.Series, rules: Optional[ArticleNormalization] = None) -> pd.Series:
+    """
+    Приводит артикулы к ключам сопоставления по правилам из маппинга колонок
+
+    Пустые значения (NaN, пустые строки, строки только из разделителей) ключа не получают
+    и ни с чем не сопоставляются
+
+    Args:
+        articles: Колонка артикулов
+        rules: Правила нормализации (по умолчанию — ArticleNormalization())
+
+    Returns:
+        pd.Series: Ключи (строковый тип pandas) с тем же индексом, что и articles
+    """
+    rules = rules or ArticleNormalization()
+    keys = articles.astype("string").str.strip()
+
+    # Дробную часть убираем до удаления разделителей, иначе "123.0" превратится в "1230"
+    if rules.strip_float_suffix:
+        keys = keys.str.replace(FLOAT_SUFFIX_RE, r"\1", regex=True)
+    if rules.ignore_case:
+        keys = keys.str.upper()
+    if rules.separators:
+        keys = keys.str.replace(f"[{re.escape(rules.separators)}]", "", regex=True)
+    if rules.strip_leading_zeros:
+        keys = keys.str.replace(r"^0+(?=.)", "", regex=True)
+
+    return keys.mask(keys == "", pd.NA)
+
+# Какую строку (или строки) файла брать, если артикул в нем повторяется
+DUPLICATE_POLICIES = ("last", "first", "min", "max", "mean", "all")
+
+class ArticleIndex:
+    """
+    Индекс нормализованных артикулов одного файла.
+
+    Строится один раз на файл за один векторизованный проход: ключи всех строк
+    и группы строк по ключу (ключ -> позиции строк в порядке файла). Какая строка
+    представляет повторяющийся артикул при сопоставлении, задает политика повторов:
+    last (как при построении словаря строк по артикулу, по умолчанию), first,
+    min / max (строка с минимальной / максимальной ценой), mean (первая строка
+    со средней ценой группы) или all (все строки группы)
+    """
+
+    def __init__(
+        self,
+        articles: pd.Series,
+        rules: Optional[ArticleNormalization] = None,
+        prices: Optional[np.ndarray] = None,
+        policy: str = "last"
+    ):
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Неизвестная политика повторяющихся артикулов: {policy}")
+        if policy in ("min", "max", "mean") and prices is None:
+            raise ValueError(f"Для политики повторяющихся артикулов {policy} нужны цены строк")
+
+        self.rules = rules or ArticleNormalization()
+        self.policy = policy
+        self.keys = normalize_articles(articles.reset_index(drop=True), self.rules)
+
+        valid = self.keys.notna().to_numpy()
+        codes, uniques = pd.factorize(self.keys[valid])
+        counts = np.bincount(codes, minlength=len(uniques))
+
+        self._unique = pd.Index(np.asarray(uniques, dtype=object))
+        # Позиции строк, сгруппированные по ключу (внутри группы — в порядке файла)
+        self._group_rows = np.flatnonzero(valid)[np.argsort(codes, kind="stable")]
+        self._group_offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._counts = counts
+        self._positions, self._group_prices = self._representatives(prices)
+
+        self.empty_count = int((~valid).sum())
+        self.duplicate_count = int(valid.sum() - len(self._unique))
+        self.duplicate_keys = int((counts > 1).sum())
+
+        if self.empty_count or self.duplicate_count:
+            logger.info(
+                f"Индекс артикулов: {len(self._unique)} ключей, пустых артикулов: {self.empty_count}, "
+                f"повторов: {self.duplicate_count} строк в {self.duplicate_keys} артикулах (политика {policy})"
+            )
+
+    def _representatives(self, prices: Optional[np.ndarray]):
+        """
+        Строка-представитель каждой группы по политике повторов и, для mean, средняя цена группы
+        """
+        starts, ends = self._group_offsets[:-1], self._group_offsets[1:]
+        if self.policy == "first" or self.policy == "mean":
+            positions = self._group_rows[starts]
+        elif self.policy in ("min", "max"):
+            # Внутри группы строки упорядочиваются по цене (пустые цены — в конце), берется первая
+            group_prices = prices[self._group_rows]
+            sortable = np.where(np.isnan(group_prices), np.inf, group_prices if self.policy == "min" else -group_prices)
+            groups = np.repeat(np.arange(len(self._counts)), self._counts)
+            positions = self._group_rows[np.lexsort((sortable, groups))[starts]]
+        else:
+            # last и all: одиночный поиск возвращает последнюю строку группы
+            positions = self._group_rows[ends - 1]
+
+        if self.policy != "mean":
+            return positions, None
+
+        group_prices = prices[self._group_rows]
+        known = ~np.isnan(group_prices)
+        groups = np.repeat(np.arange(len(self._counts)), self._counts)
+        totals = np.bincount(groups, weights=np.where(known, group_prices, 0.0), minlength=len(self._counts))
+        known_counts = np.bincount(groups, weights=known, minlength=len(self._counts))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return positions, np.where(known_counts > 0, totals / known_counts, np.nan)
+
+    def __len__(self) -> int:
+        return len(self._unique)
+
+    @property
+    def unique_keys(self) -> np.ndarray:
+        """
+        Ключи индекса (по одному на артикул)
+        """
+        return self._unique.to_numpy()
+
+    @property
+    def positions(self) -> np.ndarray:
+        """
+        Позиции строк-представителей для unique_keys (по политике повторов)
+        """
+        return self._positions
+
+    def _groups(self, keys: pd.Series) -> np.ndarray:
+        if not len(self._unique):
+            return np.full(len(keys), -1)
+        return self._unique.get_indexer(keys.to_numpy(dtype=object))
+
+    def lookup(self, keys: pd.Series) -> np.ndarray:
+        """
+        Позиции строк для уже нормализованных ключей (-1, если ключа нет в индексе)
+        """
+        found = self._groups(keys)
+        if not len(self._unique):
+            return found
+        return np.where(found >= 0, self._positions[found], -1)
+
+    def join(self, keys: pd.Series) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Сопоставление ключей другого файла со строками индекса по политике повторов
+
+        Returns:
+            Tuple: номера строк ключей, номера строк индекса (пары совпадений; для политики all
+            строка ключей повторяется для каждой строки группы) и, для политики mean,
+            средние цены групп для каждой пары (иначе None)
+        """
+        found = self._groups(keys)
+        probe_rows = np.flatnonzero(found >= 0)
+        groups = found[probe_rows]
+
+        if self.policy == "all":
+            counts = self._counts[groups]
+            pair_groups = np.repeat(groups, counts)
+            # Номер строки внутри группы для каждой пары
+            within = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+            return np.repeat(probe_rows, counts), self._group_rows[self._group_offsets[pair_groups] + within], None
+
+        group_prices = self._group_prices[groups] if self._group_prices is not None else None
+        return probe_rows, self._positions[groups], group_prices
+
+    def lookup_articles(self, articles: pd.Series) -> np.ndarray:
+        """
+        Позиции строк для исходных артикулов (нормализуются правилами индекса)
+        """
+        return self.lookup(normalize_articles(articles, self.rules))
+
+    def contains(self, keys: pd.Series) -> np.ndarray:
+        """
+        Маска: есть ли ключ в индексе
+        """
+        return self._groups(keys) >= 0
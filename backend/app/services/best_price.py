@@ -0,0 +1,73 @@
+import logging
+from typing import List, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from app.models.file import BestPriceOptions
+
+if TYPE_CHECKING:
+    from app.services.comparison_service import PreparedPriceList
+
+logger = logging.getLogger("app.services.best_price")
+
+def aggregate_best_prices(
+    price_lists: List["PreparedPriceList"],
+    options: BestPriceOptions
+) -> pd.DataFrame:
+    """
+    Строит таблицу лучших цен по артикулам из прайс-листов нескольких поставщиков
+
+    Предложения всех поставщиков (по одному на артикул в каждом файле — последняя строка,
+    как в индексе артикулов) собираются в одну таблицу и группируются по нормализованному
+    ключу: статистика считается одним group-by, а поставщик для каждого ключа выбирается
+    одной сортировкой по (ключ, отклонение от цены артикула, порядок поставщика).
+    Предложения с нечисловой ценой не учитываются
+
+    Args:
+        price_lists: Подготовленные прайс-листы поставщиков (в порядке запроса)
+        options: Способ агрегации цены (min или median) и правило выбора при равенстве
+
+    Returns:
+        pd.DataFrame: Колонки key, article, name, price, supplier (номер файла поставщика),
+            supplier_price (цена выбранного поставщика), offers, min_price, max_price; по строке на артикул
+    """
+    frames = []
+    for order, price_list in enumerate(price_lists):
+        rows = price_list.index.positions
+        frames.append(pd.DataFrame({
+            "key": price_list.index.unique_keys,
+            "article": price_list.articles[rows],
+            "name": price_list.names[rows],
+            "supplier_price": price_list.prices[rows],
+            "supplier": np.full(len(rows), order, dtype=np.int64),
+        }))
+
+    offers = pd.concat(frames, ignore_index=True)
+    invalid = offers["supplier_price"].isna()
+    if invalid.any():
+        logger.warning(f"Предложения с нечисловой ценой не учитываются: {int(invalid.sum())}")
+        offers = offers[~invalid]
+
+    stats = offers.groupby("key", sort=False)["supplier_price"].agg(["count", "min", "max", "median"])
+    target = offers["key"].map(stats[options.aggregate])
+
+    # Для min выбирается самое дешевое предложение, для median — ближайшее к медиане;
+    # при равенстве решает порядок поставщика в запросе
+    offers = offers.assign(
+        distance=(offers["supplier_price"] - target).abs(),
+        rank=offers["supplier"] if options.tie_breaker == "first" else -offers["supplier"]
+    )
+    best = (
+        offers.sort_values(["key", "distance", "rank"], kind="stable")
+        .drop_duplicates("key", keep="first")
+        .join(stats, on="key")
+        .rename(columns={"count": "offers", "min": "min_price", "max": "max_price"})
+    )
+    best["price"] = best["median"] if options.aggregate == "median" else best["min_price"]
+
+    logger.info(
+        f"Таблица лучших цен: {len(best)} артикулов из {len(offers)} предложений {len(price_lists)} поставщиков, "
+        f"с несколькими предложениями: {int((best['offers'] > 1).sum())}"
+    )
+    return best[["key", "article", "name", "price", "supplier", "supplier_price", "offers", "min_price", "max_price"]].reset_index(drop=True)
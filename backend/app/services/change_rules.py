@@ -0,0 +1,97 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.models.file import ChangeRule
+
+logger = logging.getLogger("app.services.change_rules")
+
+UNCHANGED_LABEL = "без изменений"
+
+# Стандартная таблица правил: удаленные и новые товары, затем значимые повышения и понижения
+DEFAULT_CHANGE_RULES: List[ChangeRule] = [
+    ChangeRule(label="удален", status="removed"),
+    ChangeRule(label="новый", status="new"),
+    ChangeRule(label="повышение", status="existing", direction="increase", significant=True),
+    ChangeRule(label="понижение", status="existing", direction="decrease", significant=True),
+]
+
+def build_change_rules(extra_rules: Optional[List[ChangeRule]] = None) -> List[ChangeRule]:
+    """
+    Таблица правил: пользовательские правила проверяются раньше стандартных
+    """
+    return list(extra_rules or []) + DEFAULT_CHANGE_RULES
+
+def classify_changes(
+    price_original: pd.Series,
+    price_new: pd.Series,
+    price_diff: pd.Series,
+    price_diff_percent: pd.Series,
+    threshold: float,
+    rules: Optional[List[ChangeRule]] = None
+) -> pd.Categorical:
+    """
+    Тип изменения цены для каждой строки по таблице правил
+
+    Условия правил считаются над общими колонками (разница, модуль разницы в процентах,
+    статус товара), все правила вычисляются одним np.select в коды категорий;
+    строки, не подошедшие ни под одно правило, получают UNCHANGED_LABEL
+
+    Args:
+        price_original, price_new: Цены в исходной и новой версии (0 — товара нет)
+        price_diff, price_diff_percent: Разница цен и разница в процентах
+        threshold: Порог значимого изменения в процентах
+        rules: Таблица правил (по умолчанию DEFAULT_CHANGE_RULES)
+
+    Returns:
+        pd.Categorical: Метки правил (категории — в порядке таблицы правил)
+    """
+    rules = rules if rules is not None else DEFAULT_CHANGE_RULES
+    original = price_original.to_numpy(dtype=float)
+    new = price_new.to_numpy(dtype=float)
+
+    diff = price_diff.to_numpy(dtype=float)
+    abs_diff = np.abs(diff)
+    abs_percent = np.abs(price_diff_percent.to_numpy(dtype=float))
+    status = {
+        "new": np.isnan(original) | ((original == 0) & (new > 0)),
+        "removed": np.isnan(new) | ((new == 0) & (original > 0)),
+    }
+    status["existing"] = ~(status["new"] | status["removed"])
+    direction = {"increase": diff > 0, "decrease": diff < 0, "same": diff == 0}
+    significant = abs_percent >= threshold
+
+    conditions = []
+    for rule in rules:
+        mask = np.ones(len(original), dtype=bool)
+        if rule.status is not None:
+            mask &= status[rule.status]
+        if rule.direction is not None:
+            mask &= direction[rule.direction]
+        if rule.significant is not None:
+            mask &= significant if rule.significant else ~significant
+        for values, low, high in (
+            (abs_diff, rule.min_abs_diff, rule.max_abs_diff),
+            (abs_percent, rule.min_percent, rule.max_percent),
+            (new, rule.min_price, rule.max_price),
+        ):
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        conditions.append(mask)
+
+    # Одинаковые метки разных правил — одна категория
+    categories = list(dict.fromkeys([rule.label for rule in rules] + [UNCHANGED_LABEL]))
+    rule_codes = np.array([categories.index(rule.label) for rule in rules] + [categories.index(UNCHANGED_LABEL)])
+    codes = np.select(conditions, rule_codes[:-1], default=rule_codes[-1]) if conditions else np.full(len(original), rule_codes[-1])
+
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+def count_changes(change_types: pd.Categorical) -> Dict[str, int]:
+    """
+    Количество строк по каждому типу изменения (один проход value_counts)
+    """
+    return {label: int(count) for label, count in pd.Series(change_types).value_counts(sort=False).items()}
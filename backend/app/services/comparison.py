@@ -10,8 +10,13 @@ from app.services.file_service import (
     detect_encoding, 
     detect_separator,
     dataframe_to_bytes,
-    save_file
+    save_file,
+    get_content_hash
 )
+from app.services.row_fingerprints import get_row_fingerprints, diff_row_fingerprints
+from app.services.change_rules import UNCHANGED_LABEL, build_change_rules, classify_changes, count_changes
+from app.models.file import ChangeRule
+from app.core.deadline import Deadline, DeadlineExceeded, run_parallel
 
 logger = logging.getLogger("app.services.comparison")
 
@@ -21,10 +26,19 @@ def compare_files(
     id_column: str,
     price_column: str,
     quantity_column: Optional[str] = None,
-    threshold: float = 10.0
+    threshold: float = 10.0,
+    deadline: Optional[Deadline] = None,
+    include_unchanged: bool = True,
+    change_rules: Optional[List[ChangeRule]] = None
 ) -> dict:
     """
     Сравнивает цены в двух файлах и возвращает результаты сравнения.
+
+    С include_unchanged=False для каждой версии файла строится индекс отпечатков строк
+    (идентификатор -> хеш цены и количества), который кешируется по хешу содержимого.
+    Тогда объединяются и классифицируются только строки, отпечатки которых различаются,
+    поэтому ежедневное сравнение версий одного прайс-листа обрабатывает в основном
+    изменившиеся строки; товары без изменений учитываются только в статистике.
     
     Args:
         original_filename (str): Имя исходного файла
@@ -33,20 +47,31 @@ def compare_files(
         price_column (str): Название колонки с ценами
         quantity_column (Optional[str]): Название колонки с количеством (опционально)
         threshold (float): Пороговое значение для изменения цены в процентах
+        deadline (Optional[Deadline]): Бюджет времени запроса (общий для загрузки и разбора обоих файлов)
+        include_unchanged (bool): Объединять полные файлы, чтобы товары с неизменными ценой
+            и количеством тоже попали в файл результатов (по умолчанию, прежний вывод);
+            False — сравнивать только строки с различающимися отпечатками
+        change_rules (Optional[List[ChangeRule]]): Дополнительные правила классификации изменений
+            (проверяются раньше стандартных: удален, новый, повышение, понижение)
         
     Returns:
         dict: Результаты сравнения
     """
     start_time = time.time()
+    deadline = deadline or Deadline()
     
     logger.info(f"Начало сравнения файлов: {original_filename} и {new_filename}")
     logger.info(f"Параметры сравнения: id_column={id_column}, price_column={price_column}, "
                 f"quantity_column={quantity_column}, threshold={threshold}%")
     
     try:
-        # Получаем данные из файлов
-        original_content = get_file_content(original_filename)
-        new_content = get_file_content(new_filename)
+        # Получаем данные из файлов параллельно
+        contents, fetch_timings = run_parallel({
+            "original": lambda: get_file_content(original_filename, deadline),
+            "new": lambda: get_file_content(new_filename, deadline)
+        }, deadline, stage="fetch")
+        original_content = contents["original"]
+        new_content = contents["new"]
         
         if not original_content or not new_content:
             error_msg = f"Не удалось получить содержимое файлов: " \
@@ -65,9 +90,13 @@ def compare_files(
         original_separator = detect_separator(original_content, original_encoding)
         new_separator = detect_separator(new_content, new_encoding)
         
-        # Читаем данные
-        original_df = read_file(original_content, f".{original_ext}", original_encoding, original_separator)
-        new_df = read_file(new_content, f".{new_ext}", new_encoding, new_separator)
+        # Читаем данные параллельно
+        frames, parse_timings = run_parallel({
+            "original": lambda: read_file(original_content, f".{original_ext}", original_encoding, original_separator),
+            "new": lambda: read_file(new_content, f".{new_ext}", new_encoding, new_separator)
+        }, deadline, stage="parse")
+        original_df = frames["original"]
+        new_df = frames["new"]
         
         # Проверяем наличие необходимых колонок
         for df, name, cols in [
@@ -98,6 +127,27 @@ def compare_files(
                 df[quantity_column] = pd.to_numeric(df[quantity_column], errors='coerce')
                 df[quantity_column] = df[quantity_column].fillna(0)
         
+        deadline.enter("match", original_rows=len(original_df), new_rows=len(new_df))
+
+        if include_unchanged:
+            unchanged_skipped = 0
+        else:
+            # Отпечатки строк версий файлов: дальше обрабатываются только строки с разными отпечатками
+            original_fingerprints = get_row_fingerprints(
+                get_content_hash(original_filename, original_content), original_df, id_column,
+                [col for col in [price_column, quantity_column] if col and col in original_df.columns]
+            )
+            new_fingerprints = get_row_fingerprints(
+                get_content_hash(new_filename, new_content), new_df, id_column,
+                [col for col in [price_column, quantity_column] if col and col in new_df.columns]
+            )
+            diff = diff_row_fingerprints(original_fingerprints, new_fingerprints)
+            unchanged_skipped = diff["unchanged"]
+            logger.info(f"Отпечатки строк: без изменений {unchanged_skipped}, к сравнению: "
+                        f"{len(diff['original_rows'])} строк исходного и {len(diff['new_rows'])} строк нового файла")
+            original_df = original_df.iloc[diff["original_rows"]]
+            new_df = new_df.iloc[diff["new_rows"]]
+
         # Объединяем датафреймы по ID
         result_df = pd.merge(
             original_df, 
@@ -164,32 +214,35 @@ def compare_files(
         # Определяем значимые изменения
         result_df['significant_change'] = abs(result_df['price_diff_percent']) >= threshold
         
-        # Определяем тип изменения
-        result_df['change_type'] = 'без изменений'
-        
-        # Новые товары
-        mask_new = result_df['price_original'].isna() | ((result_df['price_original'] == 0) & (result_df['price_new'] > 0))
-        result_df.loc[mask_new, 'change_type'] = 'новый'
-        
-        # Удаленные товары
-        mask_deleted = result_df['price_new'].isna() | ((result_df['price_new'] == 0) & (result_df['price_original'] > 0))
-        result_df.loc[mask_deleted, 'change_type'] = 'удален'
-        
-        # Увеличение цены
-        mask_increased = (result_df['price_diff'] > 0) & (result_df['significant_change']) & (~mask_new) & (~mask_deleted)
-        result_df.loc[mask_increased, 'change_type'] = 'повышение'
-        
-        # Уменьшение цены
-        mask_decreased = (result_df['price_diff'] < 0) & (result_df['significant_change']) & (~mask_new) & (~mask_deleted)
-        result_df.loc[mask_decreased, 'change_type'] = 'понижение'
+        # Тип изменения: таблица правил вычисляется одним проходом в категориальную колонку
+        result_df['change_type'] = classify_changes(
+            result_df['price_original'],
+            result_df['price_new'],
+            result_df['price_diff'],
+            result_df['price_diff_percent'],
+            threshold,
+            build_change_rules(change_rules)
+        )
         
         # Подсчет статистики
-        total_products = len(result_df)
-        increased_count = len(result_df[result_df['change_type'] == 'повышение'])
-        decreased_count = len(result_df[result_df['change_type'] == 'понижение'])
-        new_count = len(result_df[result_df['change_type'] == 'новый'])
-        removed_count = len(result_df[result_df['change_type'] == 'удален'])
-        unchanged_count = len(result_df[result_df['change_type'] == 'без изменений'])
+        change_counts = count_changes(result_df['change_type'].array)
+        change_counts[UNCHANGED_LABEL] = change_counts.get(UNCHANGED_LABEL, 0) + unchanged_skipped
+        total_products = len(result_df) + unchanged_skipped
+        increased_count = change_counts.get('повышение', 0)
+        decreased_count = change_counts.get('понижение', 0)
+        new_count = change_counts.get('новый', 0)
+        removed_count = change_counts.get('удален', 0)
+        unchanged_count = change_counts[UNCHANGED_LABEL]
+
+        deadline.enter(
+            "serialize",
+            total_products=total_products,
+            increased_count=increased_count,
+            decreased_count=decreased_count,
+            new_count=new_count,
+            removed_count=removed_count,
+            unchanged_count=unchanged_count
+        )
         
         # Формируем имя файла с результатами
         timestamp = int(time.time())
@@ -213,7 +266,15 @@ def compare_files(
                 "new_count": new_count,
                 "removed_count": removed_count,
                 "unchanged_count": unchanged_count,
-                "execution_time": execution_time
+                # Количество по всем типам изменения, включая пользовательские правила
+                "change_counts": change_counts,
+                # Товары с совпадающими отпечатками строк: в файл результатов не попадают
+                "unchanged_skipped": unchanged_skipped,
+                "execution_time": execution_time,
+                "timings": {
+                    **{f"fetch_{name}": value for name, value in fetch_timings.items()},
+                    **{f"parse_{name}": value for name, value in parse_timings.items()}
+                }
             },
             "result_file": {
                 "filename": result_filename,
@@ -222,6 +283,10 @@ def compare_files(
         }
         
         return result
+    except DeadlineExceeded as e:
+        # Бюджет исчерпан: возвращаем то, что успели посчитать, вместо ошибки таймаута
+        logger.warning(f"Сравнение файлов прервано: {str(e)}")
+        return {"status": "partial", "error": str(e), "statistics": deadline.snapshot()}
     except Exception as e:
         logger.error(f"Ошибка при сравнении файлов: {str(e)}")
         logger.debug(traceback.format_exc())
@@ -233,7 +298,8 @@ def update_prices(
     price_column: str,
     id_column: str,
     selected_ids: List[str],
-    update_all: bool = False
+    update_all: bool = False,
+    deadline: Optional[Deadline] = None
 ) -> dict:
     """
     Обновляет цены в исходном файле на основе результатов сравнения
@@ -245,20 +311,26 @@ def update_prices(
         id_column (str): Название колонки с идентификаторами товаров
         selected_ids (List[str]): Список идентификаторов товаров для обновления
         update_all (bool): Флаг для обновления всех товаров
+        deadline (Optional[Deadline]): Бюджет времени запроса (общий для загрузки и разбора обоих файлов)
         
     Returns:
         dict: Результаты обновления
     """
     start_time = time.time()
+    deadline = deadline or Deadline()
     
     logger.info(f"Начало обновления цен в файле {original_filename}")
     logger.info(f"Параметры обновления: price_column={price_column}, id_column={id_column}, "
                 f"selected_ids={len(selected_ids) if selected_ids else 0}, update_all={update_all}")
     
     try:
-        # Получаем данные из файлов
-        original_content = get_file_content(original_filename)
-        comparison_content = get_file_content(comparison_result_filename)
+        # Получаем данные из файлов параллельно
+        contents, fetch_timings = run_parallel({
+            "original": lambda: get_file_content(original_filename, deadline),
+            "comparison": lambda: get_file_content(comparison_result_filename, deadline)
+        }, deadline, stage="fetch")
+        original_content = contents["original"]
+        comparison_content = contents["comparison"]
         
         if not original_content or not comparison_content:
             error_msg = f"Не удалось получить содержимое файлов: " \
@@ -276,9 +348,13 @@ def update_prices(
         original_separator = detect_separator(original_content, original_encoding)
         comparison_separator = detect_separator(comparison_content, comparison_encoding)
         
-        # Читаем данные
-        original_df = read_file(original_content, f".{original_ext}", original_encoding, original_separator)
-        comparison_df = read_file(comparison_content, ".csv", comparison_encoding, comparison_separator)
+        # Читаем данные параллельно
+        frames, parse_timings = run_parallel({
+            "original": lambda: read_file(original_content, f".{original_ext}", original_encoding, original_separator),
+            "comparison": lambda: read_file(comparison_content, ".csv", comparison_encoding, comparison_separator)
+        }, deadline, stage="parse")
+        original_df = frames["original"]
+        comparison_df = frames["comparison"]
         
         # Проверяем наличие необходимых колонок
         for df, name, cols in [
@@ -291,6 +367,8 @@ def update_prices(
                 logger.error(error_msg)
                 return {"error": error_msg}
         
+        deadline.enter("match", total_products=len(original_df))
+
         # Создаем копию оригинального датафрейма для обновления
         updated_df = original_df.copy()
         
@@ -305,19 +383,25 @@ def update_prices(
         else:
             # Обновляем только выбранные товары
             logger.info(f"Обновление выбранных товаров: {len(selected_ids)} шт.")
-            rows_to_update = comparison_result[comparison_result[id_column].isin(selected_ids)]
-        
-        # Создаем словарь для быстрого поиска новых цен
-        price_updates = dict(zip(rows_to_update[id_column], rows_to_update['price_new']))
-        
-        # Обновляем цены
-        updated_count = 0
-        for idx, row in updated_df.iterrows():
-            product_id = row[id_column]
-            if product_id in price_updates:
-                updated_df.at[idx, price_column] = price_updates[product_id]
-                updated_count += 1
-        
+            rows_to_update = comparison_result[comparison_result[id_column].isin(set(selected_ids or []))]
+        
+        # Новые цены по идентификатору (при повторах — последняя строка, как в словаре)
+        price_updates = rows_to_update.drop_duplicates(id_column, keep='last').set_index(id_column)['price_new']
+        
+        # Обновляем цены одним присваиванием по маске: новые цены сопоставляются по индексу,
+        # а колонка заранее приводится к общему с ними типу (например, int -> float)
+        update_mask = updated_df[id_column].isin(price_updates.index)
+        new_prices = updated_df[id_column].map(price_updates)
+        old_prices = updated_df[price_column]
+        changed_mask = update_mask & (old_prices != new_prices) & ~(old_prices.isna() & new_prices.isna())
+        if update_mask.any():
+            updated_df[price_column] = old_prices.astype(np.result_type(old_prices.dtype, new_prices.dtype))
+            updated_df.loc[update_mask, price_column] = new_prices[update_mask]
+        updated_count = int(update_mask.sum())
+        changed_count = int(changed_mask.sum())
+        
+        deadline.enter("serialize", updated_count=updated_count)
+
         # Формируем имя файла с результатами
         timestamp = int(time.time())
         result_filename = f"updated_{timestamp}_{original_filename}"
@@ -327,7 +411,8 @@ def update_prices(
         result_file_url = save_file(result_filename, result_content)
         
         execution_time = time.time() - start_time
-        logger.info(f"Обновление завершено за {execution_time:.2f} секунд. Обновлено {updated_count} товаров.")
+        logger.info(f"Обновление завершено за {execution_time:.2f} секунд. Обновлено {updated_count} товаров, "
+                    f"цена изменилась у {changed_count}.")
         
         # Формируем итоговый результат
         result = {
@@ -335,7 +420,13 @@ def update_prices(
             "statistics": {
                 "total_products": len(original_df),
                 "updated_count": updated_count,
-                "execution_time": execution_time
+                # Строки, в которых новая цена отличается от прежней
+                "changed_count": changed_count,
+                "execution_time": execution_time,
+                "timings": {
+                    **{f"fetch_{name}": value for name, value in fetch_timings.items()},
+                    **{f"parse_{name}": value for name, value in parse_timings.items()}
+                }
             },
             "result_file": {
                 "filename": result_filename,
@@ -344,6 +435,9 @@ def update_prices(
         }
         
         return result
+    except DeadlineExceeded as e:
+        logger.warning(f"Обновление цен прервано: {str(e)}")
+        return {"status": "partial", "error": str(e), "statistics": deadline.snapshot()}
     except Exception as e:
         logger.error(f"Ошибка при обновлении цен: {str(e)}")
         logger.debug(traceback.format_exc())
@@ -1,241 +1,740 @@
 import os
+import time
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
-from app.models.file import FileInfo, ComparisonResult
-from app.services.file_service import get_file_content, read_file, save_file
+from app.models.file import (
+    FileInfo,
+    ColumnMapping,
+    ArticleNormalization,
+    ComparisonResult,
+    ComparisonOptions,
+    StoreComparison,
+    MultiComparisonResult,
+    BestPriceOptions,
+    BestPriceResult,
+)
+from app.services.file_service import get_file_buffer, get_content_hash, read_file, save_file
+from app.services.result_cache import make_result_key, get_or_compute_result
+from app.services.result_store import (
+    SECTIONS, ComparisonTable, build_comparison_table, save_comparison_result, save_result_source, load_result_source,
+    get_comparison_table
+)
+from app.services.article_index import ArticleIndex
+from app.services.name_index import attach_name_candidates
+from app.services.best_price import aggregate_best_prices
 from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceeded, run_parallel
 import logging
 import traceback
 
 logger = logging.getLogger("app.services.comparison")
 
-def compare_files(supplier_file: FileInfo, store_file: FileInfo) -> ComparisonResult:
+def _parse_prices(values: pd.Series, strict: bool) -> np.ndarray:
+    """
+    Преобразует колонку цен в числа (NaN для значений, которые не удалось разобрать)
+
+    Запятая считается десятичным разделителем. Без strict из значения дополнительно
+    удаляются все символы, кроме цифр и точки ("1 200,50 руб." -> 1200.5)
+    """
+    prices = values.astype(str).str.replace(',', '.', regex=False).str.strip()
+    if not strict:
+        prices = prices.str.replace(r"[^0-9.]", "", regex=True)
+    return pd.to_numeric(prices, errors="coerce").to_numpy(dtype=float)
+
+def _optional_column(df: pd.DataFrame, column: Optional[str]) -> np.ndarray:
+    """
+    Значения необязательной колонки (наименования) с None вместо пропусков
+    """
+    if not column or column not in df.columns:
+        return np.full(len(df), None, dtype=object)
+    values = df[column]
+    return values.astype(object).where(values.notna(), None).to_numpy()
+
+def _missing_items(
+    mask: np.ndarray,
+    articles: np.ndarray,
+    prices: np.ndarray,
+    names: np.ndarray,
+    price_field: str,
+    name_field: str,
+    source: str,
+    extra_columns: Optional[Dict[str, np.ndarray]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Строки без пары в другом файле (строки с нечисловой ценой пропускаются)
+    """
+    rows = np.flatnonzero(mask)
+    invalid = np.isnan(prices[rows])
+    if invalid.any():
+        logger.warning(f"Ошибка конвертации цены {source} для {int(invalid.sum())} артикулов, они пропущены")
+        rows = rows[~invalid]
+
+    items = [
+        {"article": article, price_field: price, name_field: name}
+        for article, price, name in zip(articles[rows].tolist(), prices[rows].tolist(), names[rows].tolist())
+    ]
+    _attach_columns(items, extra_columns, rows)
+    return items
+
+def _attach_columns(items: List[Dict[str, Any]], columns: Optional[Dict[str, np.ndarray]], rows: np.ndarray) -> None:
+    """
+    Добавляет строкам результата дополнительные поля из колонок подготовленного прайс-листа
+    """
+    for field, values in (columns or {}).items():
+        for item, value in zip(items, values[rows].tolist()):
+            item[field] = value
+
+def _file_signature(file_info: FileInfo) -> Dict[str, Any]:
+    """
+    Параметры файла, влияющие на результат сравнения (кроме самого содержимого)
+    """
+    return {
+        "extension": os.path.splitext(file_info.stored_filename)[1].lower(),
+        "encoding": file_info.encoding,
+        "separator": file_info.separator,
+        "column_mapping": file_info.column_mapping.model_dump() if file_info.column_mapping else None
+    }
+
+def compare_files(
+    supplier_file: FileInfo,
+    store_file: FileInfo,
+    deadline: Optional[Deadline] = None,
+    options: Optional[ComparisonOptions] = None
+) -> ComparisonResult:
     """
     Сравнение прайс-листов поставщика и магазина
+
+    Оба файла загружаются (а при промахе кеша результатов и разбираются) параллельно
+    в пределах общего бюджета времени запроса. Результат кешируется по хешам содержимого
+    обоих файлов, их маппингам колонок и параметрам сравнения, поэтому повторное
+    сравнение той же пары возвращается из кеша
     """
+    deadline = deadline or Deadline()
+    options = options or ComparisonOptions()
     logger.info(f"Начало сравнения файлов: {supplier_file.stored_filename} и {store_file.stored_filename}")
     
-    # Получаем содержимое файлов
-    logger.info(f"Получение содержимого файла поставщика: {supplier_file.stored_filename}")
-    supplier_content = get_file_content(supplier_file.stored_filename)
-    
-    logger.info(f"Получение содержимого файла магазина: {store_file.stored_filename}")
-    store_content = get_file_content(store_file.stored_filename)
+    # Получаем содержимое файлов параллельно
+    logger.info(f"Получение содержимого файлов: поставщик - {supplier_file.stored_filename}, магазин - {store_file.stored_filename}")
+    contents, fetch_timings = run_parallel({
+        "supplier": lambda: get_file_buffer(supplier_file.stored_filename, deadline),
+        "store": lambda: get_file_buffer(store_file.stored_filename, deadline)
+    }, deadline, stage="fetch")
+    supplier_content = contents["supplier"]
+    store_content = contents["store"]
     
     if not supplier_content or not store_content:
         raise ValueError("Не удалось получить содержимое файлов")
     
     logger.info(f"Оба файла успешно загружены: {supplier_file.stored_filename} ({len(supplier_content)} байт) и {store_file.stored_filename} ({len(store_content)} байт)")
-    
-    # Определяем расширения файлов
-    supplier_extension = os.path.splitext(supplier_file.stored_filename)[1]
-    store_extension = os.path.splitext(store_file.stored_filename)[1]
-    
-    logger.info(f"Расширения файлов: поставщик - {supplier_extension}, магазин - {store_extension}")
-    
-    try:
-        # Чтение файлов
-        logger.info(f"Чтение файла поставщика с кодировкой {supplier_file.encoding}, разделителем '{supplier_file.separator}'")
-        supplier_df = read_file(
-            supplier_content,
-            supplier_extension, 
-            supplier_file.encoding, 
-            supplier_file.separator
-        )
-        
-        logger.info(f"Чтение файла магазина с кодировкой {store_file.encoding}, разделителем '{store_file.separator}'")
-        store_df = read_file(
-            store_content,
-            store_extension, 
-            store_file.encoding, 
-            store_file.separator
+
+    cache_key = make_result_key(
+        "compare_files",
+        get_content_hash(supplier_file.stored_filename, supplier_content),
+        get_content_hash(store_file.stored_filename, store_content),
+        _file_signature(supplier_file),
+        _file_signature(store_file),
+        options.model_dump()
+    )
+
+    # Время разбора заполняется только если результат вычислялся, а не взят из кеша
+    timings = {f"fetch_{name}": value for name, value in fetch_timings.items()}
+    result = get_or_compute_result(
+        cache_key,
+        lambda: _compare_contents(supplier_file, store_file, supplier_content, store_content, deadline, timings, options)
+    )
+    # Колоночная копия результата сохраняется для постраничного просмотра под ключом кеша
+    result_id = save_comparison_result(cache_key, result)
+    save_result_source(result_id, _pair_source(supplier_file, store_file, options), result._columnar.created_at)
+    timings["total"] = deadline.elapsed()
+    return result.model_copy(update={"timings": timings, "result_id": result_id})
+
+def _pair_source(supplier_file: FileInfo, store_file: FileInfo, options: ComparisonOptions) -> Dict[str, Any]:
+    """
+    Источник результата сравнения пары файлов (см. restore_comparison_table)
+    """
+    return {
+        "kind": "compare_files",
+        "supplier_file": supplier_file.model_dump(mode="json"),
+        "store_file": store_file.model_dump(mode="json"),
+        "options": options.model_dump(mode="json"),
+    }
+
+def restore_comparison_table(result_id: str, deadline: Optional[Deadline] = None) -> Optional[ComparisonTable]:
+    """
+    Восстанавливает сохраненный результат, которого нет в хранилище результатов процесса
+    (запрос попал в другой экземпляр приложения или результат вытеснен), повторным
+    сравнением по источнику из хранилища
+
+    Returns:
+        Optional[ComparisonTable]: Результат или None, если источника нет или файлы
+            изменились (сравнение дало другой идентификатор)
+    """
+    source = load_result_source(result_id)
+    if source is None:
+        return None
+
+    logger.info(f"Результат {result_id[:12]} не найден в памяти процесса, восстанавливаем по источнику ({source['kind']})")
+    options = ComparisonOptions(**source["options"])
+    if source["kind"] == "compare_best_prices":
+        restored = compare_best_prices(
+            [FileInfo(**file_info) for file_info in source["supplier_files"]],
+            FileInfo(**source["store_file"]),
+            deadline,
+            options,
+            BestPriceOptions(**source["best_price_options"])
+        ).comparison
+    else:
+        restored = compare_files(FileInfo(**source["supplier_file"]), FileInfo(**source["store_file"]), deadline, options)
+
+    if restored.result_id != result_id:
+        logger.warning(f"Результат {result_id[:12]} не восстановлен: файлы сравнения изменились")
+        return None
+    # Результат, не поместившийся в хранилище, отдается из колонок самого результата;
+    # время результата — время исходного сравнения, а не восстановления
+    table = result_table(restored)
+    if source.get("created_at") is not None:
+        table.created_at = source["created_at"]
+    return table
+
+def compare_many(
+    supplier_file: FileInfo,
+    store_files: List[FileInfo],
+    deadline: Optional[Deadline] = None,
+    options: Optional[ComparisonOptions] = None
+) -> MultiComparisonResult:
+    """
+    Сравнение одного прайс-листа поставщика с несколькими прайс-листами магазинов за один проход
+
+    Файл поставщика загружается, разбирается и индексируется один раз, а файлы магазинов
+    обрабатываются параллельно по мере загрузки и сопоставляются с готовым индексом.
+    Результат для каждой пары кешируется так же, как в compare_files (кеш общий), поэтому
+    файл поставщика разбирается, только если хотя бы одной пары нет в кеше.
+    Ошибка в файле магазина не прерывает сравнение с остальными магазинами
+    """
+    deadline = deadline or Deadline()
+    options = options or ComparisonOptions()
+    logger.info(f"Начало сравнения файла поставщика {supplier_file.stored_filename} с {len(store_files)} файлами магазинов")
+
+    deadline.enter("fetch")
+    started = time.monotonic()
+    supplier_content = get_file_buffer(supplier_file.stored_filename, deadline)
+    if not supplier_content:
+        raise ValueError(f"Не удалось получить содержимое файла поставщика {supplier_file.stored_filename}")
+    timings = {"fetch_supplier": time.monotonic() - started}
+    supplier_hash = get_content_hash(supplier_file.stored_filename, supplier_content)
+
+    # Файл поставщика подготавливается при первом промахе кеша и затем используется всеми магазинами
+    supplier_lock = threading.Lock()
+    prepared: Dict[str, Any] = {}
+
+    def prepare_supplier() -> PreparedPriceList:
+        with supplier_lock:
+            if "error" in prepared:
+                raise prepared["error"]
+            if "supplier" not in prepared:
+                started = time.monotonic()
+                try:
+                    df = _read_price_list(supplier_file, supplier_content)
+                    missing_cols = _missing_columns(supplier_file, df, "поставщика")
+                    if missing_cols:
+                        raise ValueError(f"Ошибка сопоставления колонок: {', '.join(missing_cols)}")
+                    prepared["supplier"] = PreparedPriceList(supplier_file.column_mapping, df)
+                except Exception as e:
+                    prepared["error"] = e
+                    raise
+                timings["parse_supplier"] = time.monotonic() - started
+                logger.info(f"Файл поставщика подготовлен: {len(df)} строк, {timings['parse_supplier']:.3f}с")
+        return prepared["supplier"]
+
+    def compare_store(store_file: FileInfo) -> StoreComparison:
+        store_timings: Dict[str, float] = {}
+        try:
+            started = time.monotonic()
+            store_content = get_file_buffer(store_file.stored_filename, deadline)
+            store_timings["fetch_store"] = time.monotonic() - started
+            if not store_content:
+                raise ValueError(f"Не удалось получить содержимое файла {store_file.stored_filename}")
+
+            def compute() -> ComparisonResult:
+                supplier = prepare_supplier()
+                started = time.monotonic()
+                store_df = _read_price_list(store_file, store_content)
+                missing_cols = _missing_columns(store_file, store_df, "магазина")
+                if missing_cols:
+                    raise ValueError(f"Ошибка сопоставления колонок: {', '.join(missing_cols)}")
+                store = PreparedPriceList(store_file.column_mapping, store_df, duplicate_policy=options.duplicate_policy)
+                store_timings["parse_store"] = time.monotonic() - started
+                return _match_price_lists(supplier, store, deadline, store_timings, options)
+
+            cache_key = make_result_key(
+                "compare_files",
+                supplier_hash,
+                get_content_hash(store_file.stored_filename, store_content),
+                _file_signature(supplier_file),
+                _file_signature(store_file),
+                options.model_dump()
+            )
+            result = get_or_compute_result(cache_key, compute)
+            result_id = save_comparison_result(cache_key, result)
+            save_result_source(result_id, _pair_source(supplier_file, store_file, options), result._columnar.created_at)
+            return StoreComparison(
+                store_file=store_file.stored_filename,
+                original_filename=store_file.original_filename,
+                status="success",
+                result=result.model_copy(update={"timings": store_timings, "result_id": result_id})
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if "error" in prepared:
+                raise
+            logger.error(f"Ошибка при сравнении с файлом магазина {store_file.stored_filename}: {str(e)}")
+            logger.debug(traceback.format_exc())
+            return StoreComparison(
+                store_file=store_file.stored_filename,
+                original_filename=store_file.original_filename,
+                status="error",
+                error=str(e)
+            )
+
+    stores, store_timings = run_parallel(
+        {f"store_{position}": (lambda store_file=store_file: compare_store(store_file)) for position, store_file in enumerate(store_files)},
+        deadline,
+        stage="compare_stores"
+    )
+    timings["compare_stores"] = max(store_timings.values(), default=0.0)
+
+    results = [stores[f"store_{position}"] for position in range(len(store_files))]
+    summary = _summarize_stores(results)
+    timings["total"] = deadline.elapsed()
+    logger.info(
+        f"Сравнение с {len(store_files)} магазинами завершено: успешно {summary['stores_succeeded']}, "
+        f"с ошибками {summary['stores_failed']}, совпадений {summary['matches']}"
+    )
+    return MultiComparisonResult(
+        supplier_file=supplier_file.stored_filename,
+        stores=results,
+        summary=summary,
+        timings=timings
+    )
+
+def result_table(result: ComparisonResult) -> ComparisonTable:
+    """
+    Колоночный результат сравнения: из самого результата или из хранилища результатов
+    """
+    table = result._columnar if result._columnar is not None else get_comparison_table(result.result_id or "")
+    if table is None:
+        # Результат без колонок (например, восстановленный из JSON): строки уже в matches
+        table = build_comparison_table({section: getattr(result, section) for section in SECTIONS})
+        result._columnar = table
+    return table
+
+def with_match_rows(result: ComparisonResult, limit: Optional[int] = None) -> ComparisonResult:
+    """
+    Копия результата со строками совпадений в matches (первые limit строк) — для ответа JSON
+    """
+    return result.model_copy(update={"matches": result_table(result).records("matches", limit=limit)})
+
+def _summarize_stores(stores: List[StoreComparison]) -> Dict[str, Any]:
+    """
+    Сводка по результатам сравнения поставщика с несколькими магазинами
+    """
+    succeeded = [store.result for store in stores if store.status == "success"]
+    matched_anywhere = set()
+    missing_everywhere: Optional[set] = None
+    summary = {
+        "stores_total": len(stores),
+        "stores_succeeded": len(succeeded),
+        "stores_failed": len(stores) - len(succeeded),
+        "matches": 0,
+        "missing_in_store": 0,
+        "missing_in_supplier": 0,
+        "supplier_cheaper": 0,
+        "supplier_more_expensive": 0,
+    }
+
+    for result in succeeded:
+        matches = result_table(result).sections["matches"]
+        summary["matches"] += len(matches)
+        summary["missing_in_store"] += len(result.missing_in_store)
+        summary["missing_in_supplier"] += len(result.missing_in_supplier)
+        matched_anywhere.update(matches["article"].tolist())
+        summary["supplier_cheaper"] += int((matches["price_diff"] < 0).sum())
+        summary["supplier_more_expensive"] += int((matches["price_diff"] > 0).sum())
+        missing = {item["article"] for item in result.missing_in_store}
+        missing_everywhere = missing if missing_everywhere is None else missing_everywhere & missing
+
+    # Артикулы поставщика, найденные хотя бы в одном магазине, и не найденные ни в одном
+    summary["supplier_articles_matched"] = len(matched_anywhere)
+    summary["supplier_articles_missing_everywhere"] = len(missing_everywhere or ())
+    return summary
+
+# Ключи таблицы лучших цен уже нормализованы правилами своих поставщиков
+IDENTITY_NORMALIZATION = ArticleNormalization(
+    ignore_case=False,
+    separators="",
+    strip_leading_zeros=False,
+    strip_float_suffix=False
+)
+
+def compare_best_prices(
+    supplier_files: List[FileInfo],
+    store_file: FileInfo,
+    deadline: Optional[Deadline] = None,
+    options: Optional[ComparisonOptions] = None,
+    best_price_options: Optional[BestPriceOptions] = None
+) -> BestPriceResult:
+    """
+    Сравнение лучших цен нескольких поставщиков с прайс-листом магазина в одной задаче
+
+    Все файлы загружаются и разбираются параллельно, по прайс-листам поставщиков строится
+    таблица лучших цен (минимум или медиана по артикулу с указанием поставщика), которая
+    затем сопоставляется с магазином как обычный прайс-лист поставщика. Результат кешируется
+    по хешам содержимого всех файлов, маппингам и параметрам
+    """
+    deadline = deadline or Deadline()
+    options = options or ComparisonOptions()
+    best_price_options = best_price_options or BestPriceOptions()
+    logger.info(f"Начало сравнения лучших цен {len(supplier_files)} поставщиков с магазином {store_file.stored_filename}")
+
+    files = {f"supplier_{position}": supplier_file for position, supplier_file in enumerate(supplier_files)}
+    files["store"] = store_file
+    contents, fetch_timings = run_parallel({
+        name: (lambda file_info=file_info: get_file_buffer(file_info.stored_filename, deadline))
+        for name, file_info in files.items()
+    }, deadline, stage="fetch")
+
+    not_loaded = [files[name].stored_filename for name, content in contents.items() if not content]
+    if not_loaded:
+        raise ValueError(f"Не удалось получить содержимое файлов: {', '.join(not_loaded)}")
+
+    cache_key = make_result_key(
+        "compare_best_prices",
+        [
+            [get_content_hash(files[name].stored_filename, contents[name]), _file_signature(files[name])]
+            for name in files
+        ],
+        options.model_dump(),
+        best_price_options.model_dump()
+    )
+
+    timings = {f"fetch_{name}": value for name, value in fetch_timings.items()}
+    result = get_or_compute_result(
+        cache_key,
+        lambda: _compare_best_prices(supplier_files, store_file, files, contents, deadline, timings, options, best_price_options)
+    )
+    result_id = save_comparison_result(cache_key, result.comparison)
+    save_result_source(result_id, {
+        "kind": "compare_best_prices",
+        "supplier_files": [supplier_file.model_dump(mode="json") for supplier_file in supplier_files],
+        "store_file": store_file.model_dump(mode="json"),
+        "options": options.model_dump(mode="json"),
+        "best_price_options": best_price_options.model_dump(mode="json"),
+    }, result.comparison._columnar.created_at)
+    timings["total"] = deadline.elapsed()
+    return result.model_copy(update={
+        "timings": timings,
+        "comparison": result.comparison.model_copy(update={"result_id": result_id})
+    })
+
+def _compare_best_prices(
+    supplier_files: List[FileInfo],
+    store_file: FileInfo,
+    files: Dict[str, FileInfo],
+    contents: Dict[str, Any],
+    deadline: Deadline,
+    timings: Dict[str, float],
+    options: ComparisonOptions,
+    best_price_options: BestPriceOptions
+) -> BestPriceResult:
+    """
+    Построение таблицы лучших цен по уже загруженным файлам и ее сравнение с магазином
+    """
+    def prepare(name: str) -> PreparedPriceList:
+        file_info = files[name]
+        df = _read_price_list(file_info, contents[name])
+        source = "магазина" if name == "store" else f"поставщика {file_info.original_filename}"
+        missing_cols = _missing_columns(file_info, df, source)
+        if missing_cols:
+            raise ValueError(f"Ошибка сопоставления колонок: {', '.join(missing_cols)}")
+        if name == "store":
+            return PreparedPriceList(file_info.column_mapping, df, duplicate_policy=options.duplicate_policy)
+        return PreparedPriceList(file_info.column_mapping, df)
+
+    prepared, parse_timings = run_parallel(
+        {name: (lambda name=name: prepare(name)) for name in files},
+        deadline,
+        stage="parse"
+    )
+    timings.update({f"parse_{name}": value for name, value in parse_timings.items()})
+
+    deadline.enter("aggregate", suppliers=len(supplier_files))
+    best = aggregate_best_prices(
+        [prepared[f"supplier_{position}"] for position in range(len(supplier_files))],
+        best_price_options
+    )
+    supplier_names = pd.Series([supplier_file.original_filename for supplier_file in supplier_files])
+    supplier_stored = pd.Series([supplier_file.stored_filename for supplier_file in supplier_files])
+    best["supplier_name"] = supplier_names.to_numpy()[best["supplier"].to_numpy()]
+    best["supplier_file"] = supplier_stored.to_numpy()[best["supplier"].to_numpy()]
+
+    # Таблица лучших цен сопоставляется с магазином как прайс-лист одного поставщика
+    best_prices = PreparedPriceList(
+        ColumnMapping(article_column="article", price_column="price", name_column="name"),
+        best,
+        index=ArticleIndex(best["key"], IDENTITY_NORMALIZATION)
+    )
+    best_prices.extra_columns = {
+        "best_supplier": best["supplier_name"].to_numpy(dtype=object),
+        "best_supplier_file": best["supplier_file"].to_numpy(dtype=object),
+        "offers": best["offers"].to_numpy(),
+    }
+
+    deadline.enter("match", best_prices=len(best), store_rows=prepared["store"].rows)
+    comparison = _match_price_lists(best_prices, prepared["store"], deadline, timings, options)
+
+    wins = best["supplier_name"].value_counts()
+    summary = {
+        "suppliers": len(supplier_files),
+        "articles": len(best),
+        "articles_with_several_offers": int((best["offers"] > 1).sum()),
+        "aggregate": best_price_options.aggregate,
+        "best_offers_by_supplier": {name: int(wins.get(name, 0)) for name in supplier_names},
+        "matches": comparison.matches_count,
+        "missing_in_store": len(comparison.missing_in_store),
+        "missing_in_supplier": len(comparison.missing_in_supplier),
+    }
+
+    records = best[["article", "price", "supplier_name", "supplier_file", "supplier_price", "offers", "min_price", "max_price"]]
+    return BestPriceResult(
+        suppliers=[supplier_file.stored_filename for supplier_file in supplier_files],
+        best_prices=records.rename(columns={"supplier_name": "supplier"}).to_dict("records"),
+        comparison=comparison,
+        summary=summary
+    )
+
+class PreparedPriceList:
+    """
+    Прайс-лист, подготовленный к сопоставлению: индекс нормализованных артикулов,
+    исходные артикулы, наименования и разобранные цены.
+
+    Подготавливается один раз на файл, поэтому один файл поставщика можно сопоставить
+    с несколькими файлами магазинов без повторного разбора и индексации
+    """
+
+    def __init__(
+        self,
+        mapping: ColumnMapping,
+        df: pd.DataFrame,
+        index: Optional[ArticleIndex] = None,
+        duplicate_policy: str = "last"
+    ):
+        self.rows = len(df)
+        # Исходные артикулы (в виде строк) возвращаются в результате без изменений
+        self.articles = df[mapping.article_column].astype(str).to_numpy()
+        self.names = _optional_column(df, mapping.name_column)
+        # Цены совпавших товаров: нечисловые символы отбрасываются; цены товаров без пары — только запятая -> точка
+        self.prices = _parse_prices(df[mapping.price_column], strict=False)
+        self.strict_prices = _parse_prices(df[mapping.price_column], strict=True)
+        self.index = index or ArticleIndex(
+            df[mapping.article_column], mapping.article_normalization, prices=self.prices, policy=duplicate_policy
         )
+        # Дополнительные поля строк поставщика в результате (например, чье это предложение)
+        self.extra_columns: Dict[str, np.ndarray] = {}
+
+def _missing_columns(file_info: FileInfo, df: pd.DataFrame, source: str) -> List[str]:
+    """
+    Обязательные колонки маппинга (артикул и цена), которых нет в файле
+    """
+    mapping = file_info.column_mapping
+    logger.info(f"Используемые колонки - {source}: артикул='{mapping.article_column}', цена='{mapping.price_column}', наименование='{mapping.name_column}'")
+    return [
+        f"колонка '{col_name}' отсутствует в файле {source}"
+        for col_name in [mapping.article_column, mapping.price_column]
+        if col_name not in df.columns
+    ]
+
+def _read_price_list(file_info: FileInfo, content) -> pd.DataFrame:
+    """
+    Разбор содержимого прайс-листа в DataFrame
+    """
+    extension = os.path.splitext(file_info.stored_filename)[1]
+    logger.info(f"Чтение файла {file_info.stored_filename} с кодировкой {file_info.encoding}, разделителем '{file_info.separator}'")
+    return read_file(content, extension, file_info.encoding, file_info.separator)
+
+def _compare_contents(
+    supplier_file: FileInfo,
+    store_file: FileInfo,
+    supplier_content,
+    store_content,
+    deadline: Deadline,
+    timings: Dict[str, float],
+    options: ComparisonOptions
+) -> ComparisonResult:
+    """
+    Сравнение уже полученного содержимого прайс-листов поставщика и магазина
+    """
+    try:
+        # Чтение файлов (параллельно, в пределах бюджета времени запроса)
+        frames, parse_timings = run_parallel({
+            "supplier": lambda: _read_price_list(supplier_file, supplier_content),
+            "store": lambda: _read_price_list(store_file, store_content)
+        }, deadline, stage="parse")
+        supplier_df = frames["supplier"]
+        store_df = frames["store"]
+        timings.update({f"parse_{name}": value for name, value in parse_timings.items()})
         
         logger.info(f"Файлы успешно прочитаны. Размеры: поставщик - {len(supplier_df)} строк, магазин - {len(store_df)} строк")
         
         # Логируем информацию о колонках
         logger.info(f"Колонки файла поставщика: {', '.join(supplier_df.columns.tolist())}")
         logger.info(f"Колонки файла магазина: {', '.join(store_df.columns.tolist())}")
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"ОШИБКА при чтении файлов: {str(e)}")
         logger.error(f"Трассировка: {traceback.format_exc()}")
         raise ValueError(f"Ошибка при обработке файлов: {str(e)}")
     
-    # Получение имен колонок с артикулами и ценами
-    supplier_article_col = supplier_file.column_mapping.article_column
-    supplier_price_col = supplier_file.column_mapping.price_column
-    supplier_name_col = supplier_file.column_mapping.name_column
-    
-    store_article_col = store_file.column_mapping.article_column
-    store_price_col = store_file.column_mapping.price_column
-    store_name_col = store_file.column_mapping.name_column
-    
-    logger.info(f"Используемые колонки - Поставщик: артикул='{supplier_article_col}', цена='{supplier_price_col}', наименование='{supplier_name_col}'")
-    logger.info(f"Используемые колонки - Магазин: артикул='{store_article_col}', цена='{store_price_col}', наименование='{store_name_col}'")
-    
     # Проверка существования колонок
-    missing_cols = []
-    for col_name in [supplier_article_col, supplier_price_col]:
-        if col_name not in supplier_df.columns:
-            missing_cols.append(f"колонка '{col_name}' отсутствует в файле поставщика")
-    
-    for col_name in [store_article_col, store_price_col]:
-        if col_name not in store_df.columns:
-            missing_cols.append(f"колонка '{col_name}' отсутствует в файле магазина")
-    
+    missing_cols = _missing_columns(supplier_file, supplier_df, "поставщика") + _missing_columns(store_file, store_df, "магазина")
     if missing_cols:
         error_message = f"Ошибка сопоставления колонок: {', '.join(missing_cols)}"
         logger.error(error_message)
         raise ValueError(error_message)
     
-    # Сопоставление по артикулам
-    # Преобразуем артикулы в строки для соответствия
-    logger.info("Преобразование артикулов в строки для корректного сравнения")
-    supplier_df[supplier_article_col] = supplier_df[supplier_article_col].astype(str)
-    store_df[store_article_col] = store_df[store_article_col].astype(str)
-    
-    # Результаты сравнения
-    matches = []
-    missing_in_store = []
-    missing_in_supplier = []
-    
-    # Создаем словарь артикулов магазина для быстрого поиска
-    logger.info("Создание словаря артикулов магазина для оптимизации поиска")
-    store_articles_dict = {}
-    for _, store_row in store_df.iterrows():
-        store_article = store_row[store_article_col]
-        store_articles_dict[store_article] = store_row
-    
-    # Поиск совпадающих артикулов
-    logger.info("Начало сопоставления товаров по артикулам")
-    
-    match_count = 0
-    missing_in_store_count = 0
-    
-    for idx, (_, supplier_row_data) in enumerate(supplier_df.iterrows()):
-        if idx % 1000 == 0 and idx > 0:
-            logger.info(f"Обработано {idx} товаров поставщика. Найдено совпадений: {match_count}, отсутствуют в магазине: {missing_in_store_count}")
-        
-        supplier_article = supplier_row_data[supplier_article_col]
-        supplier_price = supplier_row_data[supplier_price_col]
-        supplier_name = supplier_row_data.get(supplier_name_col) if supplier_name_col else None
-        
-        # Проверка наличия артикула в словаре магазина
-        if supplier_article in store_articles_dict:
-            store_row = store_articles_dict[supplier_article]
-            store_price = store_row[store_price_col]
-            store_name = store_row.get(store_name_col) if store_name_col else None
-            
-            # Проверка на числовые значения цен
-            try:
-                # Очистка и преобразование строк цен в числа
-                supplier_price_str = str(supplier_price).replace(',', '.').strip()
-                store_price_str = str(store_price).replace(',', '.').strip()
-                
-                # Удаление нечисловых символов (кроме точки)
-                supplier_price_str = ''.join(c for c in supplier_price_str if c.isdigit() or c == '.')
-                store_price_str = ''.join(c for c in store_price_str if c.isdigit() or c == '.')
-                
-                supplier_price_float = float(supplier_price_str)
-                store_price_float = float(store_price_str)
-                
-                price_diff = supplier_price_float - store_price_float
-                
-                # Вычисление разницы в процентах с обработкой деления на ноль
-                if store_price_float != 0:
-                    price_diff_percent = price_diff / store_price_float * 100
-                else:
-                    # Если цена в магазине равна нулю, но цена поставщика не нулевая
-                    if supplier_price_float > 0:
-                        price_diff_percent = 100  # 100% разница (считаем как полное увеличение)
-                    else:
-                        price_diff_percent = 0
-                    logger.warning(f"Нулевая цена в магазине для артикула {supplier_article}, процентная разница установлена в {price_diff_percent}")
-                
-                matches.append({
-                    "article": supplier_article,
-                    "supplier_price": supplier_price_float,
-                    "store_price": store_price_float,
-                    "price_diff": price_diff,
-                    "price_diff_percent": price_diff_percent,
-                    "supplier_name": supplier_name,
-                    "store_name": store_name,
-                })
-                
-                match_count += 1
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Ошибка конвертации цен для артикула {supplier_article}: {str(e)}. Поставщик: '{supplier_price}', Магазин: '{store_price}'")
-        else:
-            try:
-                missing_in_store.append({
-                    "article": supplier_article,
-                    "supplier_price": float(str(supplier_price).replace(',', '.').strip()),
-                    "supplier_name": supplier_name,
-                })
-                missing_in_store_count += 1
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Ошибка конвертации цены поставщика для артикула {supplier_article}: {str(e)}. Значение: '{supplier_price}'")
-    
-    logger.info(f"Завершено сопоставление товаров поставщика. Всего: {len(supplier_df)}, совпадений: {match_count}, отсутствуют в магазине: {missing_in_store_count}")
-    
-    # Поиск артикулов, которые есть в магазине, но нет у поставщика
-    missing_in_supplier_count = 0
+    deadline.enter("match", supplier_rows=len(supplier_df), store_rows=len(store_df))
+
+    # Индексы нормализованных артикулов строятся один раз на файл по правилам из его маппинга
+    logger.info("Построение индексов нормализованных артикулов")
+    supplier = PreparedPriceList(supplier_file.column_mapping, supplier_df)
+    store = PreparedPriceList(store_file.column_mapping, store_df, duplicate_policy=options.duplicate_policy)
+    deadline.check("match")
+
+    return _match_price_lists(supplier, store, deadline, timings, options)
+
+def _match_price_lists(
+    supplier: PreparedPriceList,
+    store: PreparedPriceList,
+    deadline: Deadline,
+    timings: Dict[str, float],
+    options: ComparisonOptions
+) -> ComparisonResult:
+    """
+    Сопоставление подготовленных прайс-листов поставщика и магазина по нормализованным артикулам
+    """
+    # Поиск совпадающих артикулов: пары строк поставщика и магазина по политике повторов магазина
+    logger.info(f"Начало сопоставления товаров по артикулам (повторы в магазине: {store.index.policy})")
+    supplier_rows, store_rows, store_group_prices = store.index.join(supplier.index.keys)
+    matched = np.zeros(supplier.rows, dtype=bool)
+    matched[supplier_rows] = True
+
+    matched_supplier_prices = supplier.prices[supplier_rows]
+    matched_store_prices = store.prices[store_rows] if store_group_prices is None else store_group_prices
+    valid_prices = ~(np.isnan(matched_supplier_prices) | np.isnan(matched_store_prices))
+    if not valid_prices.all():
+        logger.warning(f"Ошибка конвертации цен для {int((~valid_prices).sum())} совпавших артикулов, они пропущены")
+    supplier_rows = supplier_rows[valid_prices]
+    store_rows = store_rows[valid_prices]
+    matched_supplier_prices = matched_supplier_prices[valid_prices]
+    matched_store_prices = matched_store_prices[valid_prices]
+
+    price_diff = matched_supplier_prices - matched_store_prices
+    # Если цена в магазине равна нулю: 100% при ненулевой цене поставщика, иначе 0
+    zero_store_price = matched_store_prices == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_diff_percent = np.where(
+            zero_store_price,
+            np.where(matched_supplier_prices > 0, 100.0, 0.0),
+            price_diff / matched_store_prices * 100
+        )
+    if zero_store_price.any():
+        logger.warning(f"Нулевая цена в магазине для {int(zero_store_price.sum())} артикулов, процентная разница установлена в 100 или 0")
+
+    # Сортировка по модулю разницы в процентах (при равенстве сохраняется порядок файла поставщика)
+    order = np.argsort(-np.abs(price_diff_percent), kind="stable")
+    supplier_rows = supplier_rows[order]
+    store_rows = store_rows[order]
+
+    # Совпадения хранятся только колонками: строки-словари строятся из них лишь для ответа JSON
+    # (with_match_rows), страницы, потоки и бинарные форматы читают колонки напрямую
+    matches = pd.DataFrame({
+        "article": supplier.articles[supplier_rows],
+        "supplier_price": matched_supplier_prices[order],
+        "store_price": matched_store_prices[order],
+        "price_diff": price_diff[order],
+        "price_diff_percent": price_diff_percent[order],
+        "supplier_name": supplier.names[supplier_rows],
+        "store_name": store.names[store_rows],
+        # Артикул в записи магазина: при нормализации может отличаться от артикула поставщика,
+        # а обновление цен пишется именно в файл магазина
+        "store_article": store.articles[store_rows],
+        **{field: values[supplier_rows] for field, values in supplier.extra_columns.items()}
+    })
+    deadline.progress.update(supplier_processed=supplier.rows, matches=len(matches))
+    deadline.check("match")
+
+    # Товары поставщика, которых нет в магазине
+    missing_in_store = _missing_items(
+        ~matched, supplier.articles, supplier.strict_prices, supplier.names,
+        price_field="supplier_price", name_field="supplier_name", source="поставщика",
+        extra_columns=supplier.extra_columns
+    )
+    logger.info(f"Завершено сопоставление товаров поставщика. Всего: {supplier.rows}, совпадений: {len(matches)}, отсутствуют в магазине: {len(missing_in_store)}")
+
+    # Товары магазина, артикулов которых нет у поставщика
     logger.info("Поиск товаров, отсутствующих у поставщика")
+    missing_in_supplier = _missing_items(
+        ~supplier.index.contains(store.index.keys), store.articles, store.strict_prices, store.names,
+        price_field="store_price", name_field="store_name", source="магазина"
+    )
+    deadline.progress.update(store_processed=store.rows, missing_in_supplier=len(missing_in_supplier))
+    logger.info(f"Завершен поиск товаров, отсутствующих у поставщика. Всего: {len(missing_in_supplier)}")
+
+    # Второй этап (по запросу): кандидаты по наименованию для товаров без пары по артикулу
+    if options.fuzzy_names:
+        deadline.enter("fuzzy", missing_in_store=len(missing_in_store), missing_in_supplier=len(missing_in_supplier))
+        fuzzy_start = deadline.elapsed()
+        found_for_store = attach_name_candidates(
+            missing_in_store, missing_in_supplier,
+            name_field="supplier_name", other_name_field="store_name", other_price_field="store_price",
+            limit=options.fuzzy_max_candidates, min_similarity=options.fuzzy_min_similarity, deadline=deadline
+        )
+        found_for_supplier = attach_name_candidates(
+            missing_in_supplier, missing_in_store,
+            name_field="store_name", other_name_field="supplier_name", other_price_field="supplier_price",
+            limit=options.fuzzy_max_candidates, min_similarity=options.fuzzy_min_similarity, deadline=deadline
+        )
+        timings["fuzzy"] = deadline.elapsed() - fuzzy_start
+        logger.info(f"Кандидаты по наименованию найдены: для {found_for_store} товаров поставщика и {found_for_supplier} товаров магазина")
     
-    # Создаем словарь артикулов поставщика для быстрого поиска
-    supplier_articles_set = set(supplier_df[supplier_article_col].tolist())
-    
-    for idx, (_, store_row_data) in enumerate(store_df.iterrows()):
-        if idx % 1000 == 0 and idx > 0:
-            logger.info(f"Обработано {idx} товаров магазина. Отсутствуют у поставщика: {missing_in_supplier_count}")
-        
-        store_article = store_row_data[store_article_col]
-        
-        # Проверка, есть ли артикул у поставщика
-        if store_article not in supplier_articles_set:
-            store_price = store_row_data[store_price_col]
-            store_name = store_row_data.get(store_name_col) if store_name_col else None
-            
-            try:
-                missing_in_supplier.append({
-                    "article": store_article,
-                    "store_price": float(str(store_price).replace(',', '.').strip()),
-                    "store_name": store_name,
-                })
-                missing_in_supplier_count += 1
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Ошибка конвертации цены магазина для артикула {store_article}: {str(e)}. Значение: '{store_price}'")
-    
-    logger.info(f"Завершен поиск товаров, отсутствующих у поставщика. Всего: {missing_in_supplier_count}")
-    
-    # Сортировка результатов по разнице в процентах
-    logger.info("Сортировка результатов по разнице в процентах")
-    matches.sort(key=lambda x: abs(x["price_diff_percent"]), reverse=True)
-    
-    # Преобразуем словари в объекты MatchedItem для matches_data
-    matches_data = []
-    for item in matches:
-        matches_data.append({
-            "article": item["article"],
-            "supplier_price": item["supplier_price"],
-            "store_price": item["store_price"],
-            "price_diff": item["price_diff"],
-            "price_diff_percent": item["price_diff_percent"],
-            "supplier_name": item.get("supplier_name"),
-            "store_name": item.get("store_name")
-        })
-    
+    deadline.enter(
+        "serialize",
+        matches=len(matches),
+        missing_in_store=len(missing_in_store),
+        missing_in_supplier=len(missing_in_supplier)
+    )
+
     # Рассчитываем общие метрики для фронтенда
     total_items = len(matches) + len(missing_in_store) + len(missing_in_supplier)
     
     # Создание результата с дополнительными полями для фронтенда
     result = ComparisonResult(
-        matches=matches,
+        matches=[],
         missing_in_store=missing_in_store,
         missing_in_supplier=missing_in_supplier,
         # Дополнительные поля для совместимости с фронтендом
-        matches_data=matches_data,
         total_items=total_items,
+        matches_count=len(matches),
+        statistics={
+            "duplicates": {
+                "policy": store.index.policy,
+                "supplier": {"articles": supplier.index.duplicate_keys, "rows": supplier.index.duplicate_count},
+                "store": {"articles": store.index.duplicate_keys, "rows": store.index.duplicate_count},
+            }
+        },
         items_only_in_file1=len(missing_in_store),
         items_only_in_file2=len(missing_in_supplier),
         mismatches=0,  # Этот параметр нужно рассчитать отдельно при необходимости
@@ -246,6 +745,12 @@ def compare_files(supplier_file: FileInfo, store_file: FileInfo) -> ComparisonRe
         }
     )
     
+    result._columnar = build_comparison_table({
+        "matches": matches,
+        "missing_in_store": missing_in_store,
+        "missing_in_supplier": missing_in_supplier,
+    })
+    
     logger.info(f"Сравнение завершено успешно. Найдено: совпадений - {len(matches)}, товаров без аналогов в магазине - {len(missing_in_store)}, товаров без аналогов у поставщика - {len(missing_in_supplier)}")
     
     return result 
\ No newline at end of file
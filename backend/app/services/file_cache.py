@@ -1,7 +1,8 @@
 from typing import Dict, Any, Optional
 import time
+import hashlib
 import logging
-import sys
+import threading
 from collections import OrderedDict
 
 logger = logging.getLogger("app.services.file_cache")
@@ -10,6 +11,7 @@ logger = logging.getLogger("app.services.file_cache")
 MAX_CACHE_SIZE_MB = 200  # Максимальный размер кеша в МБ
 MAX_CACHE_ENTRIES = 20    # Максимальное количество файлов в кеше
 DEFAULT_CACHE_TTL = 3600  # Время жизни файла в кеше (1 час)
+MAX_STALE_AGE = 7 * 86400  # Сколько устаревшая запись может отдаваться, пока идет ревалидация (7 дней)
 
 # Используем OrderedDict для поддержки LRU (Least Recently Used) функциональности
 file_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
@@ -17,9 +19,34 @@ file_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
 # Текущий размер кеша в байтах
 current_cache_size = 0
 
-def cache_file_content(filename: str, content: bytes) -> None:
+# Кеш читают потоки запросов и меняет фоновая ревалидация: все обращения к file_cache
+# и current_cache_size идут под этой блокировкой, записи заменяются целиком, а не правятся на месте
+_cache_lock = threading.Lock()
+
+def compute_content_hashes(content: bytes) -> Dict[str, str]:
+    """
+    Вычисляет хеши содержимого файла: sha256 для сравнения версий
+    и md5, который Supabase Storage отдает в качестве ETag
+    """
+    return {
+        "content_hash": hashlib.sha256(content).hexdigest(),
+        "md5": hashlib.md5(content).hexdigest()
+    }
+
+def cache_file_content(
+    filename: str,
+    content: bytes,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> None:
     """
     Сохраняет содержимое файла в кеше с учетом ограничений размера
+
+    Args:
+        filename: Имя файла
+        content: Содержимое файла
+        etag: ETag объекта в хранилище (если известен)
+        last_modified: Значение Last-Modified объекта в хранилище (если известно)
     """
     global current_cache_size, file_cache
     
@@ -33,70 +60,139 @@ def cache_file_content(filename: str, content: bytes) -> None:
         )
         return
     
-    # Проверяем, есть ли файл уже в кеше
-    if filename in file_cache:
-        # Удаляем старую версию из размера кеша
-        current_cache_size -= len(file_cache[filename]["content"])
-        
-    # Освобождаем место в кеше, если нужно
-    while (current_cache_size + content_size) / (1024 * 1024) > MAX_CACHE_SIZE_MB or len(file_cache) >= MAX_CACHE_ENTRIES:
-        if not file_cache:
-            break
-        # Удаляем самый старый элемент (LRU)
-        oldest_key, oldest_value = file_cache.popitem(last=False)
-        removed_size = len(oldest_value["content"])
-        current_cache_size -= removed_size
-        logger.info(
-            f"Удален файл из кеша (LRU): {oldest_key}, освобождено {removed_size / (1024 * 1024):.2f} МБ, "
-            f"текущий размер кеша: {current_cache_size / (1024 * 1024):.2f} МБ"
-        )
-    
-    # Добавляем файл в кеш
+    # Запись (с хешами) собирается до блокировки, чтобы не держать ее на время хеширования
     logger.info(f"Кеширование файла: {filename}, размер: {content_size_mb:.2f} МБ")
-    file_cache[filename] = {
+    entry = {
         "content": content,
         "timestamp": time.time(),
-        "size": content_size
+        "size": content_size,
+        "etag": etag,
+        "last_modified": last_modified,
+        **compute_content_hashes(content)
     }
     
-    # Перемещаем файл в конец OrderedDict (обновляем LRU)
-    file_cache.move_to_end(filename)
-    
-    # Обновляем текущий размер кеша
-    current_cache_size += content_size
+    with _cache_lock:
+        # Проверяем, есть ли файл уже в кеше
+        previous = file_cache.pop(filename, None)
+        if previous is not None:
+            # Удаляем старую версию из размера кеша
+            current_cache_size -= previous["size"]
+            
+        # Освобождаем место в кеше, если нужно
+        while (current_cache_size + content_size) / (1024 * 1024) > MAX_CACHE_SIZE_MB or len(file_cache) >= MAX_CACHE_ENTRIES:
+            if not file_cache:
+                break
+            # Удаляем самый старый элемент (LRU)
+            oldest_key, oldest_value = file_cache.popitem(last=False)
+            removed_size = oldest_value["size"]
+            current_cache_size -= removed_size
+            logger.info(
+                f"Удален файл из кеша (LRU): {oldest_key}, освобождено {removed_size / (1024 * 1024):.2f} МБ, "
+                f"текущий размер кеша: {current_cache_size / (1024 * 1024):.2f} МБ"
+            )
+        
+        # Добавляем файл в конец OrderedDict (самый свежий для LRU) и обновляем размер кеша
+        file_cache[filename] = entry
+        current_cache_size += content_size
+        cache_size, entries_count = current_cache_size, len(file_cache)
     
     # Логируем состояние кеша
     logger.info(
-        f"Файл {filename} добавлен в кеш, текущий размер кеша: {current_cache_size / (1024 * 1024):.2f} МБ, "
-        f"количество файлов: {len(file_cache)}"
+        f"Файл {filename} добавлен в кеш, текущий размер кеша: {cache_size / (1024 * 1024):.2f} МБ, "
+        f"количество файлов: {entries_count}"
     )
 
-def get_cached_content(filename: str) -> Optional[bytes]:
+def get_cached_content(filename: str, allow_stale: bool = False) -> Optional[bytes]:
     """
     Получает содержимое файла из кеша, если оно там есть и не устарело
+
+    Args:
+        filename: Имя файла
+        allow_stale: Отдавать запись с истекшим TTL (не старше MAX_STALE_AGE),
+            вызывающий код отвечает за ее ревалидацию
     """
-    if filename in file_cache:
-        cache_entry = file_cache[filename]
-        current_time = time.time()
-        
+    global current_cache_size
+
+    with _cache_lock:
+        cache_entry = file_cache.get(filename)
+        if cache_entry is None:
+            return None
+        age = time.time() - cache_entry["timestamp"]
+
         # Проверяем, не устарел ли кеш
-        if current_time - cache_entry["timestamp"] <= DEFAULT_CACHE_TTL:
+        if age <= DEFAULT_CACHE_TTL or (allow_stale and age <= MAX_STALE_AGE):
             # Перемещаем файл в конец OrderedDict (обновляем LRU)
             file_cache.move_to_end(filename)
-            
-            content_size_mb = len(cache_entry["content"]) / (1024 * 1024)
-            logger.info(f"Получен файл из кеша: {filename}, размер: {content_size_mb:.2f} МБ")
-            return cache_entry["content"]
+        elif age > MAX_STALE_AGE:
+            # Удаляем запись, которую уже нельзя отдавать даже как устаревшую
+            file_cache.pop(filename)
+            current_cache_size -= cache_entry["size"]
+            logger.info(f"Файл {filename} удален из кеша из-за истечения срока хранения ({MAX_STALE_AGE} сек)")
+            return None
         else:
-            # Удаляем устаревшую запись
-            content = file_cache.pop(filename)
-            global current_cache_size
-            current_cache_size -= len(content["content"])
-            logger.info(f"Файл {filename} удален из кеша из-за истечения TTL ({DEFAULT_CACHE_TTL} сек)")
-    
-    return None
+            return None
 
-def clear_old_cache(max_age: int = DEFAULT_CACHE_TTL) -> None:
+    content_size_mb = cache_entry["size"] / (1024 * 1024)
+    if age > DEFAULT_CACHE_TTL:
+        logger.info(f"Получен устаревший файл из кеша: {filename}, размер: {content_size_mb:.2f} МБ, возраст: {age:.0f} сек")
+    else:
+        logger.info(f"Получен файл из кеша: {filename}, размер: {content_size_mb:.2f} МБ")
+    return cache_entry["content"]
+
+def is_cache_entry_stale(filename: str) -> bool:
+    """
+    Проверяет, истек ли TTL записи кеша (запись требует ревалидации)
+    """
+    with _cache_lock:
+        cache_entry = file_cache.get(filename)
+    if not cache_entry:
+        return False
+    return time.time() - cache_entry["timestamp"] > DEFAULT_CACHE_TTL
+
+def get_cache_validators(filename: str) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает данные для условного запроса к хранилищу: ETag, Last-Modified и хеши содержимого
+    """
+    with _cache_lock:
+        cache_entry = file_cache.get(filename)
+    if not cache_entry:
+        return None
+    return {
+        "etag": cache_entry.get("etag"),
+        "last_modified": cache_entry.get("last_modified"),
+        "content_hash": cache_entry.get("content_hash"),
+        "md5": cache_entry.get("md5"),
+        "size": cache_entry.get("size")
+    }
+
+def refresh_cache_entry(
+    filename: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> bool:
+    """
+    Продлевает TTL записи после успешной ревалидации (объект в хранилище не изменился)
+
+    Returns:
+        bool: True, если запись найдена и обновлена
+    """
+    with _cache_lock:
+        cache_entry = file_cache.get(filename)
+        if not cache_entry:
+            return False
+
+        # Новая запись вместо правки на месте: читатели видят либо старую, либо обновленную целиком
+        file_cache[filename] = {
+            **cache_entry,
+            "timestamp": time.time(),
+            "etag": etag or cache_entry.get("etag"),
+            "last_modified": last_modified or cache_entry.get("last_modified")
+        }
+
+    logger.info(f"Запись кеша {filename} подтверждена ревалидацией, TTL продлен")
+    return True
+
+def clear_old_cache(max_age: int = MAX_STALE_AGE) -> None:
     """
     Очищает кеш от устаревших файлов
     
@@ -105,26 +201,27 @@ def clear_old_cache(max_age: int = DEFAULT_CACHE_TTL) -> None:
     """
     global current_cache_size, file_cache
     
-    if not file_cache:
-        logger.info("Кеш пуст, очистка не требуется")
-        return
+    with _cache_lock:
+        if not file_cache:
+            logger.info("Кеш пуст, очистка не требуется")
+            return
+            
+        current_time = time.time()
+        keys_to_remove = []
+        freed_size = 0
         
-    current_time = time.time()
-    keys_to_remove = []
-    freed_size = 0
-    
-    # Находим устаревшие файлы
-    for filename, cache_entry in file_cache.items():
-        if current_time - cache_entry["timestamp"] > max_age:
-            keys_to_remove.append(filename)
-            freed_size += len(cache_entry["content"])
-    
-    # Удаляем устаревшие файлы
-    for filename in keys_to_remove:
-        file_cache.pop(filename)
-    
-    # Обновляем размер кеша
-    current_cache_size -= freed_size
+        # Находим устаревшие файлы
+        for filename, cache_entry in file_cache.items():
+            if current_time - cache_entry["timestamp"] > max_age:
+                keys_to_remove.append(filename)
+                freed_size += cache_entry["size"]
+        
+        # Удаляем устаревшие файлы
+        for filename in keys_to_remove:
+            file_cache.pop(filename)
+        
+        # Обновляем размер кеша
+        current_cache_size -= freed_size
     
     if keys_to_remove:
         logger.info(
@@ -139,13 +236,17 @@ def get_cache_stats() -> Dict[str, Any]:
     """
     Возвращает статистику по кешу для отладки
     """
+    with _cache_lock:
+        entries = list(file_cache.items())
+        cache_size = current_cache_size
     return {
-        "entries_count": len(file_cache),
-        "total_size_mb": current_cache_size / (1024 * 1024),
+        "entries_count": len(entries),
+        "total_size_mb": cache_size / (1024 * 1024),
         "max_size_mb": MAX_CACHE_SIZE_MB,
         "files": [{
             "name": filename,
-            "size_mb": len(cache_entry["content"]) / (1024 * 1024),
-            "age_seconds": time.time() - cache_entry["timestamp"]
-        } for filename, cache_entry in file_cache.items()]
+            "size_mb": cache_entry["size"] / (1024 * 1024),
+            "age_seconds": time.time() - cache_entry["timestamp"],
+            "stale": time.time() - cache_entry["timestamp"] > DEFAULT_CACHE_TTL
+        } for filename, cache_entry in entries]
     } 
\ No newline at end of file
@@ -1,199 +1,124 @@
 import os
-import pandas as pd
-import chardet
+import re
+import asyncio
 import io
 import uuid
 import time
+import hashlib
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
-from supabase import create_client, Client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
 from app.core.config import settings
-from app.services.file_cache import cache_file_content, get_cached_content, clear_old_cache
+from app.core.deadline import Deadline
+from app.services.job_service import JOB_KEY_PREFIX, JOB_TTL
+from app.services.file_cache import (
+    cache_file_content,
+    get_cached_content,
+    clear_old_cache,
+    is_cache_entry_stale,
+    get_cache_validators,
+    refresh_cache_entry,
+    compute_content_hashes,
+    DEFAULT_CACHE_TTL,
+)
+from app.services.storage import (
+    get_storage,
+    init_supabase_client,
+    LocalStorage,
+    StorageNotFoundError,
+)
+from app.services.shared_cache import (
+    MappedFileReader,
+    SharedCacheWriter,
+    is_shared_cache_enabled,
+    put_shared_content,
+    get_shared_content,
+    get_shared_entry,
+    refresh_shared_entry,
+)
 import logging
 import traceback
-import httpx
 import csv
 from app.core.logger import get_logger
-import requests
+
+# Модуль загружается при импорте app.main, а pandas — только при первом чтении файла
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = get_logger("app.services.file_service")
 
-# Инициализация клиента Supabase
-supabase_client: Optional[Client] = None
+# Метка времени в именах файлов, которые создает приложение:
+# file_{timestamp}_..., updated_{timestamp}_..., comparison_result_{timestamp}.csv
+FILENAME_TIMESTAMP_RE = re.compile(r"^(?:file|temp|updated|comparison_result)_(\d{9,11})(?=[_.]|$)")
 
-def init_supabase_client() -> Optional[Client]:
+def get_file_timestamp(file: Dict[str, Any]) -> Optional[float]:
     """
-    Инициализация клиента Supabase с обработкой ошибок
-    
-    Returns:
-        Optional[Client]: Клиент Supabase или None в случае ошибки
+    Время создания файла: из метки времени в имени, иначе из метаданных объекта хранилища
     """
-    global supabase_client
-    
-    if supabase_client:
-        return supabase_client
-        
-    if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-        logger.error("Не указаны SUPABASE_URL или SUPABASE_KEY")
-        return None
-        
-    try:
-        url = settings.SUPABASE_URL
-        key = settings.SUPABASE_KEY
-        bucket_name = settings.SUPABASE_BUCKET
-        folder_name = settings.SUPABASE_FOLDER
-        
-        # Проверяем наличие service_role ключа
-        service_key = settings.SUPABASE_SERVICE_KEY
-        
-        logger.info(f"Инициализация Supabase клиента: URL={url}, Bucket={bucket_name}")
-        logger.info(f"Используемый ключ API: {key[:10]}...{key[-5:]} (скрыт для безопасности)")
-        
-        if service_key:
-            logger.info(f"Service role ключ доступен: {service_key[:10]}...{service_key[-5:]} (скрыт для безопасности)")
-        
-        # Создаем клиент с обычным ключом для основных операций
-        client = create_client(url, key)
-        
-        # Проверяем наличие бакета через list_buckets
-        try:
-            # Если есть service_role ключ, используем его для проверки бакетов
-            if service_key:
-                logger.info("Используем service_role ключ для проверки бакетов")
-                # Формируем URL для запроса к Supabase Storage API
-                storage_url = f"{url}/storage/v1/bucket"
-                
-                # Заголовки для запроса с service_role ключом
-                headers = {
-                    "Content-Type": "application/json",
-                    "apikey": service_key,
-                    "Authorization": f"Bearer {service_key}"
-                }
-                
-                # Получаем список бакетов
-                response = requests.get(storage_url, headers=headers)
-                if response.status_code == 200:
-                    buckets = response.json()
-                    logger.info(f"Найдены бакеты: {[b['name'] for b in buckets]}")
-                    bucket_exists = any(b['name'] == bucket_name for b in buckets)
-                    
-                    # Если бакет не существует, создаем его
-                    if not bucket_exists:
-                        logger.warning(f"Бакет {bucket_name} не найден, пытаемся создать")
-                        
-                        # Данные для создания бакета
-                        data = {
-                            "id": bucket_name,
-                            "name": bucket_name,
-                            "public": False,
-                            "file_size_limit": 52428800  # 50MB в байтах
-                        }
-                        
-                        # Отправляем запрос на создание бакета
-                        create_response = requests.post(storage_url, headers=headers, json=data)
-                        
-                        if create_response.status_code == 200 or create_response.status_code == 201:
-                            logger.info(f"Бакет {bucket_name} успешно создан")
-                            bucket_exists = True
-                        else:
-                            logger.error(f"Ошибка при создании бакета: {create_response.text}")
-                else:
-                    logger.error(f"Ошибка при получении списка бакетов: {response.text}")
-            else:
-                buckets = client.storage.list_buckets()
-                bucket_exists = any(b['name'] == bucket_name for b in buckets)
-            
-            if bucket_exists:
-                logger.info(f"Бакет {bucket_name} найден")
-                supabase_client = client
-                
-                # Проверяем доступность папки uploads
-                try:
-                    logger.info("Проверяем доступность папки uploads")
-                    # Создаем папку uploads локально, если она не существует
-                    if not os.path.exists('uploads'):
-                        os.makedirs('uploads', exist_ok=True)
-                        logger.info("Папка uploads создана локально")
-                    
-                    # Проверка работоспособности Supabase Storage
-                    test_path = bucket_name + "/" + folder_name
-                    try:
-                        # Просто пытаемся получить список файлов
-                        client.storage.from_(bucket_name).list(folder_name)
-                        logger.info(f"Доступ к папке {test_path} подтвержден")
-                    except Exception as e:
-                        # Если не получилось, логируем ошибку
-                        error_str = str(e)
-                        logger.warning(f"Не удалось проверить доступ к папке {test_path}: {error_str}")
-                        # Но продолжаем работу
-                except Exception as e:
-                    error_str = str(e)
-                    logger.warning(f"Не удалось проверить папку uploads: {error_str}")
-                    logger.warning("Это может вызвать проблемы при сохранении файлов")
-                
-                logger.info(f"Supabase клиент успешно инициализирован, используется бакет {bucket_name}")
-                return client
-            else:
-                logger.error(f"Бакет {bucket_name} не найден и не удалось его создать")
-                return None
-        except Exception as bucket_error:
-            logger.warning(f"Не удалось проверить бакет {bucket_name}: {str(bucket_error)}")
-            logger.warning("Это может вызвать проблемы при сохранении файлов")
-            
-            # Даже если проверка не удалась, продолжаем работу с клиентом
-            # так как фактическая работа с бакетом будет проверена при первой операции
-        
-        logger.info(f"Supabase клиент успешно инициализирован, используется бакет {bucket_name}")
-        supabase_client = client
-        return client
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации Supabase клиента: {str(e)}")
-        logger.error(f"Полная ошибка: {traceback.format_exc()}")
-        return None
-
-# Инициализируем клиент при запуске
-init_supabase_client()
+    match = FILENAME_TIMESTAMP_RE.match(file.get("name") or "")
+    if match:
+        return float(match.group(1))
+    return file.get("last_modified")
 
-# Планировщик очистки старых файлов в Supabase
+# Планировщик очистки старых файлов в хранилище
 async def cleanup_old_files(max_age_days: int = 7):
     """
-    Удаляет файлы старше указанного количества дней из Supabase
+    Удаляет файлы старше указанного количества дней из хранилища
+    (записи фоновых задач — старше JOB_TTL)
+
+    Список объектов читается постранично (CLEANUP_PAGE_SIZE), чтобы увидеть все файлы, а не только
+    первую страницу, затем файлы удаляются пакетами по CLEANUP_BATCH_SIZE, не более
+    CLEANUP_CONCURRENCY пакетов одновременно
     """
-    client = init_supabase_client()
-    if not client:
-        logger.error("Не удалось инициализировать Supabase клиент для очистки файлов")
-        return
+    storage = get_storage()
+    cutoff = time.time() - max_age_days * 86400
+    # Записи фоновых задач нужны только пока клиент опрашивает /jobs/{id}
+    job_cutoff = time.time() - JOB_TTL
+    page_size = settings.CLEANUP_PAGE_SIZE
         
     try:
-        # Получаем список файлов
-        files = client.storage.from_(settings.SUPABASE_BUCKET).list(settings.SUPABASE_FOLDER)
-        logger.info(f"Найдено {len(files)} файлов для проверки на старость")
-        
-        # Получаем дату, старше которой файлы нужно удалить
-        cutoff_date = datetime.now() - timedelta(days=max_age_days)
-        deleted_count = 0
-        
-        # Удаляем старые файлы
-        # Примечание: Supabase не предоставляет информацию о дате создания файла через API,
-        # поэтому мы используем соглашение об именовании файлов
-        for file in files:
-            file_path = file.get('name', '')
-            
-            # Определяем, является ли файл временным (содержит 'temp' или 'updated' в имени)
-            is_temp = 'temp_' in file_path or 'updated_' in file_path
-            
-            if is_temp:
+        # Собираем устаревшие файлы по всем страницам списка
+        to_delete: List[str] = []
+        checked = 0
+        offset = 0
+        while True:
+            page = await asyncio.to_thread(storage.list, "", page_size, offset)
+            for file in page:
+                timestamp = get_file_timestamp(file)
+                file_cutoff = job_cutoff if file["name"].startswith(JOB_KEY_PREFIX) else cutoff
+                if timestamp is not None and timestamp < file_cutoff:
+                    to_delete.append(file["name"])
+            checked += len(page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+        
+        logger.info(f"Проверено {checked} файлов, старше {max_age_days} дней: {len(to_delete)}")
+        if not to_delete:
+            return
+        
+        # Удаляем пакетами с ограничением числа одновременных запросов
+        semaphore = asyncio.Semaphore(settings.CLEANUP_CONCURRENCY)
+        batch_size = settings.CLEANUP_BATCH_SIZE
+        
+        async def delete_batch(batch: List[str]) -> int:
+            async with semaphore:
                 try:
-                    path = f"{settings.SUPABASE_FOLDER}/{file_path}"
-                    client.storage.from_(settings.SUPABASE_BUCKET).remove([path])
-                    logger.info(f"Удален старый файл из Supabase: {path}")
-                    deleted_count += 1
+                    deleted = await asyncio.to_thread(storage.delete, batch)
+                    logger.info(f"Удалено {len(deleted)} из {len(batch)} файлов пакета")
+                    return len(deleted)
                 except Exception as del_err:
-                    logger.warning(f"Не удалось удалить файл {file_path}: {str(del_err)}")
+                    logger.warning(f"Не удалось удалить пакет из {len(batch)} файлов: {str(del_err)}")
+                    return 0
+        
+        deleted_counts = await asyncio.gather(*(
+            delete_batch(to_delete[i:i + batch_size]) for i in range(0, len(to_delete), batch_size)
+        ))
         
-        logger.info(f"Очистка старых файлов завершена, удалено {deleted_count} файлов")
+        logger.info(f"Очистка старых файлов завершена, удалено {sum(deleted_counts)} файлов")
     except Exception as e:
-        logger.error(f"Ошибка при очистке старых файлов в Supabase: {str(e)}")
+        logger.error(f"Ошибка при очистке старых файлов в хранилище: {str(e)}")
         logger.debug(traceback.format_exc())
 
 def detect_encoding(file_content: bytes) -> str:
@@ -265,6 +190,8 @@ def get_columns(file_content: bytes, extension: str, encoding: str, separator: s
     """
     Получение списка колонок из содержимого файла
     """
+    import pandas as pd
+
     logger.info(f"Извлечение колонок из файла (расширение: {extension}, кодировка: {encoding}, разделитель: '{separator}')")
     try:
         if extension.lower() in ['.xlsx', '.xls']:
@@ -288,12 +215,21 @@ def get_columns(file_content: bytes, extension: str, encoding: str, separator: s
         logger.debug(traceback.format_exc())
         raise ValueError(f"Не удалось прочитать колонки из файла: {str(e)}")
 
-def read_file(file_content: bytes, extension: str, encoding: str, separator: str) -> pd.DataFrame:
+def open_binary_stream(file_content) -> io.RawIOBase:
+    """
+    Возвращает файловый объект для чтения pandas: BytesIO для bytes,
+    MappedFileReader для mmap и других буферов (без копирования содержимого)
+    """
+    if isinstance(file_content, bytes):
+        return io.BytesIO(file_content)
+    return MappedFileReader(file_content)
+
+def read_file(file_content, extension: str, encoding: str, separator: str) -> "pd.DataFrame":
     """
     Чтение содержимого файла в pandas DataFrame
     
     Args:
-        file_content: Бинарное содержимое файла
+        file_content: Бинарное содержимое файла (bytes или mmap из общего кеша)
         extension: Расширение файла (.csv, .xlsx и т.д.)
         encoding: Кодировка файла
         separator: Разделитель для CSV файлов
@@ -301,6 +237,8 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
     Returns:
         pd.DataFrame: Данные из файла
     """
+    import pandas as pd
+
     logger.info(f"Чтение файла с расширением {extension}, кодировкой {encoding}, разделителем '{separator}'")
     
     if not file_content:
@@ -313,7 +251,7 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
             try:
                 # Стандартное чтение CSV
                 df = pd.read_csv(
-                    io.BytesIO(file_content), 
+                    open_binary_stream(file_content), 
                     encoding=encoding, 
                     sep=separator,
                     engine='python',  # Более гибкий парсер
@@ -326,7 +264,7 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
                 # Пробуем с более строгими параметрами
                 try:
                     df = pd.read_csv(
-                        io.BytesIO(file_content), 
+                        open_binary_stream(file_content), 
                         encoding=encoding, 
                         sep=separator,
                         quoting=csv.QUOTE_NONE,  # Отключаем кавычки
@@ -337,7 +275,7 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
                     
                     # Последняя попытка с декодированием строки
                     try:
-                        text_content = file_content.decode(encoding, errors='replace')
+                        text_content = str(file_content, encoding, errors='replace')
                         df = pd.read_csv(
                             io.StringIO(text_content),
                             sep=separator,
@@ -350,7 +288,7 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
         elif extension.lower() in ['.xlsx', '.xls']:
             # Для Excel файлов
             try:
-                df = pd.read_excel(io.BytesIO(file_content), engine='openpyxl' if extension.lower() == '.xlsx' else 'xlrd')
+                df = pd.read_excel(open_binary_stream(file_content), engine='openpyxl' if extension.lower() == '.xlsx' else 'xlrd')
             except Exception as e:
                 logger.error(f"Ошибка при чтении Excel файла: {str(e)}")
                 
@@ -358,10 +296,10 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
                 try:
                     if extension.lower() == '.xlsx':
                         logger.info("Попытка использовать xlrd для чтения XLSX")
-                        df = pd.read_excel(io.BytesIO(file_content), engine='xlrd')
+                        df = pd.read_excel(open_binary_stream(file_content), engine='xlrd')
                     else:
                         logger.info("Попытка использовать openpyxl для чтения XLS")
-                        df = pd.read_excel(io.BytesIO(file_content), engine='openpyxl')
+                        df = pd.read_excel(open_binary_stream(file_content), engine='openpyxl')
                 except Exception as e2:
                     logger.error(f"Альтернативные движки для Excel не помогли: {str(e2)}")
                     raise ValueError(f"Не удалось прочитать Excel файл: {str(e2)}")
@@ -396,56 +334,36 @@ def read_file(file_content: bytes, extension: str, encoding: str, separator: str
 
 def save_file(filename: str, file_content: bytes) -> str:
     """
-    Сохранение файла в Supabase Storage
+    Сохранение файла в хранилище (Supabase Storage, локальный каталог или память — см. STORAGE_BACKEND)
     
     Args:
         filename: Имя файла
         file_content: Содержимое файла
         
     Returns:
-        URL файла в Supabase
+        URL файла в хранилище
     """
     logger.info(f"Запрос на сохранение файла: {filename}, размер: {len(file_content)} байт")
     
     # Очистка имени файла
     filename = sanitize_filename(filename)
     
-    # Подключение к Supabase
     try:
-        # Проверка конфигурации Supabase
-        if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-            logger.warning("Настройки для Supabase не найдены, сохранение в локальное хранилище")
-            return save_file_locally(filename, file_content)
-        
-        # Получаем существующий клиент или создаем новый
-        client = init_supabase_client()
-        if not client:
-            logger.warning("Не удалось инициализировать Supabase клиент, сохранение в локальное хранилище")
-            return save_file_locally(filename, file_content)
+        # Проверка содержимого на вредоносный код (базовая проверка)
+        if len(file_content) > 0 and is_potentially_dangerous(file_content[:4096]):
+            logger.warning(f"Обнаружено потенциально опасное содержимое в файле {filename}")
+            raise ValueError("Обнаружено потенциально опасное содержимое в файле")
         
+        storage = get_storage()
         try:
-            # Формируем путь к файлу в Supabase
-            file_path = f"{settings.SUPABASE_FOLDER}/{filename}"
-            logger.info(f"Сохранение в Supabase Storage: {file_path}")
-            
-            # Проверка содержимого на вредоносный код (базовая проверка)
-            if len(file_content) > 0 and is_potentially_dangerous(file_content[:4096]):
-                logger.warning(f"Обнаружено потенциально опасное содержимое в файле {filename}")
-                raise ValueError("Обнаружено потенциально опасное содержимое в файле")
-            
-            # Загружаем файл в Supabase
-            client.storage.from_(settings.SUPABASE_BUCKET).upload(
-                file_path,
-                file_content,
-                {"content-type": "application/octet-stream"}
-            )
-            
-            # Получаем публичный URL
-            cloud_url = client.storage.from_(settings.SUPABASE_BUCKET).get_public_url(file_path)
-            logger.info(f"Файл успешно загружен в Supabase, URL: {cloud_url}")
-            return cloud_url
+            logger.info(f"Сохранение в хранилище {storage.name}: {filename}")
+            file_url = storage.put(filename, file_content)
+            logger.info(f"Файл успешно сохранен в хранилище {storage.name}, URL: {file_url}")
+            return file_url
         except Exception as e:
-            logger.error(f"Ошибка при сохранении файла в Supabase: {str(e)}")
+            if isinstance(storage, LocalStorage):
+                raise
+            logger.error(f"Ошибка при сохранении файла в хранилище {storage.name}: {str(e)}")
             logger.error(f"Полная ошибка: {traceback.format_exc()}")
             
             # В случае ошибки пытаемся сохранить в локальное хранилище
@@ -461,26 +379,53 @@ def save_file_locally(filename: str, file_content: bytes) -> str:
     Сохранение файла в локальное хранилище
     """
     try:
-        # Создаем директорию, если не существует
-        uploads_dir = os.path.join(settings.UPLOADS_DIR)
-        os.makedirs(uploads_dir, exist_ok=True)
-        
-        # Полный путь к файлу
-        file_path = os.path.join(uploads_dir, filename)
-        
-        # Записываем содержимое в файл
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
-        
-        logger.info(f"Файл успешно сохранен локально: {file_path}")
-        
-        # Возвращаем относительный путь для доступа через API
-        return f"/api/v1/files/download/{filename}"
+        return LocalStorage().put(filename, file_content)
     except Exception as e:
         logger.error(f"Ошибка при сохранении файла локально: {str(e)}")
         logger.error(f"Полная ошибка: {traceback.format_exc()}")
         raise ValueError(f"Не удалось сохранить файл локально: {str(e)}")
 
+def verify_saved_file(filename: str, size: int, md5: Optional[str] = None) -> bool:
+    """
+    Проверяет сохраненный файл по метаданным хранилища (HEAD), не загружая его содержимое.
+
+    Supabase отдает md5 содержимого в качестве ETag, поэтому при известном md5 сверяется
+    контрольная сумма, иначе — размер. Проверяется основное хранилище и локальное,
+    куда save_file сохраняет файл, если основное недоступно
+
+    Args:
+        filename: Имя файла
+        size: Размер отправленного содержимого
+        md5: md5 отправленного содержимого (если уже посчитан)
+
+    Returns:
+        bool: True, если файл найден и совпадает с отправленным
+    """
+    storages = [get_storage()]
+    if not isinstance(storages[0], LocalStorage):
+        storages.append(LocalStorage())
+
+    for storage in storages:
+        meta = storage.head(filename)
+        if meta is None:
+            continue
+
+        etag = (meta.get("etag") or "").strip().removeprefix("W/").strip('"')
+        if md5 and re.fullmatch(r"[0-9a-f]{32}", etag):
+            verified = etag == md5
+        else:
+            verified = meta.get("size") is None or meta["size"] == size
+
+        if not verified:
+            logger.error(
+                f"Файл {filename} в хранилище {storage.name} не совпадает с отправленным: "
+                f"ETag={meta.get('etag')}, размер={meta.get('size')}, ожидалось md5={md5}, размер={size}"
+            )
+        return verified
+
+    logger.error(f"Файл {filename} не найден в хранилище после сохранения")
+    return False
+
 def sanitize_filename(filename: str) -> str:
     """
     Очистка имени файла от потенциально опасных символов
@@ -540,92 +485,215 @@ def is_potentially_dangerous(content_sample: bytes) -> bool:
         # В случае ошибки считаем безопасным, чтобы не блокировать работу
         return False
 
-def get_file_content(filename: str) -> Optional[bytes]:
+def get_file_content(filename: str, deadline: Optional[Deadline] = None) -> Optional[bytes]:
     """
-    Получение содержимого файла из Supabase Storage
+    Получение содержимого файла: из кеша процесса, общего кеша хоста или хранилища
+
+    Файл из общего кеша копируется для вызывающего кода, но в кеш процесса не попадает:
+    копия на каждый воркер свела бы общий кеш на нет. Для разбора файла без копии — get_file_buffer
+
+    Args:
+        filename: Имя файла
+        deadline: Бюджет времени запроса. Загрузка и повторные попытки не выходят за его пределы,
+            а запасной источник (публичный URL) не используется, если бюджет почти исчерпан
+    """
+    content = _load_file(filename, deadline)
+    if content is not None and not isinstance(content, bytes):
+        content = content[:]
+    return content
+
+def get_file_buffer(filename: str, deadline: Optional[Deadline] = None):
+    """
+    Получение содержимого файла для разбора без лишних копий.
+
+    Если файл есть в общем кеше хоста (или только что скачан в него), возвращает его
+    mmap-отображение (только чтение), иначе — bytes. Результат можно передавать в read_file.
+    """
+    return _load_file(filename, deadline)
+
+def _load_file(filename: str, deadline: Optional[Deadline] = None):
+    """
+    Содержимое файла из кеша процесса (bytes), общего кеша хоста (mmap) или хранилища
     """
     logger.info(f"Запрос содержимого файла: {filename}")
     
-    # Проверяем кеш первым делом для всех файлов
-    cached_content = get_cached_content(filename)
+    # Проверяем кеш первым делом для всех файлов.
+    # Устаревшие записи отдаем сразу, а актуальность проверяем в фоне
+    cached_content = get_cached_content(filename, allow_stale=True)
     if cached_content:
         logger.info(f"Файл {filename} найден в кеше, размер: {len(cached_content)} байт")
+        if is_cache_entry_stale(filename):
+            schedule_cache_revalidation(filename)
         return cached_content
+
+    # Затем общий кеш хоста: файл мог уже скачать другой воркер
+    shared_entry = get_shared_entry(filename)
+    shared_content = get_shared_content(filename) if shared_entry else None
+    if shared_content is not None:
+        if time.time() - shared_entry["timestamp"] > DEFAULT_CACHE_TTL:
+            schedule_cache_revalidation(filename)
+        return shared_content
     
-    # Попытка получить из Supabase
+    storage = get_storage()
+
+    # Файл скачивается блоками прямо в кеш (на диск общего кеша или в буфер),
+    # после обрыва загрузка продолжается с последнего полученного байта
+    retry_deadline = time.monotonic() + settings.DOWNLOAD_RETRY_BUDGET_SECONDS
+    if deadline is not None:
+        retry_deadline = min(retry_deadline, deadline.expires_at)
+    writer = _open_download_writer(filename)
+    state: Dict[str, Any] = {}
+
+    logger.info(
+        f"Попытка получения файла из хранилища {storage.name}: {filename}, "
+        f"бюджет загрузки={retry_deadline - time.monotonic():.1f}с"
+    )
+
     try:
-        # Инициализация клиента Supabase
-        client = init_supabase_client()
-        if not client:
-            logger.error(f"Не удалось инициализировать клиент Supabase для получения файла {filename}")
-            return None
-        
-        # Полный путь к файлу в Supabase
-        bucket = settings.SUPABASE_BUCKET
-        folder = settings.SUPABASE_FOLDER
-        file_path = f"{folder}/{filename}" if folder else filename
-        
-        # Рассчитываем таймаут в зависимости от среды
-        is_vercel = os.environ.get("VERCEL") == "1"
-        vercel_timeout = 3.0  # в Vercel используем короткий таймаут, чтобы избежать лимита 10 секунд
-        default_timeout = 20.0
-        timeout = vercel_timeout if is_vercel else default_timeout
-        
-        logger.info(f"Попытка получения файла из Supabase: бакет={bucket}, путь={file_path}" + 
-                  (f", таймаут={timeout}с (Vercel)" if is_vercel else f", таймаут={timeout}с"))
-        
-        # Сначала пробуем API метод с меньшим таймаутом для Vercel
-        # В Vercel у нас всего 10 секунд на весь запрос
-        try:
-            # Пытаемся получить файл через API
-            logger.debug(f"Скачивание файла через API: {file_path}")
-            response = client.storage.from_(bucket).download(file_path)
-            if response:
-                logger.info(f"Файл {filename} успешно получен через API, размер: {len(response)} байт")
-                # Сохраняем в кеш
-                cache_file_content(filename, response)
-                return response
-            else:
-                logger.warning(f"API вернул пустой ответ для файла {filename}")
-        except Exception as api_error:
-            # Логируем ошибку API
-            logger.error(f"Ошибка при получении файла через API: {str(api_error)}")
-            logger.error(f"Детали ошибки API: {traceback.format_exc()}")
-            
-            # В Vercel проверяем, сколько времени осталось до таймаута
-            # Если осталось мало времени, пропускаем запрос по публичному URL
-            if is_vercel:
-                logger.warning("Vercel среда: пропускаем попытку доступа через публичный URL")
-                return None
-            
-            # Попробуем получить через публичный URL
-            try:
-                logger.info(f"Попытка получения файла через публичный URL: {filename}")
-                public_url = client.storage.from_(bucket).get_public_url(file_path)
-                logger.debug(f"Публичный URL: {public_url}")
-                
-                with httpx.Client(timeout=timeout) as http_client:
-                    response = http_client.get(public_url)
-                    if response.status_code == 200:
-                        content = response.content
-                        logger.info(f"Файл {filename} успешно получен через публичный URL, размер: {len(content)} байт")
-                        # Сохраняем в кеш
-                        cache_file_content(filename, content)
-                        return content
-                    else:
-                        logger.error(f"Ошибка при получении через публичный URL. Статус: {response.status_code}, тело: {response.text[:200]}")
-            except Exception as url_error:
-                logger.error(f"Ошибка при получении файла через публичный URL: {str(url_error)}")
-                logger.error(f"Детали ошибки URL: {traceback.format_exc()}")
-    
+        completed = storage.download(filename, writer, state, retry_deadline)
+
+        if completed and writer.size > 0:
+            content = writer.commit(etag=state.get("etag"), last_modified=state.get("last_modified"))
+            if content:
+                logger.info(f"Файл {filename} успешно получен из хранилища, размер: {len(content)} байт")
+                # Скачанное в общий кеш уже доступно всем воркерам, в кеш процесса кладем только буфер
+                if isinstance(content, bytes):
+                    cache_file_content(
+                        filename,
+                        content,
+                        etag=state.get("etag"),
+                        last_modified=state.get("last_modified")
+                    )
+                return content
+        else:
+            writer.abort()
     except Exception as e:
+        writer.abort()
         logger.error(f"Ошибка при получении файла {filename}: {str(e)}")
         logger.error(f"Детали общей ошибки: {traceback.format_exc()}")
     
     logger.error(f"Не удалось получить содержимое файла {filename} ни одним из методов")
     return None
 
-def dataframe_to_bytes(df: pd.DataFrame, extension: str, encoding: str, separator: str) -> bytes:
+def get_content_hash(filename: str, content) -> str:
+    """
+    Возвращает sha256 содержимого файла.
+    Использует хеш, уже посчитанный кешем, и считает заново только если его нет
+    """
+    for validators in (get_cache_validators(filename), get_shared_entry(filename)):
+        if validators and validators.get("content_hash") and validators.get("size", len(content)) == len(content):
+            return validators["content_hash"]
+    return hashlib.sha256(content).hexdigest()
+
+# Фоновая ревалидация устаревших записей кеша (stale-while-revalidate)
+_revalidation_executor: Optional[ThreadPoolExecutor] = None
+_revalidating_files: set = set()
+_revalidation_lock = threading.Lock()
+
+class _BufferWriter:
+    """
+    Запись загружаемого файла в память, если общий кеш хоста недоступен.
+    Интерфейс совпадает с SharedCacheWriter
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._buffer = bytearray()
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+
+    def reset(self) -> None:
+        self._buffer = bytearray()
+
+    def commit(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> bytes:
+        content = bytes(self._buffer)
+        self._buffer = bytearray()
+        put_shared_content(filename=self.filename, content=content, etag=etag, last_modified=last_modified)
+        return content
+
+    def abort(self) -> None:
+        self._buffer = bytearray()
+
+def _open_download_writer(filename: str):
+    """
+    Возвращает приемник для блоков загружаемого файла: файл общего кеша или буфер в памяти
+    """
+    if is_shared_cache_enabled():
+        try:
+            return SharedCacheWriter(filename)
+        except Exception as e:
+            logger.warning(f"Не удалось открыть запись в общий кеш для {filename}: {str(e)}")
+    return _BufferWriter(filename)
+
+def schedule_cache_revalidation(filename: str) -> None:
+    """
+    Запускает фоновую проверку актуальности устаревшей записи кеша.
+    Повторный вызов для файла, который уже проверяется, игнорируется
+    """
+    global _revalidation_executor
+
+    with _revalidation_lock:
+        if filename in _revalidating_files:
+            logger.debug(f"Ревалидация файла {filename} уже выполняется")
+            return
+        _revalidating_files.add(filename)
+
+        if _revalidation_executor is None:
+            _revalidation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-revalidate")
+
+    logger.info(f"Запуск фоновой ревалидации файла {filename}")
+    _revalidation_executor.submit(_revalidate_cached_file, filename)
+
+def _revalidate_cached_file(filename: str) -> None:
+    """
+    Условный запрос к хранилищу для устаревшей записи кеша.
+
+    Передает ETag (или md5 содержимого, который Supabase использует как ETag) и Last-Modified.
+    Если объект не изменился, продлевает TTL записи; иначе сравнивает хеш полученного
+    содержимого с сохраненным и заменяет запись только если объект действительно изменился.
+    """
+    try:
+        validators = get_cache_validators(filename) or get_shared_entry(filename)
+        if not validators:
+            return
+
+        etag = validators.get("etag") or f'"{validators["md5"]}"'
+        changed = get_storage().get_if_changed(filename, etag=etag, last_modified=validators.get("last_modified"))
+
+        if changed is None:
+            refresh_cache_entry(filename)
+            refresh_shared_entry(filename)
+            logger.info(f"Файл {filename} не изменился (304), загрузка не потребовалась")
+        else:
+            content, meta = changed
+            new_etag = meta.get("etag")
+            new_last_modified = meta.get("last_modified")
+            if compute_content_hashes(content)["content_hash"] == validators.get("content_hash"):
+                refresh_cache_entry(filename, etag=new_etag, last_modified=new_last_modified)
+                refresh_shared_entry(filename, etag=new_etag, last_modified=new_last_modified)
+                logger.info(f"Файл {filename} не изменился (совпадает хеш содержимого)")
+            else:
+                # Запись процесса обновляется, только если она была (или общий кеш недоступен)
+                shared = put_shared_content(filename, content, etag=new_etag, last_modified=new_last_modified)
+                if get_cache_validators(filename) or not shared:
+                    cache_file_content(filename, content, etag=new_etag, last_modified=new_last_modified)
+                logger.info(f"Файл {filename} изменился в хранилище, кеш обновлен ({len(content)} байт)")
+    except StorageNotFoundError:
+        # Оставляем устаревшую запись: следующий запрос повторит ревалидацию
+        logger.warning(f"Ревалидация файла {filename} не удалась: объект не найден в хранилище")
+    except Exception as e:
+        logger.error(f"Ошибка при ревалидации файла {filename}: {str(e)}")
+        logger.debug(traceback.format_exc())
+    finally:
+        with _revalidation_lock:
+            _revalidating_files.discard(filename)
+
+def dataframe_to_bytes(df: "pd.DataFrame", extension: str, encoding: str, separator: str) -> bytes:
     """
     Преобразование DataFrame в байты для сохранения в файл
     
@@ -667,7 +735,10 @@ def dataframe_to_bytes(df: pd.DataFrame, extension: str, encoding: str, separato
 def check_bucket_exists(bucket_name: str) -> bool:
     """Проверяет существование бакета в Supabase."""
     try:
-        buckets = supabase_client.storage.list_buckets()
+        client = init_supabase_client()
+        if not client:
+            return False
+        buckets = client.storage.list_buckets()
         logger.info(f"Найдены бакеты: {[b['name'] for b in buckets]}")
         return any(bucket['name'] == bucket_name for bucket in buckets)
     except Exception as e:
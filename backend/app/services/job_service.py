@@ -0,0 +1,227 @@
+from typing import Dict, Any, Optional, Callable
+import json
+import time
+import uuid
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.services.storage import get_storage, StorageNotFoundError
+
+logger = logging.getLogger("app.services.job_service")
+
+# Фоновые задачи, которые продолжают обработку, если запрос не уложился в свой бюджет времени.
+# Задачи выполняются в процессе, который принял запрос; состояние опубликованных задач
+# (тех, чей идентификатор получил клиент) пишется в хранилище, чтобы /jobs/{id} мог
+# ответить любой экземпляр приложения. Сам результат в запись не попадает — только ссылка
+# на него (result_id), результат уже сохранен хранилищем результатов
+MAX_JOBS = 100
+JOB_TTL = 3600  # Сколько хранится завершенная задача (1 час)
+# Запас сверх бюджета задачи, после которого незавершенная задача из хранилища считается потерянной
+JOB_LOST_GRACE_SECONDS = 60
+# Префикс записей задач в хранилище: очистка удаляет их через JOB_TTL, а не вместе с файлами пользователей
+JOB_KEY_PREFIX = "job_"
+
+jobs: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="background-job")
+    return _executor
+
+def _cleanup_jobs() -> None:
+    """
+    Удаляет завершенные задачи старше JOB_TTL и самые старые задачи сверх MAX_JOBS (вызывать под _jobs_lock)
+    """
+    now = time.time()
+    for job_id in [job_id for job_id, job in jobs.items() if job["finished_at"] and now - job["finished_at"] > JOB_TTL]:
+        jobs.pop(job_id)
+
+    while len(jobs) > MAX_JOBS:
+        job_id, job = next(((job_id, job) for job_id, job in jobs.items() if job["future"].done()), (None, None))
+        if job_id is None:
+            break
+        jobs.pop(job_id)
+
+def _job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}.json"
+
+def submit_job(
+    kind: str,
+    func: Callable[[Deadline], Any],
+    timeout: Optional[float] = None,
+    encode: Optional[Callable[[Any], Any]] = None,
+    reference: Optional[Callable[[Any], Dict[str, Any]]] = None
+) -> str:
+    """
+    Запускает задачу в фоне
+
+    Args:
+        kind: Тип задачи (для логов и ответа API)
+        func: Функция, принимающая бюджет времени задачи
+        timeout: Бюджет задачи в секундах (по умолчанию JOB_DEADLINE_SECONDS)
+        encode: Преобразование результата в JSON-совместимый вид для ответа /jobs/{id}
+            (по умолчанию результат отдается как есть)
+        reference: Ссылки на сохраненный результат (например, {"result_id": ...}), которые
+            записываются в хранилище вместо результата для ответа других экземпляров
+
+    Returns:
+        str: Идентификатор задачи
+    """
+    job_id = str(uuid.uuid4())
+    deadline = Deadline(timeout if timeout is not None else settings.JOB_DEADLINE_SECONDS)
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "deadline": deadline,
+        "created_at": time.time(),
+        "finished_at": None,
+        "future": None,
+        "encode": encode,
+        "reference": reference,
+        "published": False,
+        "write_lock": threading.Lock()
+    }
+
+    def run() -> Any:
+        try:
+            return func(deadline)
+        except Exception as e:
+            logger.error(f"Ошибка фоновой задачи {kind} {job_id}: {str(e)}")
+            logger.debug(traceback.format_exc())
+            raise
+        finally:
+            job["finished_at"] = time.time()
+
+    def persist_if_published(_: Future) -> None:
+        with _jobs_lock:
+            published = job["published"]
+        if published:
+            _persist_job(job)
+
+    with _jobs_lock:
+        _cleanup_jobs()
+        jobs[job_id] = job
+        job["future"] = _get_executor().submit(run)
+    job["future"].add_done_callback(persist_if_published)
+
+    logger.info(f"Запущена фоновая задача {kind}: {job_id}")
+    return job_id
+
+def publish_job(job_id: str) -> None:
+    """
+    Отмечает, что идентификатор задачи отдан клиенту: текущее состояние задачи, а после
+    завершения — ее итог и результат, сохраняются в хранилище
+    """
+    with _jobs_lock:
+        job = jobs.get(job_id)
+        if not job:
+            return
+        job["published"] = True
+    _persist_job(job)
+
+def _job_state(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Состояние задачи процесса: статус, этап обработки и промежуточная статистика
+    """
+    future: Future = job["future"]
+    if not future.done():
+        status = "running" if future.running() else "pending"
+    elif future.exception() is not None:
+        status = "failed"
+    else:
+        status = "done"
+
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": status,
+        "error": str(future.exception()) if status == "failed" else None,
+        **job["deadline"].snapshot()
+    }
+
+def _job_result(job: Dict[str, Any]) -> Any:
+    result = job["future"].result(timeout=0)
+    return job["encode"](result) if job["encode"] else result
+
+def _persist_job(job: Dict[str, Any]) -> None:
+    """
+    Записывает состояние задачи (и ссылку на результат завершенной) в хранилище.
+    Запись под блокировкой задачи: последняя запись всегда отражает последнее состояние
+    """
+    with job["write_lock"]:
+        try:
+            record = {**_job_state(job), "created_at": job["created_at"], "timeout": job["deadline"].timeout}
+            if record["status"] == "done" and job["reference"]:
+                record.update(job["reference"](job["future"].result(timeout=0)))
+            content = json.dumps(record, ensure_ascii=False, default=str).encode("utf-8")
+            get_storage().put(_job_key(job["id"]), content, "application/json")
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить состояние задачи {job['id']} в хранилище: {str(e)}")
+            logger.debug(traceback.format_exc())
+
+def _load_job_record(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Состояние задачи, сохраненное в хранилище другим экземпляром приложения (или None)
+    """
+    try:
+        record = json.loads(get_storage().get(_job_key(job_id)))
+    except StorageNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать состояние задачи {job_id} из хранилища: {str(e)}")
+        return None
+
+    # Процесс, выполнявший задачу, завершился раньше нее: запись больше не обновится
+    if record["status"] in ("pending", "running") and \
+            time.time() - record["created_at"] > record["timeout"] + JOB_LOST_GRACE_SECONDS:
+        record.update(status="failed", error="Задача прервана: процесс, выполнявший ее, завершился")
+    return record
+
+def get_job_future(job_id: str) -> Optional[Future]:
+    """
+    Возвращает Future задачи (чтобы дождаться результата в пределах бюджета запроса)
+    """
+    with _jobs_lock:
+        job = jobs.get(job_id)
+    return job["future"] if job else None
+
+def get_job_result(job_id: str) -> Any:
+    """
+    Возвращает результат завершенной задачи процесса (исключение задачи пробрасывается)
+    """
+    with _jobs_lock:
+        job = jobs.get(job_id)
+    if not job:
+        raise KeyError(job_id)
+    return job["future"].result(timeout=0)
+
+def get_job_status(job_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Состояние задачи для ответа API: статус, этап обработки и промежуточная статистика.
+    Задачи других экземпляров приложения читаются из хранилища: вместо результата
+    в них ссылки на сохраненный результат (result_id)
+
+    Args:
+        include_result: Добавить результат завершенной задачи процесса (поле result)
+    """
+    with _jobs_lock:
+        job = jobs.get(job_id)
+    if not job:
+        return _load_job_record(job_id)
+
+    job_status = _job_state(job)
+    if job_status["status"] == "done":
+        # Ссылки на результат — как в записи задачи в хранилище, чтобы ответ не зависел от экземпляра
+        if job["reference"]:
+            job_status.update(job["reference"](job["future"].result(timeout=0)))
+        if include_result:
+            job_status["result"] = _job_result(job)
+    return job_status
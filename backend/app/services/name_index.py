@@ -0,0 +1,161 @@
+import re
+import math
+import logging
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger("app.services.name_index")
+
+NGRAM_SIZE = 3
+# Все, что не буква и не цифра, считается разделителем слов
+NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+def normalize_name(name: Any) -> str:
+    """
+    Приводит наименование товара к виду для нечеткого сравнения:
+    нижний регистр, ё -> е, знаки препинания и повторные пробелы -> один пробел
+    """
+    if name is None or name != name:  # None и NaN
+        return ""
+    text = str(name).lower().replace("ё", "е")
+    return NON_WORD_RE.sub(" ", text).strip()
+
+def name_ngrams(name: str) -> frozenset:
+    """
+    Множество триграмм нормализованного наименования (с пробелами по краям,
+    чтобы начало и конец слова давали отдельные триграммы)
+    """
+    if not name:
+        return frozenset()
+    padded = f" {name} "
+    return frozenset(padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1))
+
+class NameIndex:
+    """
+    Инвертированный индекс триграмм наименований: триграмма -> номера строк.
+
+    Кандидаты для наименования находятся по общим триграммам без попарного сравнения
+    со всеми строками. Триграммы, встречающиеся чаще чем в FUZZY_MAX_POSTING_SIZE строках
+    (например, " ма" в каждом "масло ..."), при отборе кандидатов пропускаются — они почти
+    ничего не различают, а их списки дали бы квадратичное время. Итоговая оценка
+    кандидатов считается точно, по всем триграммам (коэффициент Дайса)
+    """
+
+    def __init__(self, names: Sequence[Any], max_posting_size: Optional[int] = None):
+        self.max_posting_size = max_posting_size or settings.FUZZY_MAX_POSTING_SIZE
+        self.ngrams = [name_ngrams(normalize_name(name)) for name in names]
+        self.sizes = np.fromiter((len(grams) for grams in self.ngrams), dtype=np.int64, count=len(self.ngrams))
+
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for row, grams in enumerate(self.ngrams):
+            for gram in grams:
+                postings[gram].append(row)
+
+        self.postings = {
+            gram: np.asarray(rows, dtype=np.int64)
+            for gram, rows in postings.items()
+            if len(rows) <= self.max_posting_size
+        }
+        self._frequent = {gram for gram, rows in postings.items() if len(rows) > self.max_posting_size}
+        self.skipped_ngrams = len(self._frequent)
+
+    def __len__(self) -> int:
+        return len(self.ngrams)
+
+    def candidates(self, name: Any, limit: int = 3, min_similarity: float = 0.5) -> List[tuple]:
+        """
+        Лучшие строки индекса для наименования
+
+        Кандидаты отбираются только по самым редким триграммам запроса (префиксная фильтрация):
+        строка со сходством не ниже min_similarity обязана содержать хотя бы одну из них
+
+        Returns:
+            List[tuple]: (номер строки, сходство от 0 до 1), по убыванию сходства
+        """
+        grams = name_ngrams(normalize_name(name))
+        if not grams:
+            return []
+
+        # Для сходства Дайса t общих триграмм не меньше t * |q| / (2 - t)
+        min_overlap = max(1, math.ceil(min_similarity * len(grams) / (2 - min_similarity)))
+        ranked = sorted(grams, key=lambda gram: len(self.postings[gram]) if gram in self.postings else (
+            0 if gram not in self._frequent else self.max_posting_size + 1
+        ))
+        prefix = ranked[:len(grams) - min_overlap + 1]
+        lists = [self.postings[gram] for gram in prefix if gram in self.postings]
+        if not lists:
+            return []
+
+        rows, shared = np.unique(np.concatenate(lists), return_counts=True)
+
+        # Верхняя оценка сходства отсекает заведомо слабых кандидатов до точного подсчета
+        upper = 2 * (shared + len(grams) - len(prefix)) / (self.sizes[rows] + len(grams))
+        keep = np.flatnonzero(upper >= min_similarity)
+        if len(keep) > limit * 10:
+            keep = keep[np.argpartition(-upper[keep], limit * 10)[:limit * 10]]
+
+        scored = []
+        for row in rows[keep].tolist():
+            similarity = 2 * len(grams & self.ngrams[row]) / (len(grams) + self.sizes[row])
+            if similarity >= min_similarity:
+                scored.append((row, round(float(similarity), 4)))
+
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+def attach_name_candidates(
+    items: List[Dict[str, Any]],
+    others: List[Dict[str, Any]],
+    name_field: str,
+    other_name_field: str,
+    other_price_field: str,
+    limit: int,
+    min_similarity: float,
+    deadline: Optional[Deadline] = None
+) -> int:
+    """
+    Добавляет строкам items поле candidates — похожие по наименованию строки others
+
+    Используется для товаров без пары по артикулу (missing_in_store / missing_in_supplier).
+    Если бюджет времени почти исчерпан, выбрасывается DeadlineExceeded: сравнение продолжает
+    фоновая задача (или запрос получает 504), а неполный результат не кешируется
+
+    Returns:
+        int: Количество строк, для которых найден хотя бы один кандидат
+    """
+    if not items or not others:
+        return 0
+
+    index = NameIndex([other.get(other_name_field) for other in others])
+    if index.skipped_ngrams:
+        logger.info(f"Индекс наименований: {len(index)} строк, пропущено частых триграмм: {index.skipped_ngrams}")
+
+    found = 0
+    for position, item in enumerate(items):
+        if deadline and position % 1000 == 0 and position > 0:
+            deadline.progress.update(fuzzy_processed=position, fuzzy_found=found)
+            if deadline.nearly_expired():
+                # Результат с кандидатами только для части строк попал бы в кеш результатов
+                # под обычным ключом, поэтому неполный поиск прерывает все сравнение
+                logger.warning(f"Поиск по наименованиям прерван по бюджету времени: обработано {position} из {len(items)}")
+                raise DeadlineExceeded("fuzzy", deadline.elapsed())
+
+        candidates = [
+            {
+                "article": others[row]["article"],
+                "name": others[row].get(other_name_field),
+                "price": others[row].get(other_price_field),
+                "similarity": similarity
+            }
+            for row, similarity in index.candidates(item.get(name_field), limit, min_similarity)
+        ]
+        if candidates:
+            item["candidates"] = candidates
+            found += 1
+
+    return found
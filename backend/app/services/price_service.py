@@ -1,10 +1,11 @@
 import os
 import uuid
-import pandas as pd
-import io
 from typing import List, Dict, Any
+import numpy as np
+import pandas as pd
 from app.models.file import FileInfo, PriceUpdate
-from app.services.file_service import get_file_content, read_file, save_file
+from app.services.article_index import ArticleIndex
+from app.services.file_service import get_file_buffer, read_file, save_file, dataframe_to_bytes
 from app.core.config import settings
 
 def update_prices(updates: List[PriceUpdate], store_file: FileInfo) -> List[PriceUpdate]:
@@ -18,9 +19,17 @@ def update_prices(updates: List[PriceUpdate], store_file: FileInfo) -> List[Pric
 def save_updated_file(store_file: FileInfo, updates: List[PriceUpdate]) -> Dict[str, Any]:
     """
     Сохранение обновленного прайс-листа магазина
+
+    Строки файла находятся по артикулу магазина из обновления (store_article, иначе article)
+    по тем же правилам нормализации, что и при сравнении; если артикул в файле повторяется,
+    обновляются все его строки
+
+    Returns:
+        Dict[str, Any]: filename, download_url, count, updated_rows (обновленных строк файла)
+            и unmatched (обновления, артикула которых нет в файле)
     """
     # Получаем содержимое файла
-    file_content = get_file_content(store_file.stored_filename)
+    file_content = get_file_buffer(store_file.stored_filename)
     if not file_content:
         raise ValueError("Не удалось получить содержимое файла")
     
@@ -38,45 +47,42 @@ def save_updated_file(store_file: FileInfo, updates: List[PriceUpdate]) -> Dict[
     # Получение имени колонки с артикулом и ценой
     article_col = store_file.column_mapping.article_column
     price_col = store_file.column_mapping.price_column
+    rules = store_file.column_mapping.article_normalization
+    
+    # Индекс файла со всеми строками каждого артикула и индекс обновлений с теми же правилами
+    # (при повторе артикула в обновлениях действует последнее)
+    store_index = ArticleIndex(df[article_col], rules, policy="all")
+    update_index = ArticleIndex(pd.Series([update.store_article or update.article for update in updates], dtype=object), rules)
+    new_prices = np.array([update.new_price for update in updates], dtype=float)
     
-    # Преобразуем артикулы в строки для соответствия
-    df[article_col] = df[article_col].astype(str)
+    key_rows, rows, _ = store_index.join(pd.Series(update_index.unique_keys, dtype=object))
+    if len(rows):
+        # Колонка цены приводится к общему с новыми ценами типу (например, int -> float),
+        # затем все строки обновляются одним позиционным присваиванием
+        df[price_col] = df[price_col].astype(np.result_type(df[price_col].dtype, new_prices.dtype))
+        df.iloc[rows, df.columns.get_loc(price_col)] = new_prices[update_index.positions[key_rows]]
     
-    # Обновление цен
-    for update in updates:
-        article = update.article
-        new_price = update.new_price
-        
-        # Найти индексы строк с соответствующим артикулом
-        indices = df[df[article_col] == article].index
-        
-        # Обновить цены в этих строках
-        for idx in indices:
-            df.at[idx, price_col] = new_price
+    # Обновления, для которых в файле нет строки с таким артикулом
+    found = store_index.contains(update_index.keys)
+    unmatched = [update for update, is_found in zip(updates, found) if not is_found]
     
     # Создание нового имени файла с обновленными ценами
     new_filename = f"updated_{uuid.uuid4()}{file_extension}"
     
-    # Сохранение файла в байтовый поток
-    output = io.BytesIO()
-    
-    if file_extension.lower() in ['.xlsx', '.xls']:
-        df.to_excel(output, index=False)
-    else:
-        df.to_csv(output, index=False, sep=store_file.separator, encoding=store_file.encoding)
-    
-    # Получаем содержимое байтового потока
-    output.seek(0)
-    updated_content = output.getvalue()
-    
     # Сохранение файла
-    save_file(new_filename, updated_content)
+    updated_content = dataframe_to_bytes(df, file_extension, store_file.encoding, store_file.separator)
+    save_path = save_file(new_filename, updated_content)
     
-    # Создаем URL для скачивания
-    download_url = f"/uploads/{new_filename}"
+    # Для Supabase возвращается полный URL, для остальных хранилищ — адрес скачивания через API
+    if save_path.startswith("http"):
+        download_url = save_path
+    else:
+        download_url = f"/api/v1/files/download/{new_filename}"
     
     return {
         "filename": new_filename,
         "download_url": download_url,
-        "count": len(updates)
-    } 
\ No newline at end of file
+        "count": len(updates),
+        "updated_rows": len(rows),
+        "unmatched": unmatched
+    }
@@ -0,0 +1,176 @@
+from typing import Dict, Any, Optional, Callable
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger("app.services.result_cache")
+
+# Максимальный объем кеша результатов сравнения
+MAX_RESULT_CACHE_SIZE_MB = 256
+
+# LRU-кеш результатов: ключ -> {"result", "size", "timestamp", "hits"}
+result_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+
+# Текущий (оценочный) объем кеша в байтах
+current_result_cache_size = 0
+
+# Вычисления, которые выполняются прямо сейчас: одинаковые запросы ждут один Future
+_inflight: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+def make_result_key(*parts: Any) -> str:
+    """
+    Строит ключ кеша из хешей содержимого файлов, маппингов колонок и параметров сравнения
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _row_size(row: Any) -> int:
+    """
+    Объем одной строки результата: словарь или модель (значения без рекурсии)
+    """
+    values = row.__dict__ if hasattr(row, "model_fields") else row
+    if isinstance(values, dict):
+        return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values.values())
+    return sys.getsizeof(values)
+
+def estimate_result_size(result: Any) -> int:
+    """
+    Оценивает объем результата сравнения в памяти по числу строк списков
+
+    Результат не сериализуется (model_dump на каждом промахе кеша стоил бы как копия
+    результата): объем списка — размер первой строки, умноженный на число строк
+    """
+    data = result.__dict__ if hasattr(result, "model_fields") else result
+    if not isinstance(data, dict):
+        return sys.getsizeof(data)
+
+    # Колоночная таблица результата сравнения (ComparisonTable) знает свой объем
+    table = getattr(result, "_columnar", None)
+    total = sys.getsizeof(data) + (table.size if table is not None else 0)
+    for value in data.values():
+        if hasattr(value, "model_fields"):
+            total += estimate_result_size(value)
+        elif isinstance(value, list) and value:
+            # Оцениваем по первой строке: строки результата имеют одинаковую структуру
+            total += sys.getsizeof(value) + _row_size(value[0]) * len(value)
+        else:
+            total += sys.getsizeof(value)
+    return total
+
+def _store(key: str, result: Any, size: int) -> None:
+    """
+    Кладет результат в кеш, вытесняя старые записи при превышении лимита (вызывать под _lock)
+    """
+    global current_result_cache_size
+
+    max_size = MAX_RESULT_CACHE_SIZE_MB * 1024 * 1024
+    if size > max_size:
+        logger.warning(f"Результат {key[:12]} слишком большой для кеша: {size / (1024 * 1024):.2f} МБ")
+        return
+
+    if key in result_cache:
+        current_result_cache_size -= result_cache.pop(key)["size"]
+
+    while result_cache and current_result_cache_size + size > max_size:
+        oldest_key, oldest_value = result_cache.popitem(last=False)
+        current_result_cache_size -= oldest_value["size"]
+        logger.info(f"Удален результат из кеша (LRU): {oldest_key[:12]}, освобождено {oldest_value['size'] / (1024 * 1024):.2f} МБ")
+
+    result_cache[key] = {
+        "result": result,
+        "size": size,
+        "timestamp": time.time(),
+        "hits": 0
+    }
+    current_result_cache_size += size
+
+def get_cached_result(key: str) -> Optional[Any]:
+    """
+    Возвращает результат из кеша (или None)
+    """
+    with _lock:
+        entry = result_cache.get(key)
+        if entry is None:
+            return None
+        result_cache.move_to_end(key)
+        entry["hits"] += 1
+        return entry["result"]
+
+def get_or_compute_result(
+    key: str,
+    compute: Callable[[], Any],
+    size_of: Callable[[Any], int] = estimate_result_size
+) -> Any:
+    """
+    Возвращает результат из кеша или вычисляет его.
+
+    Если такой же результат уже вычисляется в другом потоке, ждет его вместо
+    повторного вычисления. Исключения из compute не кешируются и передаются всем ожидающим.
+    """
+    with _lock:
+        entry = result_cache.get(key)
+        if entry is not None:
+            result_cache.move_to_end(key)
+            entry["hits"] += 1
+            logger.info(f"Результат сравнения найден в кеше: {key[:12]}")
+            return entry["result"]
+
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+
+    if not owner:
+        logger.info(f"Ожидаем результат такого же сравнения, которое уже выполняется: {key[:12]}")
+        return future.result()
+
+    # Размер и запись в кеш — внутри try: при любой ошибке Future получает исключение и
+    # ключ снимается с _inflight, иначе следующие такие же запросы ждали бы его вечно
+    try:
+        result = compute()
+        size = size_of(result)
+        with _lock:
+            _store(key, result, size)
+            _inflight.pop(key, None)
+    except BaseException as e:
+        with _lock:
+            _inflight.pop(key, None)
+        future.set_exception(e)
+        raise
+
+    future.set_result(result)
+    return result
+
+def clear_result_cache() -> None:
+    """
+    Полностью очищает кеш результатов
+    """
+    global current_result_cache_size
+    with _lock:
+        result_cache.clear()
+        current_result_cache_size = 0
+
+def get_result_cache_stats() -> Dict[str, Any]:
+    """
+    Возвращает статистику кеша результатов для отладки
+    """
+    with _lock:
+        return {
+            "entries_count": len(result_cache),
+            "total_size_mb": current_result_cache_size / (1024 * 1024),
+            "max_size_mb": MAX_RESULT_CACHE_SIZE_MB,
+            "inflight": len(_inflight),
+            "entries": [{
+                "key": key[:12],
+                "size_mb": entry["size"] / (1024 * 1024),
+                "hits": entry["hits"],
+                "age_seconds": time.time() - entry["timestamp"]
+            } for key, entry in result_cache.items()]
+        }
@@ -0,0 +1,153 @@
+import json
+import logging
+from typing import Dict, Any, List, Iterator, Optional, TYPE_CHECKING
+
+from app.core.config import settings
+
+# pyarrow и msgpack — необязательные зависимости: импортируются при первом запросе
+# соответствующего формата, без них сервер отвечает 406
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger("app.services.result_formats")
+
+JSON_MEDIA_TYPE = "application/json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Типы из заголовка Accept -> формат результата
+MEDIA_TYPE_FORMATS = {
+    JSON_MEDIA_TYPE: "json",
+    NDJSON_MEDIA_TYPE: "ndjson",
+    ARROW_MEDIA_TYPE: "arrow",
+    MSGPACK_MEDIA_TYPE: "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+}
+
+# Пакеты, необходимые для бинарных форматов
+FORMAT_PACKAGES = {"arrow": "pyarrow", "msgpack": "msgpack"}
+
+class FormatUnavailableError(Exception):
+    """
+    Запрошенный формат результата недоступен: не установлен необходимый пакет
+    """
+
+def negotiate_result_format(accept: Optional[str]) -> str:
+    """
+    Выбирает формат ответа по заголовку Accept с учетом q-параметров
+
+    Returns:
+        str: json, ndjson, arrow или msgpack (json, если подходящих типов нет)
+    """
+    candidates = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type.lower() in MEDIA_TYPE_FORMATS and quality > 0:
+            candidates.append((-quality, position, MEDIA_TYPE_FORMATS[media_type.lower()]))
+
+    return min(candidates)[2] if candidates else "json"
+
+def _import_format_package(result_format: str):
+    package = FORMAT_PACKAGES[result_format]
+    try:
+        return __import__(package)
+    except ImportError:
+        logger.warning(f"Запрошен формат {result_format}, но пакет {package} не установлен")
+        raise FormatUnavailableError(f"Формат {result_format} недоступен: на сервере не установлен пакет {package}")
+
+def ensure_format_available(result_format: str) -> None:
+    """
+    Проверяет, что пакет для формата установлен (FormatUnavailableError, если нет)
+    """
+    if result_format in FORMAT_PACKAGES:
+        _import_format_package(result_format)
+
+def combine_sections(sections: Dict[str, "pd.DataFrame"]) -> "pd.DataFrame":
+    """
+    Разделы результата одной таблицей с колонкой section (для форматов с одной схемой, как Arrow);
+    колонки, которых нет в разделе, заполняются пустыми значениями
+    """
+    import pandas as pd
+
+    frames = [df.assign(section=section) for section, df in sections.items()]
+    combined = pd.concat(frames, ignore_index=True, sort=False)
+    return combined[["section"] + [column for column in combined.columns if column != "section"]]
+
+def arrow_stream(df: "pd.DataFrame", metadata: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """
+    Строки в формате Arrow IPC (потоковый вариант), пачками по RESULT_STREAM_BATCH_SIZE
+
+    Числовые колонки передаются в Arrow без преобразования по строкам; metadata (сводка
+    результата) записывается в метаданные схемы под ключом comparison в виде JSON.
+    pyarrow импортируется и таблица строится сразу при вызове, чтобы отсутствие пакета
+    или ошибка преобразования были видны до начала ответа
+    """
+    pa = _import_format_package("arrow")
+    import pyarrow.ipc
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata is not None:
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"comparison": json.dumps(metadata, ensure_ascii=False, default=str).encode("utf-8")
+        })
+
+    def generate() -> Iterator[bytes]:
+        chunks: List[bytes] = []
+        sink = pa.PythonFile(_ChunkSink(chunks), mode="w")
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=settings.RESULT_STREAM_BATCH_SIZE):
+                writer.write_batch(batch)
+                yield b"".join(chunks)
+                chunks.clear()
+        yield b"".join(chunks)
+
+    return generate()
+
+class _ChunkSink:
+    """
+    Файловый объект для записи потока Arrow: байты накапливаются до отправки клиенту
+    """
+
+    def __init__(self, chunks: List[bytes]):
+        self.chunks = chunks
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+def frame_columns(df: "pd.DataFrame") -> Dict[str, list]:
+    """
+    Колонки DataFrame списками значений (пустые значения текстовых колонок -> None)
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object:
+            values = values.where(values.notna(), None)
+        columns[column] = values.tolist()
+    return columns
+
+def msgpack_payload(payload: Dict[str, Any]) -> bytes:
+    """
+    Ответ в формате MessagePack; строки результата передаются колонками (frame_columns)
+    """
+    msgpack = _import_format_package("msgpack")
+    return msgpack.packb(payload, use_bin_type=True, default=str)
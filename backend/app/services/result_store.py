@@ -0,0 +1,328 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+import json
+from typing import Dict, Any, Iterator, List, Optional, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.storage import get_storage, StorageNotFoundError
+
+if TYPE_CHECKING:
+    from app.models.file import ComparisonResult
+
+logger = logging.getLogger("app.services.result_store")
+
+# Разделы результата сравнения и колонки, по которым ищется текст
+SECTIONS = ("matches", "missing_in_store", "missing_in_supplier")
+SEARCH_COLUMNS = ("article", "supplier_name", "store_name")
+
+# Тип изменения цены для совпавших товаров: знак разницы цены поставщика и магазина
+CHANGE_TYPES = ("increase", "decrease", "unchanged")
+
+class ComparisonTable:
+    """
+    Результат сравнения в колоночном виде: по DataFrame на раздел.
+
+    Страницы строятся прямо из колонок: фильтры дают маску numpy, порядок сортировки
+    по колонке вычисляется один раз и переиспользуется для всех страниц и фильтров,
+    в словари превращаются только строки запрошенной страницы.
+    created_at — время вычисления результата (при восстановлении — из его источника)
+    """
+
+    def __init__(self, sections: Dict[str, pd.DataFrame]):
+        self.sections = sections
+        self.created_at = time.time()
+        self.size = sum(int(df.memory_usage(deep=True).sum()) for df in sections.values())
+        self._orders: Dict[tuple, np.ndarray] = {}
+        self._search_text: Dict[str, pd.Series] = {}
+        self._lock = threading.Lock()
+
+    def counts(self) -> Dict[str, int]:
+        return {section: len(df) for section, df in self.sections.items()}
+
+    def _order(self, section: str, sort_by: str, descending: bool) -> np.ndarray:
+        """
+        Перестановка строк раздела по колонке (кешируется; пустые значения — в конце)
+        """
+        key = (section, sort_by, descending)
+        with self._lock:
+            order = self._orders.get(key)
+        if order is None:
+            df = self.sections[section]
+            order = df[sort_by].reset_index(drop=True).sort_values(
+                ascending=not descending, kind="stable", na_position="last"
+            ).index.to_numpy(dtype=np.int64)
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+    def _text(self, section: str) -> pd.Series:
+        """
+        Артикул и наименования строки в нижнем регистре для текстового поиска (кешируется)
+        """
+        with self._lock:
+            text = self._search_text.get(section)
+        if text is None:
+            df = self.sections[section]
+            columns = [column for column in SEARCH_COLUMNS if column in df.columns]
+            text = df[columns[0]].astype("string").fillna("")
+            for column in columns[1:]:
+                text = text + "\n" + df[column].astype("string").fillna("")
+            text = text.str.lower().reset_index(drop=True)
+            with self._lock:
+                self._search_text[section] = text
+        return text
+
+    def select(
+        self,
+        section: str,
+        sort_by: Optional[str] = None,
+        descending: bool = True,
+        change_type: Optional[str] = None,
+        min_diff_percent: Optional[float] = None,
+        max_diff_percent: Optional[float] = None,
+        search: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Номера строк раздела после фильтров, в порядке сортировки
+
+        Args:
+            section: matches, missing_in_store или missing_in_supplier
+            sort_by: Колонка сортировки (по умолчанию — исходный порядок результата)
+            descending: Сортировка по убыванию
+            change_type: increase, decrease или unchanged (только для matches)
+            min_diff_percent, max_diff_percent: Границы модуля разницы в процентах (только для matches)
+            search: Подстрока артикула или наименования (без учета регистра)
+        """
+        if section not in self.sections:
+            raise ValueError(f"Неизвестный раздел результата: {section}")
+        df = self.sections[section]
+        if sort_by is not None and sort_by not in df.columns:
+            raise ValueError(f"Нельзя сортировать по колонке {sort_by}, доступны: {', '.join(df.columns)}")
+        if (change_type or min_diff_percent is not None or max_diff_percent is not None) and "price_diff" not in df.columns:
+            raise ValueError("Фильтры по изменению цены доступны только для раздела matches")
+
+        mask = np.ones(len(df), dtype=bool)
+        if change_type:
+            if change_type not in CHANGE_TYPES:
+                raise ValueError(f"Неизвестный тип изменения цены: {change_type}, допустимы: {', '.join(CHANGE_TYPES)}")
+            price_diff = df["price_diff"].to_numpy(dtype=float)
+            mask &= {"increase": price_diff > 0, "decrease": price_diff < 0, "unchanged": price_diff == 0}[change_type]
+        if min_diff_percent is not None or max_diff_percent is not None:
+            diff_percent = np.abs(df["price_diff_percent"].to_numpy(dtype=float))
+            if min_diff_percent is not None:
+                mask &= diff_percent >= min_diff_percent
+            if max_diff_percent is not None:
+                mask &= diff_percent <= max_diff_percent
+        if search:
+            mask &= self._text(section).str.contains(search.lower(), regex=False).to_numpy(dtype=bool)
+
+        rows = np.arange(len(df)) if sort_by is None else self._order(section, sort_by, descending)
+        return rows[mask[rows]]
+
+    def records(self, section: str, rows: Optional[np.ndarray] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Строки раздела словарями (пустые значения -> None): только для ответа JSON,
+        rows — номера строк (по умолчанию все), limit — сколько первых строк взять
+        """
+        df = self.sections[section]
+        page = df.iloc[:limit] if rows is None else df.iloc[rows[:limit]]
+        return page.astype(object).where(page.notna(), None).to_dict("records")
+
+    def query(self, section: str, offset: int = 0, limit: int = 100, **filters: Any) -> Dict[str, Any]:
+        """
+        Страница раздела результата с фильтрами и сортировкой (параметры filters — как у select)
+
+        Returns:
+            Dict[str, Any]: total (строк после фильтров), offset, limit, items
+        """
+        rows = self.select(section, **filters)
+
+        return {
+            "total": len(rows),
+            "offset": offset,
+            "limit": limit,
+            "items": self.records(section, rows[offset:offset + limit])
+        }
+
+    def iter_ndjson(self, section: str, rows: Optional[np.ndarray] = None, batch_size: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Строки раздела в формате NDJSON (по объекту JSON на строку), пачками по batch_size
+
+        Каждая пачка сериализуется из колонок кодировщиком JSON pandas, без промежуточных
+        словарей, поэтому память на отдачу не зависит от размера результата
+        """
+        df = self.sections[section]
+        batch_size = batch_size or settings.RESULT_STREAM_BATCH_SIZE
+        total = len(df) if rows is None else len(rows)
+
+        for start in range(0, total, batch_size):
+            batch = df.iloc[start:start + batch_size] if rows is None else df.iloc[rows[start:start + batch_size]]
+            yield batch.to_json(orient="records", lines=True, force_ascii=False, double_precision=15).encode("utf-8")
+
+def build_comparison_table(sections: Dict[str, Any]) -> ComparisonTable:
+    """
+    Колоночный результат из разделов: DataFrame или списков строк-словарей
+    """
+    return ComparisonTable({
+        section: value if isinstance(value, pd.DataFrame) else pd.DataFrame.from_records(value or [])
+        for section, value in sections.items()
+    })
+
+# LRU-хранилище результатов: идентификатор результата -> ComparisonTable
+comparison_tables: OrderedDict[str, ComparisonTable] = OrderedDict()
+# Время последнего сохранения или чтения результата: срок хранения отсчитывается от него,
+# а не от вычисления, поэтому результат из кеша результатов не устаревает сразу
+last_access: Dict[str, float] = {}
+current_store_size = 0
+_lock = threading.Lock()
+
+def _cleanup_tables() -> None:
+    """
+    Удаляет результаты, к которым не обращались дольше RESULT_STORE_TTL_SECONDS (вызывать под _lock)
+    """
+    global current_store_size
+    now = time.time()
+    for result_id in [result_id for result_id in comparison_tables if now - last_access[result_id] > settings.RESULT_STORE_TTL_SECONDS]:
+        current_store_size -= comparison_tables.pop(result_id).size
+        del last_access[result_id]
+
+def save_comparison_result(result_id: str, result: "ComparisonResult") -> str:
+    """
+    Сохраняет результат сравнения в колоночном виде под идентификатором result_id
+
+    Идентификатор — ключ кеша результата (хеши файлов, маппинги, параметры), поэтому
+    повторное сравнение тех же файлов получает тот же идентификатор. Хранилище и кеш
+    результатов разделяют одну таблицу result._columnar (без копии); если ее нет,
+    колонки строятся из списков строк результата
+
+    Returns:
+        str: Идентификатор результата
+    """
+    global current_store_size
+
+    with _lock:
+        _cleanup_tables()
+        if result_id in comparison_tables:
+            comparison_tables.move_to_end(result_id)
+            last_access[result_id] = time.time()
+            return result_id
+
+    if result._columnar is None:
+        result._columnar = build_comparison_table({section: getattr(result, section) for section in SECTIONS})
+    table = result._columnar
+
+    max_size = settings.RESULT_STORE_MAX_SIZE_MB * 1024 * 1024
+    if table.size > max_size:
+        logger.warning(f"Результат {result_id[:12]} слишком большой для хранилища: {table.size / (1024 * 1024):.2f} МБ")
+        return result_id
+
+    with _lock:
+        if result_id in comparison_tables:
+            current_store_size -= comparison_tables.pop(result_id).size
+        while comparison_tables and current_store_size + table.size > max_size:
+            oldest_id, oldest = comparison_tables.popitem(last=False)
+            del last_access[oldest_id]
+            current_store_size -= oldest.size
+            logger.info(f"Удален результат из хранилища (LRU): {oldest_id[:12]}, освобождено {oldest.size / (1024 * 1024):.2f} МБ")
+        comparison_tables[result_id] = table
+        last_access[result_id] = time.time()
+        current_store_size += table.size
+
+    logger.info(f"Результат сравнения сохранен: {result_id[:12]}, строк: {table.counts()}, {table.size / (1024 * 1024):.2f} МБ")
+    return result_id
+
+def iter_result_ndjson(table: ComparisonTable, header: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Весь результат сравнения в формате NDJSON
+
+    Первая строка — header (сводка результата и число строк в разделах), затем для каждого
+    раздела строка {"section": ..., "total": ...} и строки раздела
+    """
+    yield (json.dumps({**header, "sections": table.counts()}, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    for section in SECTIONS:
+        if section not in table.sections:
+            continue
+        yield (json.dumps({"section": section, "total": len(table.sections[section])}) + "\n").encode("utf-8")
+        yield from table.iter_ndjson(section)
+
+# Источник результата: файлы и параметры сравнения, по которым результат строится заново.
+# Хранилище результатов живет в памяти процесса, а запросы страниц в бессерверной среде
+# обычно попадают в другой экземпляр: там результат восстанавливается по источнику
+# (файлы берутся из кешей и хранилища, идентификатор результата зависит от их содержимого)
+MAX_SAVED_SOURCES = 10000
+_saved_sources: set = set()
+
+def _source_key(result_id: str) -> str:
+    return f"result_{result_id}.json"
+
+def save_result_source(result_id: str, source: Dict[str, Any], created_at: float) -> None:
+    """
+    Сохраняет в хранилище источник результата вместе со временем его вычисления
+    (один раз на идентификатор в процессе)
+    """
+    with _lock:
+        if result_id in _saved_sources:
+            return
+    try:
+        content = json.dumps({**source, "created_at": created_at}, ensure_ascii=False, default=str).encode("utf-8")
+        get_storage().put(_source_key(result_id), content, "application/json")
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить источник результата {result_id[:12]}: {str(e)}")
+        return
+    _mark_source_saved(result_id)
+
+def _mark_source_saved(result_id: str) -> None:
+    with _lock:
+        if len(_saved_sources) >= MAX_SAVED_SOURCES:
+            _saved_sources.clear()
+        _saved_sources.add(result_id)
+
+def load_result_source(result_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Источник результата из хранилища (None, если результат никогда не сохранялся).
+    Прочитанный источник уже есть в хранилище: при восстановлении он не перезаписывается
+    и сохраняет время вычисления исходного результата
+    """
+    try:
+        source = json.loads(get_storage().get(_source_key(result_id)))
+        _mark_source_saved(result_id)
+        return source
+    except StorageNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать источник результата {result_id[:12]}: {str(e)}")
+        return None
+
+def get_comparison_table(result_id: str) -> Optional[ComparisonTable]:
+    """
+    Возвращает сохраненный результат (или None, если он удален или не существовал)
+    """
+    with _lock:
+        _cleanup_tables()
+        table = comparison_tables.get(result_id)
+        if table is not None:
+            comparison_tables.move_to_end(result_id)
+            last_access[result_id] = time.time()
+        return table
+
+def get_result_store_stats() -> Dict[str, Any]:
+    """
+    Возвращает статистику хранилища результатов для отладки
+    """
+    with _lock:
+        return {
+            "entries_count": len(comparison_tables),
+            "total_size_mb": current_store_size / (1024 * 1024),
+            "max_size_mb": settings.RESULT_STORE_MAX_SIZE_MB,
+            "entries": [{
+                "result_id": result_id[:12],
+                "size_mb": table.size / (1024 * 1024),
+                "rows": table.counts(),
+                "age_seconds": time.time() - table.created_at
+            } for result_id, table in comparison_tables.items()]
+        }
@@ -0,0 +1,69 @@
+import logging
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.services.result_cache import make_result_key, get_or_compute_result
+
+logger = logging.getLogger("app.services.row_fingerprints")
+
+class RowFingerprints:
+    """
+    Отпечатки строк одной версии файла: идентификатор товара -> хеш значимых колонок.
+
+    Строки с пустым или повторяющимся идентификатором в индекс не входят (unstable_rows):
+    при сравнении версий они всегда считаются изменившимися, чтобы объединение по
+    идентификатору для них работало так же, как для полных файлов
+    """
+
+    def __init__(self, ids: pd.Series, values: pd.DataFrame):
+        ids = ids.reset_index(drop=True)
+        unstable = (ids.isna() | ids.duplicated(keep=False)).to_numpy()
+
+        self.stable_rows = np.flatnonzero(~unstable)
+        self.unstable_rows = np.flatnonzero(unstable)
+        self.ids = pd.Index(ids.to_numpy()[~unstable])
+        self.hashes = pd.util.hash_pandas_object(values.reset_index(drop=True), index=False).to_numpy()[~unstable]
+        self.size = int(self.stable_rows.nbytes + self.unstable_rows.nbytes + self.hashes.nbytes + self.ids.memory_usage(deep=True))
+
+    def __len__(self) -> int:
+        return len(self.stable_rows) + len(self.unstable_rows)
+
+def get_row_fingerprints(content_hash: str, df: pd.DataFrame, id_column: str, value_columns: List[str]) -> RowFingerprints:
+    """
+    Отпечатки строк версии файла (кешируются по хешу содержимого и набору колонок)
+
+    Повторное сравнение с той же версией файла (например, вчерашний прайс-лист
+    против сегодняшнего) берет отпечатки из кеша и не хеширует файл заново
+    """
+    key = make_result_key("row_fingerprints", content_hash, id_column, value_columns)
+    return get_or_compute_result(
+        key,
+        lambda: RowFingerprints(df[id_column], df[value_columns]),
+        size_of=lambda fingerprints: fingerprints.size
+    )
+
+def diff_row_fingerprints(original: RowFingerprints, new: RowFingerprints) -> Dict[str, np.ndarray]:
+    """
+    Строки двух версий файла, отпечатки которых различаются
+
+    Returns:
+        Dict: original_rows — изменившиеся и удаленные строки исходной версии,
+            new_rows — изменившиеся и новые строки новой версии (номера строк по порядку),
+            unchanged — количество товаров с совпадающими отпечатками
+    """
+    # Позиция товара новой версии в индексе исходной (-1 — новый товар)
+    positions = original.ids.get_indexer(new.ids) if len(original.ids) else np.full(len(new.ids), -1)
+    found = positions >= 0
+    same = np.zeros(len(new.ids), dtype=bool)
+    same[found] = original.hashes[positions[found]] == new.hashes[found]
+
+    original_same = np.zeros(len(original.ids), dtype=bool)
+    original_same[positions[same]] = True
+
+    return {
+        "original_rows": np.sort(np.concatenate([original.stable_rows[~original_same], original.unstable_rows])),
+        "new_rows": np.sort(np.concatenate([new.stable_rows[~same], new.unstable_rows])),
+        "unchanged": int(same.sum())
+    }
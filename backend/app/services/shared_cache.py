@@ -0,0 +1,404 @@
+import os
+import io
+import json
+import mmap
+import shutil
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import traceback
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from app.core.config import settings
+from app.services.file_cache import compute_content_hashes
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки между процессами недоступны
+    fcntl = None
+
+logger = logging.getLogger("app.services.shared_cache")
+
+# Общий для всех воркеров хоста кеш файлов на диске.
+# Содержимое каждого файла лежит в отдельном файле данных и читается через mmap,
+# поэтому все процессы используют одни и те же страницы page cache без копирования.
+# Индекс (index.json) хранит метаданные записей и обновляется атомарно под файловой блокировкой.
+
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = "index.lock"
+DATA_DIRNAME = "data"
+
+# Отображения, открытые в текущем процессе (путь к файлу данных -> mmap)
+_open_mappings: Dict[str, mmap.mmap] = {}
+_mappings_lock = threading.Lock()
+
+# Разобранный индекс и mtime файла индекса, по которому он был прочитан
+_index_snapshot: Dict[str, Any] = {"mtime_ns": None, "entries": {}}
+
+class MappedFileReader(io.RawIOBase):
+    """
+    Файловый объект только для чтения поверх mmap или другого буфера.
+    Позволяет pandas читать данные прямо из отображения без полной копии в bytes
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        else:
+            position = len(self._view) + offset
+        self._position = max(0, min(position, len(self._view)))
+        return self._position
+
+    def readinto(self, target) -> int:
+        size = min(len(target), len(self._view) - self._position)
+        target[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+def is_shared_cache_enabled() -> bool:
+    """
+    Проверяет, включен ли общий кеш в настройках
+    """
+    return bool(settings.SHARED_CACHE_ENABLED and settings.SHARED_CACHE_DIR)
+
+def _cache_dir() -> str:
+    return settings.SHARED_CACHE_DIR
+
+def _index_path() -> str:
+    return os.path.join(_cache_dir(), INDEX_FILENAME)
+
+def _data_path(filename: str, content_hash: str) -> str:
+    # Имя файла данных включает хеш содержимого: новая версия пишется в новый файл,
+    # а уже открытые отображения старой версии остаются валидными
+    key = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+    return os.path.join(_cache_dir(), DATA_DIRNAME, f"{key}-{content_hash[:16]}.bin")
+
+def _max_cache_size() -> int:
+    """
+    Лимит размера кеша в байтах: SHARED_CACHE_MAX_SIZE_MB, но не больше половины раздела
+    с каталогом кеша, чтобы запись не упиралась в ENOSPC раньше, чем сработает вытеснение
+    """
+    max_size = settings.SHARED_CACHE_MAX_SIZE_MB * 1024 * 1024
+    try:
+        directory = _cache_dir() if os.path.isdir(_cache_dir()) else os.path.dirname(_cache_dir())
+        return min(max_size, shutil.disk_usage(directory).total // 2)
+    except OSError:
+        return max_size
+
+def _ensure_dirs() -> None:
+    os.makedirs(os.path.join(_cache_dir(), DATA_DIRNAME), exist_ok=True)
+
+@contextmanager
+def _index_lock():
+    """
+    Эксклюзивная блокировка индекса между процессами
+    """
+    _ensure_dirs()
+    with open(os.path.join(_cache_dir(), LOCK_FILENAME), "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _read_index(force: bool = False) -> Dict[str, Any]:
+    """
+    Читает индекс с диска; повторно разбирает JSON только если файл изменился
+    (или при force=True — под блокировкой перед изменением индекса)
+    """
+    path = _index_path()
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    if not force and _index_snapshot["mtime_ns"] == mtime_ns:
+        return _index_snapshot["entries"]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать индекс общего кеша: {str(e)}")
+        return {}
+
+    _index_snapshot["mtime_ns"] = mtime_ns
+    _index_snapshot["entries"] = entries
+    return entries
+
+def _write_index(entries: Dict[str, Any]) -> None:
+    """
+    Атомарно записывает индекс (временный файл + os.replace)
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=_cache_dir(), prefix=".index-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, _index_path())
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _evict(entries: Dict[str, Any], incoming_size: int) -> None:
+    """
+    Удаляет давно не использовавшиеся записи, пока кеш не уложится в лимит размера
+    """
+    max_size = _max_cache_size()
+    total_size = sum(entry["size"] for entry in entries.values()) + incoming_size
+    if total_size <= max_size:
+        return
+
+    def last_access(item):
+        try:
+            return os.stat(item[1]["data_path"]).st_mtime
+        except OSError:
+            return 0
+
+    for filename, entry in sorted(entries.items(), key=last_access):
+        if total_size <= max_size:
+            break
+        entries.pop(filename)
+        total_size -= entry["size"]
+        try:
+            # Уже открытые в других процессах отображения продолжают работать
+            os.remove(entry["data_path"])
+        except OSError:
+            pass
+        logger.info(f"Удален файл из общего кеша (LRU): {filename}, освобождено {entry['size'] / (1024 * 1024):.2f} МБ")
+
+def _register_entry(
+    filename: str,
+    data_path: str,
+    size: int,
+    hashes: Dict[str, str],
+    etag: Optional[str],
+    last_modified: Optional[str]
+) -> None:
+    """
+    Добавляет уже записанный файл данных в индекс (с вытеснением по LRU)
+    """
+    with _index_lock():
+        entries = dict(_read_index(force=True))
+        previous = entries.pop(filename, None)
+        _evict(entries, size)
+        entries[filename] = {
+            "data_path": data_path,
+            "size": size,
+            "timestamp": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            **hashes
+        }
+        _write_index(entries)
+
+    if previous and previous["data_path"] != data_path:
+        try:
+            os.remove(previous["data_path"])
+        except OSError:
+            pass
+
+    logger.info(f"Файл {filename} добавлен в общий кеш, размер: {size / (1024 * 1024):.2f} МБ")
+
+class SharedCacheWriter:
+    """
+    Потоковая запись файла в общий кеш по частям (например, при загрузке блоками).
+
+    Данные пишутся во временный файл рядом с файлами данных, хеши считаются по мере записи.
+    commit() переименовывает файл в итоговый и регистрирует его в индексе, abort() удаляет его
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        _ensure_dirs()
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.join(_cache_dir(), DATA_DIRNAME), suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._max_size = _max_cache_size()
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+
+    def write(self, chunk: bytes) -> None:
+        if self.size + len(chunk) > self._max_size:
+            raise ValueError(f"Файл {self.filename} слишком большой для общего кеша")
+        self._file.write(chunk)
+        self._sha256.update(chunk)
+        self._md5.update(chunk)
+        self.size += len(chunk)
+
+    def reset(self) -> None:
+        """
+        Начинает запись заново (например, если объект в хранилище изменился во время загрузки)
+        """
+        self._file.seek(0)
+        self._file.truncate()
+        self._reset_state()
+
+    def commit(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[mmap.mmap]:
+        """
+        Завершает запись и возвращает отображение файла из общего кеша
+        """
+        self._file.close()
+        hashes = {"content_hash": self._sha256.hexdigest(), "md5": self._md5.hexdigest()}
+        data_path = _data_path(self.filename, hashes["content_hash"])
+        os.replace(self._tmp_path, data_path)
+        _register_entry(self.filename, data_path, self.size, hashes, etag, last_modified)
+        return get_shared_content(self.filename)
+
+    def abort(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+def put_shared_content(
+    filename: str,
+    content: bytes,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> bool:
+    """
+    Сохраняет содержимое файла в общем кеше хоста
+
+    Returns:
+        bool: True, если файл записан в кеш
+    """
+    if not is_shared_cache_enabled() or not content:
+        return False
+
+    size = len(content)
+    if size > _max_cache_size():
+        logger.warning(f"Файл {filename} слишком большой для общего кеша: {size / (1024 * 1024):.2f} МБ")
+        return False
+
+    try:
+        hashes = compute_content_hashes(content)
+        data_path = _data_path(filename, hashes["content_hash"])
+
+        # Такая версия файла уже лежит на диске — достаточно обновить индекс
+        if os.path.exists(data_path):
+            _register_entry(filename, data_path, size, hashes, etag, last_modified)
+            return True
+
+        writer = SharedCacheWriter(filename)
+        try:
+            writer.write(content)
+            writer.commit(etag=etag, last_modified=last_modified)
+        except Exception:
+            writer.abort()
+            raise
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при записи файла {filename} в общий кеш: {str(e)}")
+        logger.debug(traceback.format_exc())
+        return False
+
+def get_shared_entry(filename: str) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает метаданные записи общего кеша (размер, хеши, ETag, время записи)
+    """
+    if not is_shared_cache_enabled():
+        return None
+    entry = _read_index().get(filename)
+    if entry and not os.path.exists(entry["data_path"]):
+        return None
+    return entry
+
+def get_shared_content(filename: str) -> Optional[mmap.mmap]:
+    """
+    Возвращает отображение файла из общего кеша (только чтение, без копирования)
+    """
+    entry = get_shared_entry(filename)
+    if not entry:
+        return None
+
+    data_path = entry["data_path"]
+    with _mappings_lock:
+        mapping = _open_mappings.get(data_path)
+        if mapping is None or mapping.closed:
+            try:
+                with open(data_path, "rb") as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось открыть файл общего кеша {data_path}: {str(e)}")
+                return None
+            _open_mappings[data_path] = mapping
+
+            # Отпускаем отображения версий, которых больше нет в индексе.
+            # Явно не закрываем: их могут еще читать другие потоки
+            live_paths = {e["data_path"] for e in _read_index().values()}
+            for stale_path in [p for p in _open_mappings if p not in live_paths]:
+                _open_mappings.pop(stale_path)
+
+    try:
+        # mtime файла данных служит отметкой последнего доступа для LRU
+        os.utime(data_path)
+    except OSError:
+        pass
+
+    logger.info(f"Получен файл из общего кеша: {filename}, размер: {entry['size'] / (1024 * 1024):.2f} МБ")
+    return mapping
+
+def refresh_shared_entry(
+    filename: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> bool:
+    """
+    Продлевает TTL записи общего кеша после успешной ревалидации
+    """
+    if not is_shared_cache_enabled():
+        return False
+
+    with _index_lock():
+        entries = dict(_read_index(force=True))
+        entry = entries.get(filename)
+        if not entry:
+            return False
+        entry = dict(entry, timestamp=time.time())
+        if etag:
+            entry["etag"] = etag
+        if last_modified:
+            entry["last_modified"] = last_modified
+        entries[filename] = entry
+        _write_index(entries)
+    return True
+
+def get_shared_cache_stats() -> Dict[str, Any]:
+    """
+    Возвращает статистику общего кеша для отладки
+    """
+    entries = _read_index() if is_shared_cache_enabled() else {}
+    return {
+        "enabled": is_shared_cache_enabled(),
+        "directory": _cache_dir(),
+        "entries_count": len(entries),
+        "total_size_mb": sum(entry["size"] for entry in entries.values()) / (1024 * 1024),
+        "max_size_mb": _max_cache_size() / (1024 * 1024),
+        "mapped_in_process": len(_open_mappings)
+    }
@@ -0,0 +1,908 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+import traceback
+import mimetypes
+from abc import ABC, abstractmethod
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+
+from app.core.config import settings
+
+# Хранилище импортируют и app.main, и отдельные обработчики Vercel (api/v1/files),
+# поэтому httpx, requests и supabase загружаются при первом обращении к нему
+if TYPE_CHECKING:
+    import httpx
+    from supabase import Client
+
+logger = logging.getLogger("app.services.storage")
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+class StorageError(Exception):
+    """Ошибка при работе с хранилищем файлов"""
+
+class StorageNotFoundError(StorageError):
+    """Объект не найден в хранилище"""
+
+# Клиент Supabase создается лениво, при первом обращении к хранилищу: создание клиента
+# не требует сетевых запросов, а проверка бакета выполняется в фоне (start_readiness_check)
+supabase_client: Optional["Client"] = None
+_supabase_client_lock = threading.Lock()
+
+def init_supabase_client() -> Optional["Client"]:
+    """
+    Возвращает клиент Supabase, создавая его при первом вызове (без сетевых запросов)
+    
+    Returns:
+        Optional[Client]: Клиент Supabase или None в случае ошибки
+    """
+    global supabase_client
+    
+    if supabase_client:
+        return supabase_client
+        
+    if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+        logger.error("Не указаны SUPABASE_URL или SUPABASE_KEY")
+        return None
+        
+    with _supabase_client_lock:
+        if supabase_client:
+            return supabase_client
+
+        try:
+            from supabase import create_client
+
+            url = settings.SUPABASE_URL
+            key = settings.SUPABASE_KEY
+            
+            logger.info(f"Инициализация Supabase клиента: URL={url}, Bucket={settings.SUPABASE_BUCKET}")
+            logger.info(f"Используемый ключ API: {key[:10]}...{key[-5:]} (скрыт для безопасности)")
+            
+            # Создаем клиент с обычным ключом для основных операций
+            supabase_client = create_client(url, key)
+            return supabase_client
+        except Exception as e:
+            logger.error(f"Ошибка при инициализации Supabase клиента: {str(e)}")
+            logger.error(f"Полная ошибка: {traceback.format_exc()}")
+            return None
+
+def verify_supabase_bucket() -> bool:
+    """
+    Проверяет наличие бакета (и создает его при наличии service_role ключа) и доступ к папке файлов
+    
+    Returns:
+        bool: True, если бакет найден или создан
+    """
+    client = init_supabase_client()
+    if not client:
+        return False
+
+    url = settings.SUPABASE_URL
+    bucket_name = settings.SUPABASE_BUCKET
+    folder_name = settings.SUPABASE_FOLDER
+    service_key = settings.SUPABASE_SERVICE_KEY
+    bucket_exists = False
+
+    # Если есть service_role ключ, используем его для проверки бакетов
+    if service_key:
+        import requests
+
+        logger.info("Используем service_role ключ для проверки бакетов")
+        # Формируем URL для запроса к Supabase Storage API
+        storage_url = f"{url}/storage/v1/bucket"
+        
+        # Заголовки для запроса с service_role ключом
+        headers = {
+            "Content-Type": "application/json",
+            "apikey": service_key,
+            "Authorization": f"Bearer {service_key}"
+        }
+        
+        # Получаем список бакетов
+        response = requests.get(storage_url, headers=headers, timeout=10)
+        if response.status_code == 200:
+            buckets = response.json()
+            logger.info(f"Найдены бакеты: {[b['name'] for b in buckets]}")
+            bucket_exists = any(b['name'] == bucket_name for b in buckets)
+            
+            # Если бакет не существует, создаем его
+            if not bucket_exists:
+                logger.warning(f"Бакет {bucket_name} не найден, пытаемся создать")
+                
+                # Данные для создания бакета
+                data = {
+                    "id": bucket_name,
+                    "name": bucket_name,
+                    "public": False,
+                    "file_size_limit": 52428800  # 50MB в байтах
+                }
+                
+                # Отправляем запрос на создание бакета
+                create_response = requests.post(storage_url, headers=headers, json=data, timeout=10)
+                
+                if create_response.status_code == 200 or create_response.status_code == 201:
+                    logger.info(f"Бакет {bucket_name} успешно создан")
+                    bucket_exists = True
+                else:
+                    logger.error(f"Ошибка при создании бакета: {create_response.text}")
+        else:
+            logger.error(f"Ошибка при получении списка бакетов: {response.text}")
+    else:
+        buckets = client.storage.list_buckets()
+        bucket_exists = any(b['name'] == bucket_name for b in buckets)
+
+    if not bucket_exists:
+        logger.error(f"Бакет {bucket_name} не найден и не удалось его создать")
+        return False
+
+    logger.info(f"Бакет {bucket_name} найден")
+
+    # Проверка работоспособности Supabase Storage
+    test_path = bucket_name + "/" + folder_name
+    try:
+        # Просто пытаемся получить список файлов
+        client.storage.from_(bucket_name).list(folder_name)
+        logger.info(f"Доступ к папке {test_path} подтвержден")
+    except Exception as e:
+        # Если не получилось, логируем ошибку, но продолжаем работу
+        logger.warning(f"Не удалось проверить доступ к папке {test_path}: {str(e)}")
+
+    return True
+
+# Состояние фоновой проверки готовности хранилища:
+# pending -> checking -> ready | failed; skipped, если проверка не нужна (не Supabase)
+storage_readiness: Dict[str, Any] = {
+    "status": "pending",
+    "backend": settings.STORAGE_BACKEND,
+    "error": None,
+    "checked_at": None,
+    "duration": None
+}
+_readiness_thread: Optional[threading.Thread] = None
+
+def _run_readiness_check() -> None:
+    start_time = time.monotonic()
+    storage_readiness["status"] = "checking"
+    try:
+        ready = verify_supabase_bucket()
+        storage_readiness["status"] = "ready" if ready else "failed"
+        storage_readiness["error"] = None if ready else f"Бакет {settings.SUPABASE_BUCKET} недоступен"
+    except Exception as e:
+        logger.warning(f"Не удалось проверить бакет {settings.SUPABASE_BUCKET}: {str(e)}")
+        logger.warning("Это может вызвать проблемы при сохранении файлов")
+        storage_readiness["status"] = "failed"
+        storage_readiness["error"] = str(e)
+    finally:
+        storage_readiness["checked_at"] = time.time()
+        storage_readiness["duration"] = round(time.monotonic() - start_time, 3)
+        logger.info(
+            f"Проверка готовности хранилища завершена: {storage_readiness['status']} "
+            f"за {storage_readiness['duration']:.2f} с"
+        )
+
+def start_readiness_check() -> None:
+    """
+    Запускает проверку бакета Supabase в фоновом потоке (один раз на процесс),
+    чтобы сетевые запросы не задерживали импорт и запуск приложения
+    """
+    global _readiness_thread
+
+    if settings.STORAGE_BACKEND != "supabase":
+        storage_readiness["status"] = "skipped"
+        return
+
+    with _supabase_client_lock:
+        if _readiness_thread is not None:
+            return
+        _readiness_thread = threading.Thread(
+            target=_run_readiness_check,
+            name="storage-readiness",
+            daemon=True
+        )
+        _readiness_thread.start()
+
+def get_storage_readiness() -> Dict[str, Any]:
+    """
+    Состояние проверки готовности хранилища (для эндпоинтов health)
+    """
+    return dict(storage_readiness)
+
+
+class StorageBackend(ABC):
+    """
+    Интерфейс хранилища файлов.
+
+    Объекты адресуются ключом — именем файла (stored_filename); каталог или префикс
+    внутри хранилища определяет сама реализация. Метаданные объекта (head, list)
+    возвращаются в едином формате: name, size, etag, last_modified (timestamp), content_type
+    """
+
+    name = "base"
+
+    def path(self, key: str) -> str:
+        """
+        Путь объекта внутри хранилища
+        """
+        return key
+
+    def local_path(self, key: str) -> Optional[str]:
+        """
+        Путь к файлу объекта на локальном диске, если хранилище его предоставляет
+        (тогда файл можно отдавать клиенту напрямую с диска)
+        """
+        return None
+
+    @abstractmethod
+    def put(self, key: str, content: bytes, content_type: str = DEFAULT_CONTENT_TYPE) -> str:
+        """
+        Сохраняет объект (перезаписывая существующий) и возвращает URL для доступа к нему
+        """
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """
+        Возвращает содержимое объекта
+
+        Raises:
+            StorageNotFoundError: если объекта нет
+        """
+
+    @abstractmethod
+    def get_range(self, key: str, start: int, end: int) -> bytes:
+        """
+        Возвращает диапазон байтов объекта [start, end] (включительно)
+        """
+
+    @abstractmethod
+    def head(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Метаданные объекта без загрузки содержимого (None, если объекта нет)
+        """
+
+    @abstractmethod
+    def list(self, prefix: str = "", limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Страница списка объектов, отсортированного по имени
+        """
+
+    @abstractmethod
+    def delete(self, keys: List[str]) -> List[str]:
+        """
+        Удаляет объекты одним пакетом и возвращает ключи удаленных
+        """
+
+    @abstractmethod
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        """
+        Временная ссылка на скачивание объекта
+        """
+
+    @abstractmethod
+    def signed_upload_url(self, key: str) -> str:
+        """
+        Ссылка для загрузки объекта клиентом напрямую в хранилище
+        """
+
+    @abstractmethod
+    def public_url(self, key: str) -> str:
+        """
+        Постоянная ссылка на объект
+        """
+
+    def download(self, key: str, writer, state: Dict[str, Any], retry_deadline: float) -> bool:
+        """
+        Записывает содержимое объекта в writer (SharedCacheWriter или буфер)
+
+        Args:
+            key: Ключ объекта
+            writer: Приемник данных с методами write/reset и атрибутом size
+            state: Сюда записываются etag, last_modified и размер объекта
+            retry_deadline: Момент (time.monotonic()), после которого повторные попытки не выполняются
+
+        Returns:
+            bool: True, если объект получен полностью
+        """
+        try:
+            content = self.get(key)
+        except StorageNotFoundError:
+            logger.error(f"Объект {key} не найден в хранилище {self.name}")
+            return False
+
+        meta = self.head(key) or {}
+        writer.reset()
+        writer.write(content)
+        state.update({
+            "etag": meta.get("etag"),
+            "last_modified": _http_date(meta.get("last_modified")),
+            "total": len(content)
+        })
+        return True
+
+    def get_if_changed(
+        self,
+        key: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Условное получение объекта для ревалидации кеша
+
+        Returns:
+            None, если объект не изменился, иначе (содержимое, метаданные)
+        """
+        meta = self.head(key)
+        if meta is None:
+            raise StorageNotFoundError(key)
+        if etag and meta.get("etag") and _strip_etag(meta["etag"]) == _strip_etag(etag):
+            return None
+        return self.get(key), {**meta, "last_modified": _http_date(meta.get("last_modified"))}
+
+def _strip_etag(etag: str) -> str:
+    return etag.strip().removeprefix("W/").strip('"')
+
+def _http_date(timestamp: Optional[float]) -> Optional[str]:
+    return formatdate(timestamp, usegmt=True) if timestamp is not None else None
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """
+    Преобразует дату из ответа хранилища (ISO 8601 или HTTP-дата) в timestamp
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def _content_type_for(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or DEFAULT_CONTENT_TYPE
+
+class MemoryStorage(StorageBackend):
+    """
+    Хранилище в памяти процесса: для тестов, бенчмарков и нагрузочного тестирования без сети
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._objects: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, key: str, content: bytes, content_type: str = DEFAULT_CONTENT_TYPE) -> str:
+        with self._lock:
+            self._objects[key] = {
+                "content": bytes(content),
+                "content_type": content_type,
+                "etag": f'"{hashlib.md5(content).hexdigest()}"',
+                "last_modified": time.time()
+            }
+        return self.public_url(key)
+
+    def _entry(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._objects.get(key)
+        if entry is None:
+            raise StorageNotFoundError(key)
+        return entry
+
+    def get(self, key: str) -> bytes:
+        return self._entry(key)["content"]
+
+    def get_range(self, key: str, start: int, end: int) -> bytes:
+        return self._entry(key)["content"][start:end + 1]
+
+    def _meta(self, key: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "name": key,
+            "size": len(entry["content"]),
+            "etag": entry["etag"],
+            "last_modified": entry["last_modified"],
+            "content_type": entry["content_type"]
+        }
+
+    def head(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._objects.get(key)
+        return self._meta(key, entry) if entry else None
+
+    def list(self, prefix: str = "", limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted((key, entry) for key, entry in self._objects.items() if key.startswith(prefix))
+        return [self._meta(key, entry) for key, entry in items[offset:offset + limit]]
+
+    def delete(self, keys: List[str]) -> List[str]:
+        with self._lock:
+            return [key for key in keys if self._objects.pop(key, None) is not None]
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        return self.public_url(key)
+
+    def signed_upload_url(self, key: str) -> str:
+        return f"{settings.API_V1_STR}/files/mock-upload/{key}"
+
+    def public_url(self, key: str) -> str:
+        return f"{settings.API_V1_STR}/files/download/{key}"
+
+class LocalStorage(StorageBackend):
+    """
+    Хранилище в каталоге на локальном диске (по умолчанию UPLOADS_DIR).
+    Файлы отдаются через /files/download, поэтому URL объектов указывают на API
+    """
+
+    name = "local"
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or settings.UPLOADS_DIR
+
+    def _path(self, key: str) -> str:
+        # Ключ не должен выводить за пределы каталога хранилища
+        if os.path.basename(key) != key or key in ("", ".", ".."):
+            raise StorageError(f"Недопустимое имя объекта: {key}")
+        return os.path.join(self.root, key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        try:
+            path = self._path(key)
+        except StorageError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def put(self, key: str, content: bytes, content_type: str = DEFAULT_CONTENT_TYPE) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        logger.info(f"Файл сохранен локально: {path}")
+        return self.public_url(key)
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise StorageNotFoundError(key)
+
+    def get_range(self, key: str, start: int, end: int) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                f.seek(start)
+                return f.read(end - start + 1)
+        except FileNotFoundError:
+            raise StorageNotFoundError(key)
+
+    def _meta(self, key: str, stat: os.stat_result) -> Dict[str, Any]:
+        return {
+            "name": key,
+            "size": stat.st_size,
+            "etag": f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            "last_modified": stat.st_mtime,
+            "content_type": _content_type_for(key)
+        }
+
+    def head(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._meta(key, os.stat(self._path(key)))
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str = "", limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.root):
+            return []
+        with os.scandir(self.root) as it:
+            entries = sorted(
+                (entry for entry in it if entry.is_file() and entry.name.startswith(prefix) and not entry.name.endswith(".tmp")),
+                key=lambda entry: entry.name
+            )
+        return [self._meta(entry.name, entry.stat()) for entry in entries[offset:offset + limit]]
+
+    def delete(self, keys: List[str]) -> List[str]:
+        deleted = []
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+                deleted.append(key)
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        return self.public_url(key)
+
+    def signed_upload_url(self, key: str) -> str:
+        return f"{settings.API_V1_STR}/files/mock-upload/{key}"
+
+    def public_url(self, key: str) -> str:
+        return f"{settings.API_V1_STR}/files/download/{key}"
+
+# Ответы хранилища, после которых повторять запрос бессмысленно
+NON_RETRYABLE_STATUSES = {400, 401, 403, 404}
+
+def _parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Разбирает Content-Range ('bytes 0-99/1234' или 'bytes */1234')
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: начало диапазона и полный размер объекта
+    """
+    if not value or not value.startswith("bytes "):
+        return None, None
+    byte_range, _, total = value[6:].partition("/")
+    start = byte_range.partition("-")[0]
+    return (
+        int(start) if start.isdigit() else None,
+        int(total) if total.isdigit() else None
+    )
+
+class SupabaseStorage(StorageBackend):
+    """
+    Supabase Storage.
+
+    Управляющие операции (загрузка, список, удаление, подписанные ссылки) выполняются через
+    клиент Supabase, чтение — прямыми HTTP-запросами к Storage API через общий пул соединений,
+    что позволяет запрашивать диапазоны байтов и использовать условные запросы
+    """
+
+    name = "supabase"
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        bucket: Optional[str] = None,
+        folder: Optional[str] = None
+    ):
+        self.url = url or settings.SUPABASE_URL
+        self.bucket = bucket or settings.SUPABASE_BUCKET
+        self.folder = settings.SUPABASE_FOLDER if folder is None else folder
+        self._http_client: Optional["httpx.Client"] = None
+        self._http_client_lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        """
+        Путь объекта внутри бакета
+        """
+        return f"{self.folder}/{key}" if self.folder else key
+
+    def _bucket(self):
+        client = init_supabase_client()
+        if not client:
+            raise StorageError("Не удалось инициализировать клиент Supabase")
+        return client.storage.from_(self.bucket)
+
+    def _http(self) -> "httpx.Client":
+        with self._http_client_lock:
+            if self._http_client is None:
+                import httpx
+
+                self._http_client = httpx.Client(
+                    timeout=20.0,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+                )
+        return self._http_client
+
+    def auth_headers(self) -> Dict[str, str]:
+        """
+        Заголовки авторизации для прямых HTTP-запросов к Storage API
+        """
+        key = settings.SUPABASE_SERVICE_KEY or settings.SUPABASE_KEY
+        return {
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        }
+
+    def object_url(self, key: str) -> str:
+        """
+        URL объекта в Storage API (авторизованный доступ)
+        """
+        return f"{self.url}/storage/v1/object/{self.bucket}/{self.path(key)}"
+
+    def put(self, key: str, content: bytes, content_type: str = DEFAULT_CONTENT_TYPE) -> str:
+        self._bucket().upload(self.path(key), content, {"content-type": content_type, "x-upsert": "true"})
+        return self.public_url(key)
+
+    def _get(self, key: str, headers: Optional[Dict[str, str]] = None) -> "httpx.Response":
+        response = self._http().get(self.object_url(key), headers={**self.auth_headers(), **(headers or {})})
+        if response.status_code in (400, 404):
+            raise StorageNotFoundError(key)
+        if response.status_code >= 400:
+            raise StorageError(f"Ошибка Supabase Storage для {key}: {response.status_code} {response.text[:200]}")
+        return response
+
+    def get(self, key: str) -> bytes:
+        return self._get(key).content
+
+    def get_range(self, key: str, start: int, end: int) -> bytes:
+        response = self._get(key, {"Range": f"bytes={start}-{end}"})
+        if response.status_code == 200:
+            # Диапазоны не поддерживаются — вырезаем из полного ответа
+            return response.content[start:end + 1]
+        return response.content
+
+    def head(self, key: str) -> Optional[Dict[str, Any]]:
+        response = self._http().head(self.object_url(key), headers=self.auth_headers())
+        if response.status_code in (400, 404):
+            return None
+        if response.status_code >= 400:
+            raise StorageError(f"Ошибка Supabase Storage для {key}: {response.status_code}")
+        size = response.headers.get("Content-Length")
+        return {
+            "name": key,
+            "size": int(size) if size and size.isdigit() else None,
+            "etag": response.headers.get("ETag"),
+            "last_modified": parse_timestamp(response.headers.get("Last-Modified")),
+            "content_type": response.headers.get("Content-Type")
+        }
+
+    def list(self, prefix: str = "", limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        options = {"limit": limit, "offset": offset, "sortBy": {"column": "name", "order": "asc"}}
+        if prefix:
+            options["search"] = prefix
+        items = self._bucket().list(self.folder, options)
+        result = []
+        for item in items:
+            metadata = item.get("metadata") or {}
+            # Элементы без метаданных — вложенные папки
+            if not metadata:
+                continue
+            result.append({
+                "name": item.get("name"),
+                "size": metadata.get("size"),
+                "etag": metadata.get("eTag"),
+                "last_modified": parse_timestamp(metadata.get("lastModified") or item.get("updated_at") or item.get("created_at")),
+                "content_type": metadata.get("mimetype")
+            })
+        return result
+
+    def delete(self, keys: List[str]) -> List[str]:
+        if not keys:
+            return []
+        removed = self._bucket().remove([self.path(key) for key in keys])
+        if not isinstance(removed, list):
+            logger.warning(f"Supabase вернул неожиданный ответ на удаление {len(keys)} файлов: {removed!r}")
+            return []
+        removed_names = {os.path.basename(item.get("name", "")) for item in removed if isinstance(item, dict)}
+        deleted = [key for key in keys if key in removed_names]
+        if len(deleted) < len(keys):
+            missing = [key for key in keys if key not in removed_names]
+            logger.warning(f"Supabase не подтвердил удаление {len(missing)} из {len(keys)} файлов: {missing[:10]}")
+        return deleted
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        return self._bucket().create_signed_url(self.path(key), expires_in)["signedURL"]
+
+    def signed_upload_url(self, key: str) -> str:
+        return self._bucket().create_signed_upload_url(self.path(key))["signed_url"]
+
+    def public_url(self, key: str) -> str:
+        return f"{self.url}/storage/v1/object/public/{self.bucket}/{self.path(key)}"
+
+    def download(self, key: str, writer, state: Dict[str, Any], retry_deadline: float) -> bool:
+        """
+        Загрузка блоками с докачкой: сначала через авторизованный Storage API,
+        затем (если у запроса осталось время) через публичный URL
+        """
+        if self._download_ranged(key, self.object_url(key), self.auth_headers(), writer, state, retry_deadline):
+            return True
+        # Второй источник пробуем, только если у запроса еще есть время
+        if retry_deadline - time.monotonic() <= settings.DEADLINE_RESERVE_SECONDS:
+            return False
+        logger.info(f"Попытка получения файла через публичный URL: {key}")
+        return self._download_ranged(key, self.public_url(key), {}, writer, state, retry_deadline)
+
+    def get_if_changed(
+        self,
+        key: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Условный GET с If-None-Match и If-Modified-Since
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        response = self._get(key, headers)
+        if response.status_code == 304:
+            return None
+        return response.content, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+
+    def _download_ranged(
+        self,
+        key: str,
+        url: str,
+        headers: Dict[str, str],
+        writer,
+        state: Dict[str, Any],
+        retry_deadline: float
+    ) -> bool:
+        """
+        Загружает объект блоками по DOWNLOAD_CHUNK_SIZE байт с докачкой и повторами.
+
+        Каждый блок запрашивается с Range от текущего размера записанных данных, поэтому после
+        обрыва соединения загрузка продолжается с того же места. If-Range с ETag гарантирует, что
+        блоки относятся к одной версии объекта: если объект изменился, сервер отдает его целиком (200),
+        и запись начинается заново. Ошибки сети, 5xx и ответы, которые не продолжают записанные
+        данные (206 без Content-Range, блок не с той позиции, 416), повторяются с экспоненциальной
+        задержкой (с джиттером), пока не исчерпан общий бюджет retry_deadline (time.monotonic()).
+
+        Args:
+            key: Ключ объекта (для логов)
+            url: URL объекта
+            headers: Заголовки авторизации
+            writer: Приемник блоков (SharedCacheWriter или буфер в памяти)
+            state: ETag, Last-Modified и полный размер объекта, общие для всех попыток и источников
+            retry_deadline: Момент, после которого новые попытки не начинаются
+
+        Returns:
+            bool: True, если объект загружен полностью
+        """
+        import httpx
+
+        chunk_size = settings.DOWNLOAD_CHUNK_SIZE
+        client = self._http()
+        attempt = 0
+        # Сбрасывается, если 206 пришел без Content-Range (его срезал прокси или CDN):
+        # тогда объект запрашивается обычным GET целиком
+        ranged = True
+
+        while True:
+            total = state.get("total")
+            if total is not None and writer.size >= total:
+                return True
+
+            start = writer.size
+            request_headers = dict(headers)
+            if ranged:
+                request_headers["Range"] = f"bytes={start}-{start + chunk_size - 1}"
+                if start > 0 and state.get("etag"):
+                    request_headers["If-Range"] = state["etag"]
+
+            remaining = retry_deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Бюджет на загрузку файла {key} исчерпан, получено {start} байт")
+                return False
+
+            error = None
+            try:
+                with client.stream("GET", url, headers=request_headers, timeout=min(20.0, max(remaining, 1.0))) as response:
+                    status = response.status_code
+
+                    if status == 206:
+                        range_start, total = _parse_content_range(response.headers.get("Content-Range"))
+                        etag = response.headers.get("ETag")
+                        if range_start is None and start == 0 and ranged:
+                            logger.warning(f"Хранилище вернуло 206 без Content-Range для {key}, запрашиваем объект целиком")
+                            ranged = False
+                            continue
+                        if range_start is None:
+                            # Без Content-Range нельзя понять, какие байты пришли: попытка считается неудачной
+                            error = "206 без корректного Content-Range"
+                        elif range_start != start or (state.get("etag") and etag and etag != state["etag"]):
+                            # Блок не продолжает уже записанные данные — начинаем заново (с паузой,
+                            # как после ошибки, чтобы не зациклиться на некорректных ответах)
+                            logger.warning(f"Объект {key} изменился во время загрузки, загрузка начата заново")
+                            writer.reset()
+                            state.clear()
+                            error = f"блок с позиции {range_start} вместо {start}"
+                        else:
+                            state.update({
+                                "etag": etag or state.get("etag"),
+                                "last_modified": response.headers.get("Last-Modified") or state.get("last_modified"),
+                                "total": total
+                            })
+                            received = 0
+                            for chunk in response.iter_bytes():
+                                writer.write(chunk)
+                                received += len(chunk)
+                            if total is None and received < chunk_size:
+                                # Размер объекта неизвестен: короткий блок означает конец
+                                state["total"] = writer.size
+
+                    elif status == 200:
+                        # Range не поддерживается или объект изменился (If-Range) — пишем целиком
+                        if writer.size:
+                            logger.info(f"Сервер вернул объект {key} целиком, загрузка начата заново")
+                            writer.reset()
+                        state.update({
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified")
+                        })
+                        for chunk in response.iter_bytes():
+                            writer.write(chunk)
+                        state["total"] = writer.size
+                        return True
+
+                    elif status == 416:
+                        # Запрошен диапазон за концом объекта: либо все уже получено, либо объект уменьшился
+                        _, total = _parse_content_range(response.headers.get("Content-Range"))
+                        if total is not None and total == start:
+                            state["total"] = total
+                            return True
+                        writer.reset()
+                        state.clear()
+                        error = f"статус 416 для диапазона с позиции {start}"
+
+                    elif status in NON_RETRYABLE_STATUSES:
+                        response.read()
+                        logger.error(f"Хранилище вернуло {status} для файла {key}: {response.text[:200]}")
+                        return False
+
+                    else:
+                        error = f"статус {status}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {str(e)}"
+
+            if error is None:
+                continue
+
+            if writer.size > start:
+                # Часть блока получена — следующая попытка продолжит с нового места без паузы
+                logger.warning(f"Загрузка {key} прервана на {writer.size} байт ({error}), продолжаем")
+                attempt = 0
+                continue
+
+            attempt += 1
+            delay = min(settings.DOWNLOAD_MAX_BACKOFF, 0.1 * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            if time.monotonic() + delay >= retry_deadline:
+                logger.error(f"Не удалось загрузить файл {key}: {error}, бюджет повторов исчерпан")
+                return False
+
+            logger.warning(f"Ошибка загрузки {key} ({error}), попытка {attempt}, повтор через {delay:.2f}с")
+            time.sleep(delay)
+
+# Хранилище, выбранное настройкой STORAGE_BACKEND
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+def create_storage(backend: Optional[str] = None, folder: Optional[str] = None) -> StorageBackend:
+    """
+    Создает хранилище по имени: supabase, local или memory.
+    Если Supabase не настроен, используется локальное хранилище.
+    folder — папка в бакете Supabase вместо settings.SUPABASE_FOLDER
+    """
+    backend = (backend or settings.STORAGE_BACKEND).lower()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "local":
+        return LocalStorage()
+    if backend == "supabase":
+        if settings.SUPABASE_URL and settings.SUPABASE_KEY:
+            return SupabaseStorage(folder=folder)
+        logger.warning("Настройки для Supabase не найдены, используется локальное хранилище")
+        return LocalStorage()
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
+
+def get_storage() -> StorageBackend:
+    """
+    Возвращает хранилище приложения (создается при первом обращении)
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+            logger.info(f"Используется хранилище: {_storage.name}")
+    return _storage
+
+def set_storage(storage: Optional[StorageBackend]) -> None:
+    """
+    Подменяет хранилище приложения (например, MemoryStorage для бенчмарков)
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
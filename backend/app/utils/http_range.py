@@ -0,0 +1,176 @@
+import os
+import logging
+from email.utils import formatdate
+from typing import BinaryIO, Dict, Optional, Tuple, Iterator
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger("app.utils.http_range")
+
+# Размер блока, которым отдаем файл клиенту
+STREAM_CHUNK_SIZE = 256 * 1024
+
+class RangeNotSatisfiable(Exception):
+    """Запрошенный диапазон байтов выходит за пределы файла"""
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок Range (одиночный диапазон байтов).
+
+    Returns:
+        Optional[Tuple[int, int]]: (start, end) включительно или None, если диапазон не запрошен
+        или не поддерживается (несколько диапазонов) — тогда отдается весь файл
+
+    Raises:
+        RangeNotSatisfiable: если диапазон не пересекается с файлом
+    """
+    if not range_header or not range_header.strip().lower().startswith("bytes="):
+        return None
+
+    ranges = range_header.strip()[6:].split(",")
+    if len(ranges) != 1:
+        # Несколько диапазонов (multipart/byteranges) не поддерживаем — отдаем файл целиком
+        return None
+
+    start_str, _, end_str = ranges[0].strip().partition("-")
+    try:
+        if not start_str:
+            # Суффиксный диапазон: последние N байт
+            suffix_length = int(end_str)
+            if suffix_length <= 0:
+                raise RangeNotSatisfiable(range_header)
+            return max(0, size - suffix_length), size - 1
+
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(range_header)
+
+    return start, min(end, size - 1)
+
+def _iter_file(f: BinaryIO, start: int, length: int) -> Iterator[bytes]:
+    """
+    Читает диапазон уже открытого файла блоками (синхронный итератор, Starlette выполняет его в пуле потоков)
+    """
+    with f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _iter_buffer(buffer, start: int, length: int) -> Iterator[bytes]:
+    """
+    Отдает диапазон буфера (bytes или mmap) блоками без копирования всего содержимого
+    """
+    view = memoryview(buffer)
+    end = start + length
+    for offset in range(start, end, STREAM_CHUNK_SIZE):
+        yield bytes(view[offset:min(offset + STREAM_CHUNK_SIZE, end)])
+
+def _close(handle: Optional[BinaryIO]) -> None:
+    if handle is not None:
+        handle.close()
+
+def _etag_matches(header_value: Optional[str], etag: Optional[str]) -> bool:
+    if not header_value or not etag:
+        return False
+    if header_value.strip() == "*":
+        return True
+    candidates = [value.strip().removeprefix("W/") for value in header_value.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+def ranged_response(
+    request: Request,
+    media_type: str,
+    headers: Dict[str, str],
+    path: Optional[str] = None,
+    buffer=None,
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None
+) -> Response:
+    """
+    Ответ с поддержкой Range/If-Range/If-None-Match для файла на диске или буфера в памяти.
+
+    Содержимое отдается потоково блоками STREAM_CHUNK_SIZE: для файла на диске — чтением
+    из page cache, для mmap/bytes — срезами memoryview, без полной копии на каждый запрос.
+
+    Args:
+        request: Входящий запрос (заголовки Range, If-Range, If-None-Match, метод HEAD)
+        media_type: Content-Type ответа
+        headers: Дополнительные заголовки (например, Content-Disposition)
+        path: Путь к файлу на диске
+        buffer: bytes или mmap, если файла на диске нет
+        etag: ETag содержимого (в кавычках)
+        last_modified: Время последнего изменения (timestamp)
+
+    Raises:
+        FileNotFoundError: если файла path уже нет. Файл открывается до ответа, поэтому
+            удаление после этого момента отдаче не мешает
+    """
+    handle = None
+    if path is not None:
+        handle = open(path, "rb")
+        stat = os.fstat(handle.fileno())
+        size = stat.st_size
+        if last_modified is None:
+            last_modified = stat.st_mtime
+        if etag is None:
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    else:
+        size = len(buffer)
+
+    response_headers = {
+        **headers,
+        "Accept-Ranges": "bytes",
+        "Access-Control-Expose-Headers": "Content-Disposition, Content-Range, Accept-Ranges, ETag"
+    }
+    if etag:
+        response_headers["ETag"] = etag
+    if last_modified is not None:
+        response_headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+    # Условный запрос: у клиента уже актуальная версия
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        _close(handle)
+        return Response(status_code=304, headers=response_headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # If-Range: диапазон отдаем только если версия у клиента совпадает с нашей
+    if not if_range or if_range == etag or if_range == response_headers.get("Last-Modified"):
+        try:
+            byte_range = parse_range_header(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            logger.warning(f"Запрошен недопустимый диапазон: {request.headers.get('range')}, размер файла: {size}")
+            _close(handle)
+            return Response(status_code=416, headers={**response_headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        start, end = 0, size - 1
+        status_code = 200
+
+    length = end - start + 1
+    response_headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        _close(handle)
+        return Response(status_code=status_code, headers=response_headers, media_type=media_type)
+
+    if path is not None:
+        body = _iter_file(handle, start, length)
+    else:
+        body = _iter_buffer(buffer, start, length)
+
+    return StreamingResponse(body, status_code=status_code, headers=response_headers, media_type=media_type)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Бенчмарк холодного старта: время импорта и первого запроса для точек входа приложения.
+
+Каждый замер выполняется в новом процессе интерпретатора (как холодный старт функции
+в Vercel): сначала импортируется модуль точки входа, затем выполняется один запрос.
+Хранилище по умолчанию — в памяти (STORAGE_BACKEND=memory), чтобы сеть не влияла на результат.
+
+С --imports вместо замера точек входа выводится разбор времени импорта модуля
+(`python -X importtime`) по пакетам верхнего уровня и проверяется бюджет: код возврата 1,
+если импорт дольше --budget-ms (IMPORT_BUDGET_MS, по умолчанию 1500 мс).
+
+Точки входа:
+    app.main          backend/app/main.py — GET /api/v1/health через ASGI (без lifespan, как в serverless)
+    backend.index     backend/index.py — handler(event, context) для POST /api/v1/files/upload_url
+    api.index         api/index.py — GET /api/v1/health через BaseHTTPRequestHandler
+    files.upload_url  backend/api/v1/files/upload_url.py — POST с fileName
+    files.register    backend/api/v1/files/register.py — POST с fileInfo загруженного CSV
+
+Пример:
+    cd backend && python scripts/startup_benchmark.py --repeat 5
+    cd backend && python scripts/startup_benchmark.py --target app.main --target files.register
+    cd backend && python scripts/startup_benchmark.py --imports --budget-ms 1500 --top 20
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import importlib.util
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+
+TARGETS = {
+    "app.main": os.path.join(BACKEND_DIR, "app", "main.py"),
+    "backend.index": os.path.join(BACKEND_DIR, "index.py"),
+    "api.index": os.path.join(ROOT_DIR, "api", "index.py"),
+    "files.upload_url": os.path.join(BACKEND_DIR, "api", "v1", "files", "upload_url.py"),
+    "files.register": os.path.join(BACKEND_DIR, "api", "v1", "files", "register.py"),
+}
+
+# Модули, загрузку которых стоит отслеживать на холодном старте
+HEAVY_MODULES = ("pandas", "numpy", "supabase", "httpx", "requests", "chardet", "apscheduler")
+
+# Строка вывода -X importtime: "import time:  self [us] | cumulative | imported package"
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+SAMPLE_FILENAME = "file_1700000000_benchmark.csv"
+SAMPLE_CONTENT = "Артикул;Наименование;Цена\n1001;Товар;100.50\n".encode("utf-8")
+
+class FakeSocket:
+    """
+    Сокет для вызова BaseHTTPRequestHandler без сервера: запрос читается из буфера,
+    ответ накапливается в памяти
+    """
+    def __init__(self, request: bytes):
+        self.request = request
+        self.response = io.BytesIO()
+
+    def makefile(self, mode, *args, **kwargs):
+        return io.BytesIO(self.request) if "r" in mode else self.response
+
+    def sendall(self, data):
+        self.response.write(data)
+
+def _load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def _http_request(method: str, path: str, body: bytes = b"") -> bytes:
+    return (
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+def _call_handler(handler_class, request: bytes) -> int:
+    sock = FakeSocket(request)
+    server = type("Server", (), {"server_name": "localhost", "server_port": 0})()
+    handler_class(sock, ("127.0.0.1", 0), server)
+    status_line = sock.response.getvalue().split(b"\r\n", 1)[0]
+    return int(status_line.split()[1]) if status_line else 0
+
+def _call_asgi(app, method: str, path: str) -> int:
+    import asyncio
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    status = {"request_sent": False}
+
+    async def run():
+        response_complete = asyncio.Event()
+
+        async def receive():
+            # Тело запроса отдается один раз, затем — отключение клиента после ответа
+            if not status["request_sent"]:
+                status["request_sent"] = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                response_complete.set()
+
+        await app(scope, receive, send)
+
+    asyncio.run(run())
+    return status.get("code", 0)
+
+def run_target(target: str) -> dict:
+    """
+    Импорт точки входа и первый запрос (выполняется в дочернем процессе)
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    path = TARGETS[target]
+
+    start = time.perf_counter()
+    if target == "app.main":
+        import app.main as module
+    else:
+        module = _load_module(f"benchmark_{target.replace('.', '_')}", path)
+    import_ms = (time.perf_counter() - start) * 1000
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    if target == "files.register":
+        # Файл кладется в хранилище обработчика до замера: измеряется только обработка запроса
+        module.storage.put(SAMPLE_FILENAME, SAMPLE_CONTENT, "text/csv")
+
+    start = time.perf_counter()
+    if target == "app.main":
+        status = _call_asgi(module.app, "GET", "/api/v1/health")
+    elif target == "backend.index":
+        body = json.dumps({"fileName": "prices.csv", "fileType": "supplier"})
+        status = module.handler({"method": "POST", "path": "/api/v1/files/upload_url", "body": body}, None)["statusCode"]
+    elif target == "api.index":
+        status = _call_handler(module.handler, _http_request("GET", "/api/v1/health"))
+    elif target == "files.upload_url":
+        body = json.dumps({"fileName": "prices.csv", "fileType": "supplier"}).encode()
+        status = _call_handler(module.handler, _http_request("POST", "/api/v1/files/upload_url", body))
+    else:
+        body = json.dumps({"fileInfo": {
+            "stored_filename": SAMPLE_FILENAME,
+            "original_filename": "prices.csv",
+            "file_type": "supplier"
+        }}).encode()
+        status = _call_handler(module.handler, _http_request("POST", "/api/v1/files/register", body))
+    first_request_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "import_ms": import_ms,
+        "first_request_ms": first_request_ms,
+        "status": status,
+        "heavy_modules": loaded
+    }
+
+def measure_imports(module: str, env: dict):
+    """
+    Импортирует модуль в чистом процессе и возвращает строки отчета -X importtime
+    (self_us, cumulative_us, depth, name)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-2000:])
+        raise SystemExit(f"Не удалось импортировать {module}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return rows
+
+def import_report(module: str, budget_ms: float, top: int, env: dict) -> int:
+    """
+    Время импорта модуля по пакетам верхнего уровня и проверка бюджета
+    """
+    rows = measure_imports(module, env)
+    target = next((row for row in rows if row[3] == module), None)
+    total_ms = (target[1] if target else sum(row[0] for row in rows)) / 1000
+
+    # Собственное время модулей, сгруппированное по пакету верхнего уровня
+    packages = defaultdict(int)
+    for self_us, _, _, name in rows:
+        packages[name.split(".")[0]] += self_us
+
+    print(f"Импорт {module}: {total_ms:.1f} мс (бюджет {budget_ms:.0f} мс), модулей: {len(rows)}")
+    print(f"{'пакет':<30} {'мс':>10} {'доля':>7}")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        share = self_us / 1000 / total_ms * 100 if total_ms else 0
+        print(f"{package:<30} {self_us / 1000:>10.1f} {share:>6.1f}%")
+
+    if total_ms > budget_ms:
+        print(f"Бюджет превышен на {total_ms - budget_ms:.1f} мс")
+        return 1
+    return 0
+
+def measure(target: str, env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", target],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-2000:])
+        raise SystemExit(f"Замер {target} завершился с ошибкой")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта точек входа")
+    parser.add_argument("--target", action="append", choices=sorted(TARGETS), help="Точка входа (по умолчанию все)")
+    parser.add_argument("--repeat", type=int, default=3, help="Количество холодных запусков на точку входа")
+    parser.add_argument("--json", action="store_true", help="Вывести результаты в JSON")
+    parser.add_argument("--imports", action="store_true", help="Разбор времени импорта модуля и проверка бюджета")
+    parser.add_argument("--module", default="app.main", help="Модуль для --imports")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("IMPORT_BUDGET_MS", "1500")),
+        help="Допустимое время импорта для --imports, мс"
+    )
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых тяжелых пакетов показать для --imports")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_target(args.child)))
+        return 0
+
+    env = dict(os.environ)
+    env.setdefault("STORAGE_BACKEND", "memory")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+
+    if args.imports:
+        return import_report(args.module, args.budget_ms, args.top, env)
+
+    report = {}
+    for target in args.target or list(TARGETS):
+        runs = [measure(target, env) for _ in range(args.repeat)]
+        report[target] = {
+            "import_ms": statistics.median(run["import_ms"] for run in runs),
+            "first_request_ms": statistics.median(run["first_request_ms"] for run in runs),
+            "status": runs[-1]["status"],
+            "heavy_modules": runs[-1]["heavy_modules"]
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"Медиана по {args.repeat} холодным запускам, хранилище: {env['STORAGE_BACKEND']}")
+    print(f"{'точка входа':<18} {'импорт, мс':>11} {'1-й запрос, мс':>15} {'статус':>7}  тяжелые модули после импорта")
+    for target, row in report.items():
+        print(
+            f"{target:<18} {row['import_ms']:>11.1f} {row['first_request_ms']:>15.1f} {row['status']:>7}  "
+            f"{', '.join(row['heavy_modules']) or '-'}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
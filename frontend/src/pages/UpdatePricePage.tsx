@@ -153,7 +153,8 @@ const UpdatePricePage: React.FC = () => {
       old_price: item.store_price,
       new_price: item.supplier_price,
       supplier_name: item.supplier_name,
-      store_name: item.store_name
+      store_name: item.store_name,
+      store_article: item.store_article
     }));
     
     setIsUpdating(true);
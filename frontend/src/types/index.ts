@@ -46,6 +46,9 @@ export interface ComparisonResult {
   matches_data?: MatchedItem[];
   missing_in_store?: MissingInStoreItem[];
   missing_in_supplier?: MissingInSupplierItem[];
+  // Идентификатор сохраненного результата для постраничного просмотра
+  result_id?: string;
+  matches_count?: number;
 }
 
 /**
@@ -74,6 +77,7 @@ export interface PriceUpdate {
   update_reason?: string; // Причина обновления
   supplier_name?: string; // Название поставщика
   store_name?: string; // Название магазина
+  store_article?: string; // Артикул в файле магазина
 }
 
 /**
@@ -156,6 +160,7 @@ export interface MatchedItem {
   price_diff_percent: number;
   supplier_name?: string;
   store_name?: string;
+  store_article?: string;
 }
 
 export interface MissingInStoreItem {